@@ -1,14 +1,22 @@
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, filedialog, ttk
-import sandbox
+import engine
+import cache
+from highlighter import TkHighlighter
+from uiqueue import UIEventQueue, merge_runs, DRAIN_MS
 import patcher
+import project
+import llm
+import models
+import profiler
 import os
 import time
-import difflib
-import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # --- CONFIGURATION ---
-DEFAULT_RETRIES = 10
+DEFAULT_RETRIES = engine.DEFAULT_RETRIES
+LLM_VARIANTS = engine.LLM_VARIANTS
+LOG_MAX_LINES = 5000
 THEME = {
     "bg": "#1e1e1e", "fg": "#d4d4d4", 
     "input_bg": "#252526", "success": "#4ec9b0", 
@@ -25,8 +33,20 @@ class AutoDebuggerApp:
         self.root.geometry("1400x900")
         self.root.configure(bg=THEME["bg"])
         self.current_file_path = None
+        self.project = None             # Loaded with OPEN PROJECT: the editor holds its entry script
+        self._fixed_project = None
+        # Bounded background work; starting a new run cancels the previous one
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="devforge")
+        self._debug_token = None
+        self._refine_token = None
+        self.ui = UIEventQueue()
+        self._max_cycles = DEFAULT_RETRIES
 
         self.setup_ui()
+        # Load the models in the background so the first LLM fix doesn't wait for it
+        models.get_manager().warm_up(patcher.OLLAMA_URL)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(DRAIN_MS, self.drain_ui)
 
     def setup_ui(self):
         # 1. TOOLBAR
@@ -34,6 +54,7 @@ class AutoDebuggerApp:
         toolbar.pack(fill=tk.X, side=tk.TOP)
         
         tk.Button(toolbar, text="📂 OPEN FILE", command=self.open_file, bg="#444", fg="white", relief=tk.FLAT).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(toolbar, text="📁 OPEN PROJECT", command=self.open_project, bg="#444", fg="white", relief=tk.FLAT).pack(side=tk.LEFT, padx=5, pady=5)
         tk.Button(toolbar, text="💾 SAVE FIXED", command=self.save_file, bg="#444", fg="white", relief=tk.FLAT).pack(side=tk.LEFT, padx=5, pady=5)
         self.status_label = tk.Label(toolbar, text="System Ready", bg="#333333", fg="#aaa", font=("Consolas", 9))
         self.status_label.pack(side=tk.RIGHT, padx=10)
@@ -48,7 +69,7 @@ class AutoDebuggerApp:
         tk.Label(left_frame, text="SOURCE CODE", bg=THEME["bg"], fg=THEME["fg"]).pack(anchor="w")
         self.input_area = scrolledtext.ScrolledText(left_frame, bg=THEME["input_bg"], fg=THEME["fg"], insertbackground="white", font=("Consolas", 10))
         self.input_area.pack(fill=tk.BOTH, expand=True)
-        self.input_area.bind("<KeyRelease>", self.highlight_syntax_event)
+        self.highlighter = TkHighlighter(self.input_area)
 
         # --- RIGHT SIDE (Output + AI Refiner) ---
         right_frame = tk.Frame(main_frame, bg=THEME["bg"])
@@ -117,58 +138,130 @@ class AutoDebuggerApp:
         path = filedialog.askopenfilename(filetypes=[("Python Files", "*.py")])
         if path:
             self.current_file_path = path
+            self.project = self._fixed_project = None
             with open(path, "r") as f: content = f.read()
             self.input_area.delete("1.0", tk.END)
             self.input_area.insert(tk.END, content)
             self.status_label.config(text=f"Loaded: {os.path.basename(path)}")
             self.highlight_syntax()
 
+    def open_project(self):
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        try:
+            proj = project.Project.load(folder)
+        except ValueError:
+            # No obvious entry point: let the user pick the script to run
+            entry = filedialog.askopenfilename(initialdir=folder, filetypes=[("Python Files", "*.py")])
+            if not entry:
+                return
+            try:
+                proj = project.Project.load(folder, entry)
+            except ValueError as e:
+                messagebox.showerror("Project", str(e))
+                return
+        self.project, self._fixed_project = proj, None
+        self.current_file_path = proj.entry_path
+        self.input_area.delete("1.0", tk.END)
+        self.input_area.insert(tk.END, proj.files[proj.entry])
+        self.status_label.config(text=f"Loaded project: {os.path.basename(proj.root)} "
+                                      f"({len(proj.files)} modules, entry {proj.entry})")
+        self.highlight_syntax()
+
     def save_file(self):
+        if self._fixed_project is not None:
+            # The pane shows the fixed project's last patched file, maybe edited since (AI Edit, by hand)
+            proj = self._fixed_project
+            content = self.output_area.get("1.0", tk.END).strip()
+            if content and content != proj.files[proj.focus].strip():
+                proj = self._fixed_project = proj.replace(proj.focus, content)
+            changed = proj.changed()
+            if not changed:
+                messagebox.showinfo("Saved", "Nothing to save: no file was changed.")
+            elif messagebox.askyesno("Save", f"Write {len(changed)} fixed file(s) into {proj.root}?\n\n"
+                                             + "\n".join(changed)):
+                proj.save()
+                messagebox.showinfo("Saved", "Fixed files saved successfully!")
+            return
         content = self.output_area.get("1.0", tk.END)
         path = filedialog.asksaveasfilename(defaultextension=".py", filetypes=[("Python Files", "*.py")])
         if path:
             with open(path, "w") as f: f.write(content)
             messagebox.showinfo("Saved", "Fixed code saved successfully!")
 
-    def highlight_syntax_event(self, event=None):
-        self.highlight_syntax()
-
     def highlight_syntax(self):
-        # Basic Regex Syntax Highlighting
-        content = self.input_area.get("1.0", tk.END)
-        for tag in ["keyword", "string", "comment"]:
-            self.input_area.remove_tags(tag, "1.0", tk.END)
-        
-        keywords = r"\b(def|class|import|from|return|if|else|elif|while|for|try|except|print)\b"
-        self._apply_tag(keywords, "keyword")
-        strings = r"(\".*?\"|\'.*?\')"
-        self._apply_tag(strings, "string")
-        comments = r"(#.*)"
-        self._apply_tag(comments, "comment")
-
-    def _apply_tag(self, pattern, tag):
-        count = tk.IntVar()
-        start = "1.0"
-        while True:
-            pos = self.input_area.search(pattern, start, stopindex=tk.END, count=count, regexp=True)
-            if not pos: break
-            self.input_area.tag_add(tag, pos, f"{pos}+{count.get()}c")
-            start = f"{pos}+{count.get()}c"
+        # Full re-highlight; typing is handled incrementally by TkHighlighter
+        self.highlighter.refresh()
 
+    # --- UI updates: workers post, the main loop applies in batches ---
     def log(self, text, tag="info"):
-        self.log_area.insert(tk.END, text, tag)
-        self.log_area.see(tk.END)
-
-    def generate_diff(self, original, modified):
-        d = difflib.unified_diff(original.splitlines(), modified.splitlines(), lineterm='')
-        return list(d)
+        self.ui.post("log", text=text, tag=tag)
+
+    def show_code(self, code):
+        self.ui.post("code", code=code)
+
+    def set_status(self, text):
+        self.ui.post("status", text=text)
+
+    def set_progress(self, value=None, maximum=None):
+        if maximum is not None: self.ui.post("progress", name="maximum", value=maximum)
+        if value is not None: self.ui.post("progress", name="value", value=value)
+
+    def set_button(self, name, **options):
+        self.ui.post("button", name=name, options=options)
+
+    def log_diff(self, diffs):
+        self.log(">>> DIFF:\n", "info")
+        # One event per run of same-coloured lines rather than per line
+        run, run_tag = [], None
+        for line in diffs:
+            if line.startswith("+"): tag = "diff_add"
+            elif line.startswith("-"): tag = "diff_sub"
+            else: continue
+            if tag != run_tag and run:
+                self.log("".join(run), run_tag)
+                run = []
+            run.append(line + "\n")
+            run_tag = tag
+        if run: self.log("".join(run), run_tag)
+
+    def drain_ui(self):
+        try:
+            ops = self.ui.drain()
+            if ops:
+                with profiler.span("ui.drain", ops=len(ops)):
+                    for kind, data in ops:
+                        self.apply_ui(kind, data)
+        finally:
+            self.root.after(DRAIN_MS, self.drain_ui)
+
+    def apply_ui(self, kind, data):
+        if kind == "log":
+            self.log_area.insert(tk.END, *merge_runs(data))
+            lines = int(self.log_area.index("end-1c").split(".")[0])
+            if lines > LOG_MAX_LINES:
+                # Capped: the oldest lines scroll out instead of growing forever
+                self.log_area.delete("1.0", f"{lines - LOG_MAX_LINES + 1}.0")
+            self.log_area.see(tk.END)
+        elif kind == "code":
+            self.output_area.delete("1.0", tk.END)
+            self.output_area.insert(tk.END, data["code"])
+        elif kind == "status":
+            self.status_label.config(text=data["text"])
+        elif kind == "progress":
+            self.progress[data["name"]] = data["value"]
+        elif kind == "button":
+            getattr(self, data["name"]).config(**data["options"])
+        elif kind == "clear":
+            for name in data["widgets"]:
+                getattr(self, name).delete("1.0", tk.END)
+        elif kind == "call":
+            data["fn"]()
 
     # --- NEW: AI REFINEMENT LOGIC ---
     def start_refinement_thread(self):
-        t = threading.Thread(target=self.run_refinement)
-        t.start()
-
-    def run_refinement(self):
+        # Widgets are read here, on the main thread
         instruction = self.refine_entry.get().strip()
         current_code = self.output_area.get("1.0", tk.END).strip()
         
@@ -178,99 +271,130 @@ class AutoDebuggerApp:
         if not instruction:
             return
 
+        if self._refine_token: self._refine_token.cancel()
+        self._refine_token = llm.CancelToken()
+        self.executor.submit(self.run_refinement, self._refine_token, instruction, current_code)
+
+    def run_refinement(self, token, instruction, current_code):
         # UI Updates
-        self.btn_refine.config(state=tk.DISABLED, text="Thinking...")
-        self.status_label.config(text=f"AI is applying: '{instruction}'...")
+        # Button stays live: a new instruction supersedes this one
+        self.set_button("btn_refine", text="Thinking...")
+        self.set_status(f"AI is applying: '{instruction}'...")
         self.log(f"\n>>> USER INSTRUCTION: {instruction}\n", "ai")
         
-        # Call Patcher
-        new_code, reason = patcher.apply_user_instruction(current_code, instruction)
+        # Call Patcher (streams partial code into the pane as it arrives)
+        with llm.cancel_scope(token):
+            new_code, reason = patcher.apply_user_instruction(
+                current_code, instruction, on_partial=lambda code: token.cancelled or self.show_code(code))
+        if token.cancelled:
+            self.log(f">>> Superseded: {instruction}\n", "info")
+            return
         
         # Show Diff
-        diffs = self.generate_diff(current_code, new_code)
+        diffs = engine.generate_diff(current_code, new_code)
         if diffs:
-            self.log(">>> DIFF:\n", "info")
-            for line in diffs:
-                if line.startswith("+"): self.log(line+"\n", "diff_add")
-                elif line.startswith("-"): self.log(line+"\n", "diff_sub")
+            self.log_diff(diffs)
         else:
             self.log(">>> No changes made by AI.\n", "info")
 
         # Update Code Area
-        self.output_area.delete("1.0", tk.END)
-        self.output_area.insert(tk.END, new_code)
+        self.show_code(new_code)
         
         # Reset UI
-        self.btn_refine.config(state=tk.NORMAL, text="APPLY")
-        self.status_label.config(text="Status: Ready")
-        self.refine_entry.delete(0, tk.END)
+        self.set_button("btn_refine", state=tk.NORMAL, text="APPLY")
+        self.set_status("Status: Ready")
+        self.ui.post("call", fn=lambda: self.refine_entry.delete(0, tk.END))
     # --------------------------------
 
     def start_debugging_thread(self):
-        t = threading.Thread(target=self.run_debugging)
-        t.start()
-
-    def run_debugging(self):
         current_code = self.input_area.get("1.0", tk.END).strip()
         if not current_code: 
             messagebox.showwarning("Empty", "Please enter code first.")
             return
-
-        self.btn_run.config(state=tk.DISABLED, text="⏳ RUNNING...")
         try: max_retries = int(self.retry_spinner.get())
         except: max_retries = 10
-
-        self.log_area.delete("1.0", tk.END)
-        self.output_area.delete("1.0", tk.END)
+        if self.project is not None:
+            # The editor holds the entry script; the other modules come from the project
+            if current_code != self.project.files[self.project.entry].strip():
+                current_code = self.project.replace(self.project.entry, current_code)
+            else:
+                current_code = self.project
+
+        if self._debug_token: self._debug_token.cancel()
+        self._debug_token = llm.CancelToken()
+        self.executor.submit(self.run_debugging, self._debug_token, current_code, max_retries)
+
+    def run_debugging(self, token, current_code, max_retries):
+        # Clicking again while running restarts with the current editor contents
+        self.set_button("btn_run", text="⟳ RESTART")
+
+        self.ui.post("clear", widgets=("log_area", "output_area"))
         self.log(f">>> STARTING ENGINE (Cycles: {max_retries})...\n", "info")
-        
-        temp_filename = "temp_debug_target.py"
-        self.progress["value"] = 0
-        self.progress["maximum"] = max_retries
-        success = False
-
-        for attempt in range(1, max_retries + 1):
-            self.progress["value"] = attempt
-            self.log(f"--- CYCLE {attempt} ---\n", "info")
-            
-            with open(temp_filename, "w") as f: f.write(current_code)
-            result = sandbox.run_code(temp_filename)
-            
-            if result["success"]:
-                self.progress["value"] = max_retries
-                self.log(">>> SUCCESS: Execution completed!\n", "success")
-                if result["output"]: self.log(f"Output:\n{result['output']}\n", "info")
-                self.output_area.delete("1.0", tk.END)
-                self.output_area.insert(tk.END, current_code)
-                self.status_label.config(text="Status: Fixed & Stable")
-                success = True
-                break 
-
-            error_msg = result["error"].strip()
-            short_err = error_msg.splitlines()[-1] if error_msg else "Crash"
-            self.log(f">>> ERROR: {short_err}\n", "error")
-
-            self.status_label.config(text="Status: Analyzing...")
-            new_code, reason = patcher.analyze_and_fix(current_code, error_msg)
-            
-            if new_code.strip() == current_code.strip():
-                new_code += f"\n# [AUTO-LOG] Stuck on: {short_err}"
-            
-            diffs = self.generate_diff(current_code, new_code)
-            if diffs:
-                self.log(f">>> FIX: {reason}\n", "success")
-                self.log(">>> DIFF:\n", "info")
-                for line in diffs:
-                    if line.startswith("+"): self.log(line+"\n", "diff_add")
-                    elif line.startswith("-"): self.log(line+"\n", "diff_sub")
-            
-            current_code = new_code
-            self.output_area.delete("1.0", tk.END)
-            self.output_area.insert(tk.END, current_code)
-        
-        if os.path.exists(temp_filename): os.remove(temp_filename)
-        self.btn_run.config(state=tk.NORMAL, text="▶ START DEBUGGING")
-        if not success: self.status_label.config(text="Status: Stopped (Unresolved)")
+        mark = profiler.now()
+        self.set_progress(value=0, maximum=max_retries)
+
+        # Events from a cancelled run are dropped so they can't mix with the new one
+        result = engine.repair(current_code, max_retries, llm_variants=LLM_VARIANTS, cancel=token,
+                               on_event=lambda kind, **data: token.cancelled or self.on_engine_event(kind, **data))
+        if result["cancelled"]:
+            return
+        if isinstance(result["code"], project.Project):
+            # SAVE writes the pane back into this file, so make sure it's the one shown
+            self._fixed_project = result["code"]
+            self.show_code(self._fixed_project.files[self._fixed_project.focus])
+
+        st = cache.stats()
+        if st: self.log(f">>> Fix cache: {st['hits']} hits / {st['misses']} misses ({st['hit_rate']:.0%})\n", "info")
+        timings = profiler.summary(profiler.spans(mark))
+        if timings: self.log(">>> PROFILE:\n" + profiler.format_summary(timings) + "\n", "info")
+        for model, ms in models.get_manager().stats().items():
+            if ms["calls"]:
+                self.log(f">>> Model {model}: {ms['calls']} calls, {ms['mean_ms']} ms mean, "
+                         f"{ms['errors']} errors, {ms['unusable']} unusable\n", "info")
+        self.set_button("btn_run", state=tk.NORMAL, text="▶ START DEBUGGING")
+        if not result["success"]:
+            self.log(f">>> Search ended ({result['stopped']}): {result['states']} states tried, "
+                     f"{result['pruned']} repeats skipped.\n", "info")
+            self.set_status("Status: Stopped (Unresolved)")
+
+    def on_close(self):
+        for token in (self._debug_token, self._refine_token):
+            if token: token.cancel()
+        self.executor.shutdown(wait=False)
+        self.root.destroy()
+
+    def on_engine_event(self, kind, **data):
+        """
+        Turns engine progress into UI events (runs on the worker thread).
+        """
+        if kind == "cycle":
+            self._max_cycles = data["max_retries"]
+            self.set_progress(value=data["attempt"])
+            self.log(f"--- CYCLE {data['attempt']} ---\n", "info")
+        elif kind == "run":
+            r = data["result"]
+            if r.get("wall_time") is not None:
+                usage = f"    [run: {r['wall_time'] * 1000:.0f} ms wall"
+                if r.get("cpu_time") is not None: usage += f", {r['cpu_time'] * 1000:.0f} ms CPU"
+                if r.get("peak_rss"): usage += f", {r['peak_rss'] / 1048576:.1f} MB peak"
+                if r.get("truncated"): usage += ", output truncated"
+                self.log(usage + "]\n", "info")
+        elif kind == "log":
+            self.log(data["text"], data.get("tag", "info"))
+        elif kind == "status":
+            self.set_status(data["text"])
+        elif kind == "error":
+            self.log(f">>> ERROR: {data['short_err']}\n", "error")
+        elif kind == "fix":
+            self.log(f">>> FIX: {data['reason']}\n", "success")
+            self.log_diff(data["diff"])
+        elif kind in ("code", "partial"):
+            self.show_code(data["code"])
+        elif kind == "success":
+            self.set_progress(value=self._max_cycles)
+            self.log(">>> SUCCESS: Execution completed!\n", "success")
+            if data["output"]: self.log(f"Output:\n{data['output']}\n", "info")
+            self.set_status("Status: Fixed & Stable")
 
 if __name__ == "__main__":
     root = tk.Tk()
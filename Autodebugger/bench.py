@@ -0,0 +1,562 @@
+"""
+Micro-benchmarks for the DevForge pipeline.
+
+    python bench.py sandbox [--cycles N]
+    python bench.py highlight [--sizes 1000,10000,50000]
+    python bench.py ui [--lines 5000]
+    python bench.py diff [--lines 20000]
+    python bench.py models [--calls 20]
+    python bench.py project [--modules 200]
+    python bench.py repair [--repeat N] [--update-baseline]
+"""
+import argparse
+import collections
+import contextlib
+import difflib
+import io
+import random
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+import sandbox
+import diffing
+import highlighter
+import uiqueue
+
+SAMPLE_SCRIPT = '''
+import json, re, collections
+data = {"a": 1, "b": [1, 2, 3]}
+print(json.dumps(data))
+x = 10
+y = 0
+print(x / y)
+'''
+
+def _cycles_per_second(fn, filename, cycles):
+    start = time.perf_counter()
+    for _ in range(cycles):
+        fn(filename)
+    elapsed = time.perf_counter() - start
+    return cycles / elapsed, elapsed
+
+def bench_sandbox(cycles=50):
+    """
+    Cycles/second of the cold interpreter path vs. the warm worker pool,
+    reading the script from disk or receiving it in memory.
+    """
+    fd, path = tempfile.mkstemp(suffix=".py")
+    with os.fdopen(fd, "w") as f:
+        f.write(SAMPLE_SCRIPT)
+
+    try:
+        cold_cps, cold_t = _cycles_per_second(sandbox.run_code_cold, path, cycles)
+        print(f"cold   : {cold_cps:8.1f} cycles/s  ({cold_t:.2f}s for {cycles})")
+
+        if not sandbox.pool_supported():
+            print("warm   : skipped (no fork() on this platform)")
+            return
+
+        pool = sandbox.WorkerPool(size=1)
+        try:
+            pool.run(path)  # Make sure the worker is up before timing
+            warm_cps, warm_t = _cycles_per_second(pool.run, path, cycles)
+            # Source sent with the job: no file, bytecode cached in the worker
+            mem_cps, mem_t = _cycles_per_second(lambda p: pool.run(p, source=SAMPLE_SCRIPT), path, cycles)
+        finally:
+            pool.close()
+        print(f"warm   : {warm_cps:8.1f} cycles/s  ({warm_t:.2f}s for {cycles})")
+        print(f"memory : {mem_cps:8.1f} cycles/s  ({mem_t:.2f}s for {cycles})")
+        print(f"speedup: {warm_cps / cold_cps:8.1f}x")
+    finally:
+        os.remove(path)
+
+HIGHLIGHT_SAMPLE = '''class Account:
+    """Bank account."""
+    def __init__(self, owner, balance=0):
+        self.owner = owner  # who
+        self.balance = balance
+
+    def deposit(self, amount):
+        if amount <= 0:
+            raise ValueError("amount must be positive")
+        self.balance += amount
+        return f"{self.owner}: {self.balance}"
+'''
+
+# The patterns the old full-buffer highlighter ran on every keystroke
+_LEGACY_PATTERNS = [re.compile(p) for p in (
+    r"\b(def|class|import|from|return|if|else|elif|while|for|try|except|print)\b",
+    r"(\".*?\"|\'.*?\')",
+    r"(#.*)",
+)]
+
+def _legacy_highlight(text):
+    # Lower bound for the old approach: the same regex passes, minus Tk overhead
+    return sum(1 for p in _LEGACY_PATTERNS for _ in p.finditer(text))
+
+def bench_highlight(sizes=(1000, 10000, 50000), keystrokes=200):
+    """
+    Per-keystroke latency: incremental re-lex of the edited line vs. a full
+    re-highlight of the buffer.
+    """
+    print(f"{'lines':>7} | {'incremental':>12} | {'full relex':>11} | {'legacy regex':>12}")
+    for n in sizes:
+        reps = n // HIGHLIGHT_SAMPLE.count("\n") + 1
+        lines = (HIGHLIGHT_SAMPLE * reps).split("\n")[:n]
+        h = highlighter.Highlighter()
+        h.reset("\n".join(lines))
+        fetch = lambda lo, hi: lines[lo:hi + 1]
+
+        # Type a character into a line in the middle of the file, N times
+        row = n // 2
+        start = time.perf_counter()
+        for k in range(keystrokes):
+            lines[row] = lines[row] + "x"
+            h.splice(row, 1, 1)
+            h.relex(fetch)
+        incr = (time.perf_counter() - start) / keystrokes
+
+        text = "\n".join(lines)
+        full_reps = max(1, min(keystrokes, 200000 // n))
+        start = time.perf_counter()
+        for _ in range(full_reps):
+            highlighter.Highlighter().reset(text)
+        full = (time.perf_counter() - start) / full_reps
+
+        start = time.perf_counter()
+        for _ in range(full_reps):
+            _legacy_highlight(text)
+        legacy = (time.perf_counter() - start) / full_reps
+
+        print(f"{n:>7} | {incr * 1000:9.3f} ms | {full * 1000:8.1f} ms | {legacy * 1000:9.1f} ms")
+
+def _diff_events(lines):
+    # What a worker posts for a large fix: one log event per diff line
+    q = uiqueue.UIEventQueue()
+    for i in range(lines):
+        q.post("log", text=f"{'+-'[i % 2]}    value_{i} = compute({i})\n", tag=("diff_add", "diff_sub")[i % 2])
+        if i % 50 == 0:
+            q.post("progress", name="value", value=i)
+    return q
+
+def bench_ui(lines=5000):
+    """
+    Main-thread cost of showing a large diff: one Tk insert + see() per line
+    (old) vs. draining the UI event queue in coalesced, time-boxed batches.
+    """
+    q = _diff_events(lines)
+    posted = q.posted
+    start = time.perf_counter()
+    ticks = []
+    while not q.empty():
+        ticks.append(q.drain())
+    drain = time.perf_counter() - start
+    ops = sum(len(t) for t in ticks)
+    print(f"events : {posted} posted -> {ops} ops in {len(ticks)} ticks ({drain * 1000:.1f} ms to coalesce)")
+
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception as e:
+        print(f"tk     : skipped ({e})")
+        return
+    try:
+        text = tk.Text(root)
+        text.pack()
+
+        start = time.perf_counter()
+        for i in range(lines):
+            text.insert(tk.END, f"{'+-'[i % 2]}    value_{i} = compute({i})\n", ("diff_add", "diff_sub")[i % 2])
+            text.see(tk.END)
+        root.update_idletasks()
+        legacy = time.perf_counter() - start
+        text.delete("1.0", tk.END)
+
+        q = _diff_events(lines)
+        worst, start = 0.0, time.perf_counter()
+        while not q.empty():
+            t0 = time.perf_counter()
+            for kind, data in q.drain():
+                if kind == "log":
+                    text.insert(tk.END, *uiqueue.merge_runs(data))
+                    text.see(tk.END)
+            root.update_idletasks()
+            worst = max(worst, time.perf_counter() - t0)
+        batched = time.perf_counter() - start
+    finally:
+        root.destroy()
+    print(f"legacy : {legacy * 1000:8.1f} ms main thread blocked in one go")
+    print(f"batched: {batched * 1000:8.1f} ms total, longest tick {worst * 1000:.1f} ms")
+
+def bench_diff(lines=20000):
+    """
+    Fix-preview diffs: difflib.unified_diff vs. diffing.unified_diff on the
+    edits the pipeline actually produces.
+    """
+    code = "\n".join(f"value_{i} = compute(value_{i - 1}, {i % 7})" for i in range(lines))
+    rows = code.splitlines()
+    shuffled = rows[:]
+    random.Random(0).shuffle(shuffled)
+    cases = [
+        ("unchanged", code),
+        ("rule, 2 lines", code.replace("value_100 =", "value_100: int =").replace(f"value_{lines - 100} =", "value_0 =")),
+        ("rule, every line", code.replace("compute(", "compute_safe(")),
+        ("llm, 1 line", "\n".join(rows[:lines // 3] + ["# fixed"] + rows[lines // 3 + 1:])),
+        ("llm, rewrite", "\n".join(shuffled)),
+    ]
+    print(f"{'edit':<17} | {'difflib':>10} | {'diffing':>10} | {'lines':>13}")
+    for name, modified in cases:
+        start = time.perf_counter()
+        old = list(difflib.unified_diff(code.splitlines(), modified.splitlines(), lineterm=''))
+        t_old = time.perf_counter() - start
+        start = time.perf_counter()
+        new = diffing.unified_diff(code, modified)
+        t_new = time.perf_counter() - start
+        print(f"{name:<17} | {t_old * 1000:7.1f} ms | {t_new * 1000:7.1f} ms | {len(old):>6}/{len(new):<6}")
+
+# ==========================================
+# REPAIR REGRESSION SUITE
+# ==========================================
+# Every .py file in corpus/ is a broken script; a "# expect: <kind>" line
+# says what it exercises. LLM answers come from a local stub server: for a
+# prompt containing "# case: <name>" it returns corpus/fixes/<name>.py, and
+# otherwise echoes the code back (i.e. "no idea").
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+BASELINE_FILE = os.path.join(CORPUS_DIR, "baseline.json")
+
+# Fixes each kind must be solved with: every pattern has to match one of the
+# reasons applied along the solution path, so a case that passes by way of
+# some other rule (e.g. a lucky "Did you mean") doesn't count as solved.
+EXPECTED_FIXES = {
+    "argparse": [r"Made CLI args optional"],
+    "blocking_input": [r"Mocked blocking user inputs"],
+    "init_typo": [r"Fixed constructor typo"],
+    "key_error": [r"Injected key"],
+    "llm": [r"^LLM"],
+    "missing_file": [r"Created mock file"],
+    "missing_module": [r"Removed module"],
+    "multi": [r"Removed module", r"Fixed typo"],
+    "recursion": [r"Increased recursion limit"],
+    "typo": [r"Fixed typo"],
+    "undefined_name": [r"Stubbed function|Defined variable"],
+}
+
+def fixed_as_expected(kind, reasons):
+    reasons = [str(r) for r in reasons]
+    return all(any(re.search(p, r) for r in reasons) for p in EXPECTED_FIXES.get(kind, ()))
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    cases = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(corpus_dir, name)) as f:
+            code = f.read()
+        m = re.search(r"#\s*expect:\s*(\w+)", code)
+        cases.append((name[:-3], m.group(1) if m else "?", code))
+    return cases
+
+def _corpus_reply(fixes_dir):
+    import stub_ollama
+    def reply(payload):
+        m = re.search(r"#\s*case:\s*(\w+)", payload.get("prompt", ""))
+        path = os.path.join(fixes_dir, m.group(1) + ".py") if m else None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                return f"```python\n{f.read().strip()}\n```\n"
+        return stub_ollama.default_reply(payload)
+    return reply
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def run_corpus(corpus_dir=CORPUS_DIR, repeat=1, cycles=None):
+    """
+    Repairs every corpus script with the engine against the stub LLM.
+    Returns {"cases": {name: {...}}, "summary": {...}}.
+    """
+    import cache
+    import engine
+    import llm
+    import patcher
+    import stub_ollama
+
+    cache.CACHE_PATH = "off"  # Measure the pipeline, not the fix cache
+    cycles = cycles or engine.DEFAULT_RETRIES
+    cases = load_corpus(corpus_dir)
+    runs = {name: [] for name, _, _ in cases}
+
+    # Runs happen in disposable workspaces, so nothing lands in the tree
+    with stub_ollama.StubOllama(reply=_corpus_reply(os.path.join(corpus_dir, "fixes"))) as stub:
+        old_url = patcher.OLLAMA_URL
+        patcher.OLLAMA_URL = stub.url
+        llm.configure()  # No extra endpoints: everything goes to the stub
+        try:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                for name, kind, code in cases:
+                    before = len(stub.requests)
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        res = engine.repair(code, cycles, workdir=corpus_dir)
+                    runs[name].append((res, len(stub.requests) - before))
+            wall = time.perf_counter() - started
+        finally:
+            patcher.OLLAMA_URL = old_url
+
+    report = {}
+    for name, kind, _ in cases:
+        rs = runs[name]
+        report[name] = {
+            "kind": kind,
+            "solved": all(r["success"] and fixed_as_expected(kind, r["rules"]) for r, _ in rs),
+            "cycles": max(r["cycles"] for r, _ in rs),
+            "stopped": rs[-1][0]["stopped"],
+            "llm_calls": rs[-1][1],
+            "ms": round(sorted(r["elapsed"] for r, _ in rs)[len(rs) // 2] * 1000, 1),
+            "fixes": rs[-1][0]["rules"],
+        }
+    latencies = [r["elapsed"] * 1000 for rs in runs.values() for r, _ in rs]
+    solved = [c for c in report.values() if c["solved"]]
+    summary = {
+        "cases": len(report),
+        "solved": len(solved),
+        "solve_rate": round(len(solved) / len(report), 3) if report else 0.0,
+        "mean_cycles_to_fix": round(sum(c["cycles"] for c in solved) / len(solved), 2) if solved else 0.0,
+        "total_cycles": sum(c["cycles"] for c in report.values()),
+        "llm_calls": sum(c["llm_calls"] for c in report.values()),
+        "p50_ms": round(_percentile(latencies, 0.5), 1),
+        "p95_ms": round(_percentile(latencies, 0.95), 1),
+        "files_per_s": round(len(latencies) / wall, 2) if wall else 0.0,
+    }
+    return {"cases": report, "summary": summary}
+
+def compare_baseline(current, baseline):
+    """
+    Lines describing differences from the baseline, and whether any of them
+    is a regression (a case no longer solved, or solved in more cycles).
+    """
+    lines, regressed = [], False
+    for name, cur in current["cases"].items():
+        old = baseline["cases"].get(name)
+        if old is None:
+            lines.append(f"  new case      {name}")
+        elif old["solved"] and not cur["solved"]:
+            lines.append(f"  REGRESSION    {name}: no longer solved")
+            regressed = True
+        elif cur["solved"] and not old["solved"]:
+            lines.append(f"  improved      {name}: now solved")
+        elif cur["solved"] and cur["cycles"] > old["cycles"]:
+            lines.append(f"  REGRESSION    {name}: {old['cycles']} -> {cur['cycles']} cycles")
+            regressed = True
+        elif cur["cycles"] < old["cycles"] or cur["llm_calls"] < old["llm_calls"]:
+            lines.append(f"  improved      {name}: {old['cycles']} -> {cur['cycles']} cycles, "
+                         f"{old['llm_calls']} -> {cur['llm_calls']} LLM calls")
+    for key, value in current["summary"].items():
+        old = baseline["summary"].get(key)
+        if old not in (None, value):
+            lines.append(f"  {key:<20}{old} -> {value}")
+    return lines, regressed
+
+def bench_repair(repeat=1, baseline_file=BASELINE_FILE, update=False):
+    """
+    Solve rate, cycles-to-fix, latency and throughput over the corpus,
+    compared with the stored baseline. Returns 1 on regression.
+    """
+    result = run_corpus(repeat=repeat)
+    print(f"{'case':<22}{'kind':<16}{'solved':>7}{'cycles':>8}{'llm':>5}{'ms':>9}  stopped")
+    for name, c in result["cases"].items():
+        print(f"{name:<22}{c['kind']:<16}{'yes' if c['solved'] else 'no':>7}{c['cycles']:>8}"
+              f"{c['llm_calls']:>5}{c['ms']:>9.1f}  {c['stopped']}"
+              + (f" with unexpected fixes {c['fixes']}" if c["stopped"] == "solved" and not c["solved"] else ""))
+    st = result["summary"]
+    print(f"\nsolved {st['solved']}/{st['cases']} ({st['solve_rate']:.0%}), "
+          f"{st['mean_cycles_to_fix']} cycles per fix, {st['llm_calls']} LLM calls")
+    print(f"latency p50 {st['p50_ms']} ms, p95 {st['p95_ms']} ms; {st['files_per_s']} files/s")
+
+    if update:
+        with open(baseline_file, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {baseline_file}")
+        return 0
+    if not os.path.exists(baseline_file):
+        print("No baseline yet (run with --update-baseline).")
+        return 0
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    lines, regressed = compare_baseline(result, baseline)
+    print("\nvs. baseline:" if lines else "\nvs. baseline: no changes")
+    if lines:
+        print("\n".join(lines))
+    return 1 if regressed else 0
+
+# ==========================================
+# MODEL TIERS
+# ==========================================
+# Against the stub: the small model loads and generates faster but only
+# fixes NameErrors; the big one fixes everything.
+def bench_models(calls=20):
+    import llm
+    import models
+    import patcher
+    import stub_ollama
+
+    small, big = models.DEFAULT_TIERS
+    errors = [("print(totl)", "NameError: name 'totl' is not defined", "print(total)"),
+              ("print([1][3])", "IndexError: list index out of range", "print([1][0])")]
+
+    def reply(payload):
+        for code, error, fixed in errors:
+            if code in payload["prompt"]:
+                ok = payload["model"] == big or error.startswith("NameError")
+                return f"```python\n{fixed if ok else code}\n```"
+        return stub_ollama.default_reply(payload)
+
+    with stub_ollama.StubOllama(reply=reply, delay={small: 0.002, big: 0.01},
+                                load_delay={small: 0.2, big: 0.8}) as stub:
+        old_url = patcher.OLLAMA_URL
+        patcher.OLLAMA_URL = stub.url
+        llm.configure()
+        try:
+            print(f"{'setup':<16} | {'first call':>10} | {'mean call':>9} | calls per model")
+            for name, tiers, warm in (("7b, cold", [big], False), ("7b, warm", [big], True),
+                                      ("tiered, warm", None, True)):
+                stub.loaded.clear()
+                manager = models.configure(tiers)
+                if warm:
+                    manager.warm_up(stub.url, block=True)
+                before = len(stub.requests)
+                times = []
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for i in range(calls):
+                        code, error, _ = errors[i % len(errors)]
+                        start = time.perf_counter()
+                        patcher.call_ollama(f"Fix: {error}\n```python\n{code}\n```", code, error_msg=error)
+                        times.append(time.perf_counter() - start)
+                used = collections.Counter(r["payload"]["model"] for r in stub.requests[before:] if r["payload"].get("prompt"))
+                print(f"{name:<16} | {times[0] * 1000:7.1f} ms | {sum(times) / len(times) * 1000:6.1f} ms | "
+                      + ", ".join(f"{m}: {n}" for m, n in sorted(used.items())))
+        finally:
+            patcher.OLLAMA_URL = old_url
+            models.configure()
+
+def _write_project(root, modules):
+    """
+    A package of `modules` modules importing each other as a binary tree,
+    run by main.py. The last module raises a NameError when imported.
+    """
+    pkg = os.path.join(root, "app")
+    os.makedirs(pkg)
+    open(os.path.join(pkg, "__init__.py"), "w").close()
+    body = "".join(f"\ndef helper{j}(x):\n    return [x * {j} for _ in range(3)]\n" for j in range(20))
+    for i in range(modules):
+        deps = [f"m{c}" for c in (2 * i + 1, 2 * i + 2) if c < modules]
+        text = (f"from . import {', '.join(deps)}\n" if deps else "") + body
+        if i == modules - 1:
+            text += "\ndef total(x):\n    return x\n\nVALUE = totl(3)\n"
+        with open(os.path.join(pkg, f"m{i}.py"), "w") as f:
+            f.write(text)
+    with open(os.path.join(root, "main.py"), "w") as f:
+        f.write("from app import m0\nprint(m0.helper1(2))\n")
+
+def bench_project(modules=200, runs=20):
+    """
+    Re-runs of a multi-file project after a one-file fix: only the changed
+    module is sent to the warm worker and compiled, vs. a fresh interpreter
+    compiling everything. Then a full repair of the bug in the deepest module.
+    """
+    import cache
+    import engine
+    import project
+
+    if not sandbox.pool_supported():
+        print("skipped (no fork() on this platform)")
+        return
+    cache.CACHE_PATH = "off"
+    with tempfile.TemporaryDirectory() as root:
+        _write_project(root, modules)
+        proj = project.Project.load(root)
+        leaf = f"app/m{modules - 1}.py"
+        fixed = proj.replace(leaf, proj.files[leaf].replace("totl(3)", "total(3)"))
+        # Each run changes the leaf, like a search trying fixes for it
+        variants = [fixed.replace(leaf, fixed.files[leaf] + f"\nRUN = {i}\n") for i in range(2 * runs)]
+        total_kb = sum(len(m["source"]) for m in fixed.modules().values()) / 1024
+
+        pool = sandbox.WorkerPool(size=1)
+        def run(fn, p):
+            start = time.perf_counter()
+            res = fn(p.entry_path, source=p.files[p.entry], modules=p.modules(), path=[p.base])
+            assert res["success"], res["error"]
+            return (time.perf_counter() - start) * 1000
+        try:
+            cold = [run(sandbox.run_code_cold, p) for p in variants[:runs // 4 or 1]]
+            first = run(pool.run, fixed)
+            incremental = [run(pool.run, p) for p in variants[runs:]]
+        finally:
+            pool.close()
+
+        print(f"{len(fixed.modules())} modules, {total_kb:.0f} KiB of source")
+        print(f"cold interpreter    : {statistics.median(cold):7.1f} ms  (everything compiled per run)")
+        print(f"warm, first run     : {first:7.1f} ms  (all sources sent and compiled)")
+        print(f"warm, re-run        : {statistics.median(incremental):7.1f} ms  (one module sent and compiled, "
+              f"median of {runs})")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = engine.repair(proj, 3)
+        print(f"repair              : {result['elapsed'] * 1000:7.1f} ms, {result['cycles']} cycle(s), "
+              f"changed {', '.join(result['code'].changed())}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DevForge benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("sandbox", help="cold interpreter vs. warm worker pool")
+    p.add_argument("--cycles", type=int, default=50)
+
+    p = sub.add_parser("highlight", help="per-keystroke editor highlighting latency")
+    p.add_argument("--sizes", default="1000,10000,50000")
+
+    p = sub.add_parser("ui", help="main-thread cost of large diffs in the log pane")
+    p.add_argument("--lines", type=int, default=5000)
+
+    p = sub.add_parser("diff", help="fix-preview diff latency on large files")
+    p.add_argument("--lines", type=int, default=20000)
+
+    p = sub.add_parser("models", help="model warm-up and small/large tiering against a stub LLM")
+    p.add_argument("--calls", type=int, default=20)
+
+    p = sub.add_parser("project", help="incremental re-runs and repair of a multi-file project")
+    p.add_argument("--modules", type=int, default=200)
+
+    p = sub.add_parser("repair", help="regression suite: repair the corpus against a stub LLM")
+    p.add_argument("--repeat", type=int, default=1, help="runs per case (latency is the median)")
+    p.add_argument("--baseline", default=BASELINE_FILE)
+    p.add_argument("--update-baseline", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.bench == "sandbox":
+        bench_sandbox(args.cycles)
+    elif args.bench == "highlight":
+        bench_highlight([int(n) for n in args.sizes.split(",")])
+    elif args.bench == "ui":
+        bench_ui(args.lines)
+    elif args.bench == "diff":
+        bench_diff(args.lines)
+    elif args.bench == "models":
+        bench_models(args.calls)
+    elif args.bench == "project":
+        bench_project(args.modules)
+    elif args.bench == "repair":
+        return bench_repair(args.repeat, args.baseline, args.update_baseline)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Content-addressed fix cache.
+
+Maps hash(normalized code, normalized traceback) -> ranked candidate fixes,
+so a repeat of a known (snippet, error) pair skips both the rule cascade and
+the LLM. Backed by SQLite with LRU eviction by entry count and total size.
+Hit/miss counters live in the database too, so CLI worker processes add up.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.environ.get("DEVFORGE_CACHE", os.path.join(os.path.expanduser("~"), ".devforge", "fix_cache.sqlite3"))
+MAX_ENTRIES = 5000
+MAX_BYTES = 64 * 1024 * 1024
+# Bump when the stored format or the meaning of a key changes
+CACHE_VERSION = 2
+
+# Results that must not be replayed: side effects (files created on disk),
+# transient failures (LLM down, truncated output) and rules whose answer
+# depends on the filesystem rather than the code and error (a module next
+# to the script is the user's own, not a missing package).
+UNCACHEABLE_PREFIXES = ("Environment: Created mock file", "Error:", "Safety:", "Rule: Removed module")
+
+_PATH_RE = re.compile(r'File "[^"]*"')
+_LINE_RE = re.compile(r"\bline \d+")
+_ADDR_RE = re.compile(r"\b0x[0-9a-fA-F]+\b")
+_TEMP_RE = re.compile(r"temp_debug_target\w*\.py")
+
+def normalize_error(error_msg):
+    """
+    Strips everything that changes between identical failures:
+    file paths, line numbers and memory addresses.
+    """
+    text = _PATH_RE.sub('File "<file>"', error_msg)
+    text = _TEMP_RE.sub("<file>", text)
+    text = _LINE_RE.sub("line <n>", text)
+    text = _ADDR_RE.sub("0x<addr>", text)
+    return "\n".join(l.rstrip() for l in text.strip().splitlines())
+
+def normalize_code(code):
+    return "\n".join(l.rstrip() for l in code.replace("\r\n", "\n").strip().splitlines())
+
+def make_key(code, error_msg, variant=""):
+    """
+    `variant` holds whatever else decides the answer (LLM variants asked
+    for, the rule-set fingerprint, project layout).
+    """
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}\0".encode())
+    h.update(normalize_code(code).encode("utf-8", "replace"))
+    h.update(b"\0")
+    h.update(normalize_error(error_msg).encode("utf-8", "replace"))
+    h.update(b"\0")
+    h.update(str(variant).encode())
+    return h.hexdigest()
+
+class FixCache:
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.path = path = path or CACHE_PATH   # Read now: callers may change CACHE_PATH first
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fixes ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS fixes_lru ON fixes(last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _bump(self, name, n=1):
+        self._db.execute(
+            "INSERT INTO counters(name, value) VALUES(?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, n))
+
+    def get(self, key):
+        """
+        Returns the cached candidate list [(code, reason), ...] or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM fixes WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._bump("misses")
+                return None
+            self._db.execute("UPDATE fixes SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._bump("hits")
+        return [tuple(c) for c in json.loads(row[0])]
+
+    def put(self, key, candidates, original=None):
+        """
+        Stores the candidate list for `key`. Lists holding an uncacheable
+        result are not stored at all, so a hit never replays a partial
+        answer; candidates identical to `original` (the code they fix) are
+        dropped.
+        """
+        if any(str(r).startswith(UNCACHEABLE_PREFIXES) for _, r in candidates):
+            return False
+        if original is not None:
+            same = normalize_code(original)
+            candidates = [(c, r) for c, r in candidates if normalize_code(c) != same]
+        if not candidates:
+            return False
+        value = json.dumps(candidates)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO fixes(key, value, size, created, last_used) VALUES(?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now))
+            self._bump("stores")
+            self._evict()
+        return True
+
+    def _evict(self):
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM fixes").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        # Drop the least recently used ~10% in one go so we don't evict on every put
+        target_count = int(self.max_entries * 0.9)
+        target_size = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, entry_size in self._db.execute("SELECT key, size FROM fixes ORDER BY last_used").fetchall():
+            if count <= target_count and size <= target_size:
+                break
+            self._db.execute("DELETE FROM fixes WHERE key = ?", (key,))
+            count -= 1
+            size -= entry_size
+            evicted += 1
+        self._bump("evictions", evicted)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM fixes").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "stores": counters.get("stores", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": count,
+            "bytes": size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM fixes")
+            self._db.execute("DELETE FROM counters")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """
+    Process-wide cache, or None when disabled with DEVFORGE_CACHE=off.
+    """
+    global _cache
+    if CACHE_PATH.lower() in ("off", "0", "none", ""):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = FixCache()
+            except (sqlite3.Error, OSError) as e:
+                print(f">>> Fix cache disabled: {e}")
+                _cache = False
+        return _cache or None
+
+def stats():
+    c = get_cache()
+    return c.stats() if c else {}
@@ -0,0 +1,165 @@
+"""
+Headless batch repair.
+
+    python cli.py broken.py scripts/ "corpus/**/*.py" --workers 4 -o results.jsonl
+
+One JSON object per input file is written (as soon as it finishes):
+    {"file", "success", "cycles", "stopped", "rules", "elapsed", "timings", "code", "error"}
+
+--profile trace.json also writes every span as a Chrome trace and prints a
+per-span summary to stderr.
+
+    python cli.py --project mypkg/ other/main.py
+
+repairs each directory (or entry script's directory) as one multi-file
+project instead; "code" is then {file: fixed source} for the files changed.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cache
+import engine
+import profiler
+import project
+import rules
+import sandbox
+
+def collect_files(paths):
+    """
+    Expands files, directories (recursively) and glob patterns into .py files.
+    """
+    found = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, names in os.walk(p):
+                found += [os.path.join(root, n) for n in sorted(names) if n.endswith(".py")]
+        elif os.path.isfile(p):
+            found.append(p)
+        else:
+            found += [f for f in sorted(glob.glob(p, recursive=True)) if f.endswith(".py")]
+
+    seen, unique = set(), []
+    for f in found:
+        key = os.path.abspath(f)
+        if key not in seen:
+            seen.add(key)
+            unique.append(f)
+    return unique
+
+def _init_worker(pool_size, use_cache):
+    # Chatty modules (patcher prints LLM calls) must not corrupt JSONL on stdout
+    sys.stdout = sys.stderr
+    sandbox.POOL_SIZE = pool_size
+    if not use_cache:
+        cache.CACHE_PATH = "off"
+
+def repair_file(path, max_retries, llm_variants, in_place):
+    with open(path, "r") as f: code = f.read()
+    result = engine.repair(code, max_retries, llm_variants=llm_variants,
+                           workdir=os.path.dirname(os.path.abspath(path)))
+    if in_place and result["success"]:
+        with open(path, "w") as f: f.write(result["code"] + "\n")
+    return _report(path, result, result["code"])
+
+def repair_project(path, max_retries, llm_variants, in_place):
+    result = engine.repair(project.Project.load(path), max_retries, llm_variants=llm_variants)
+    fixed = result["code"]
+    if in_place and result["success"]:
+        fixed.save()
+    return _report(path, result, {rel: fixed.files[rel] for rel in fixed.changed()})
+
+def _report(path, result, code):
+    row = {
+        "file": path,
+        "success": result["success"],
+        "cycles": result["cycles"],
+        "stopped": result["stopped"],
+        "rules": result["rules"],
+        "elapsed": round(result["elapsed"], 4),
+        "timings": result["timings"],
+        "code": code,
+        "error": result["error"],
+    }
+    # Cumulative per-process rule stats; the parent keeps the latest per pid.
+    # Spans are handed over (and dropped here) with each file.
+    return row, os.getpid(), rules.REGISTRY.stats(), profiler.drain()
+
+def merge_rule_stats(snapshots):
+    total = {}
+    for snap in snapshots:
+        for name, st in snap.items():
+            t = total.setdefault(name, {"calls": 0, "hits": 0, "ms": 0.0})
+            for k in t:
+                t[k] += st[k]
+    return total
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DevForge headless auto-debugger")
+    parser.add_argument("paths", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="files repaired concurrently")
+    parser.add_argument("-c", "--cycles", type=int, default=engine.DEFAULT_RETRIES, help="max repair cycles per file")
+    parser.add_argument("--llm-variants", type=int, default=engine.LLM_VARIANTS, help="extra LLM candidates per cycle")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    parser.add_argument("--in-place", action="store_true", help="overwrite files that were fixed")
+    parser.add_argument("--project", action="store_true",
+                        help="repair each directory (or entry script) as one multi-file project")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the persistent fix cache")
+    parser.add_argument("--rule-stats", action="store_true", help="print per-rule calls/hits/time to stderr")
+    parser.add_argument("--profile", metavar="TRACE", help="write a Chrome trace of all spans and print a summary")
+    args = parser.parse_args(argv)
+
+    if args.project:
+        files, repair = args.paths, repair_project
+    else:
+        files, repair = collect_files(args.paths), repair_file
+    if not files:
+        parser.error("no .py files matched")
+
+    workers = max(1, min(args.workers, len(files)))
+    # Share the machine between file workers and their warm sandbox pools
+    pool_size = max(1, (os.cpu_count() or 1) // workers)
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    solved = 0
+    rule_stats = {}
+    spans = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pool_size, not args.no_cache)) as ex:
+            futures = {ex.submit(repair, f, args.cycles, args.llm_variants, args.in_place): f for f in files}
+            for fut in as_completed(futures):
+                try:
+                    row, pid, snapshot, file_spans = fut.result()
+                    rule_stats[pid] = snapshot
+                    spans += file_spans
+                except Exception as e:
+                    row = {"file": futures[fut], "success": False, "cycles": 0, "stopped": "error", "rules": [],
+                           "elapsed": 0.0, "timings": {}, "code": "", "error": f"EngineError: {e}"}
+                solved += row["success"]
+                out.write(json.dumps(row) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"Solved {solved}/{len(files)} files.", file=sys.stderr)
+    if args.rule_stats:
+        print(f"{'rule':<24}{'calls':>7}{'hits':>7}{'ms':>10}", file=sys.stderr)
+        for name, st in merge_rule_stats(rule_stats.values()).items():
+            print(f"{name:<24}{st['calls']:>7}{st['hits']:>7}{st['ms']:>10.2f}", file=sys.stderr)
+    if args.profile:
+        profiler.write_trace(args.profile, spans)
+        print(profiler.format_summary(profiler.summary(spans)), file=sys.stderr)
+        print(f"Trace written to {args.profile}", file=sys.stderr)
+    if not args.no_cache:
+        st = cache.stats()
+        if st:
+            print(f"Fix cache: {st['hits']} hits / {st['misses']} misses ({st['hit_rate']:.0%}), "
+                  f"{st['entries']} entries", file=sys.stderr)
+    return 0 if solved == len(files) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# expect: argparse
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--name", required=True)
+args = parser.parse_args()
+print("Hello", args.name)
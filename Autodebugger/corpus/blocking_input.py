@@ -0,0 +1,4 @@
+# expect: blocking_input
+name = input("Your name: ")
+age = int(input("Age: "))
+print(f"{name} is {age}")
@@ -0,0 +1,8 @@
+# expect: llm
+# case: llm_zero_division
+print("Hello! I am about to do some math.")
+
+x = 10
+y = 0
+
+print(f"The result is {x / y if y else 0}")
@@ -0,0 +1,8 @@
+# expect: init_typo
+class Point:
+    def _init_(self, x, y):
+        self.x = x
+        self.y = y
+
+p = Point(1, 2)
+print(p.x + p.y)
@@ -0,0 +1,8 @@
+# expect: key_error
+CONFIG = {
+    "debug": True,
+}
+
+if CONFIG["verbose"]:
+    print("verbose mode")
+print("debug" if CONFIG["debug"] else "quiet")
@@ -0,0 +1,5 @@
+# expect: llm
+# case: llm_index_error
+scores = [90, 85, 77]
+for i in range(len(scores) + 1):
+    print(i, scores[i])
@@ -0,0 +1,5 @@
+# expect: llm
+# case: llm_type_error
+items = ["apple", "pear", "plum"]
+count = len(items)
+print("Items in basket: " + count)
@@ -0,0 +1,8 @@
+# expect: unsolved
+# case: llm_unfixable
+def check(balance):
+    if balance < 0:
+        raise ValueError("negative balance")
+    return balance
+
+print(check(-5))
@@ -0,0 +1,3 @@
+# expect: missing_file
+with open("bench_data/settings.txt") as f:
+    print(f.read())
@@ -0,0 +1,5 @@
+# expect: missing_module
+import json
+import fancy_colors_lib
+
+print(json.dumps({"ok": True}))
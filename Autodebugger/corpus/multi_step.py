@@ -0,0 +1,9 @@
+# expect: multi
+import json
+import fancy_colors_lib
+
+def average(values):
+    totl = sum(values)
+    return total / len(values)
+
+print(json.dumps({"avg": average([1, 2, 3])}))
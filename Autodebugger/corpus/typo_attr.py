@@ -0,0 +1,4 @@
+# expect: typo
+import math
+
+print(math.sqroot(16))
@@ -0,0 +1,6 @@
+# expect: typo
+def total(items):
+    subtotal = sum(items)
+    return subtotl * 1.2
+
+print(total([1, 2, 3]))
@@ -0,0 +1,4 @@
+# expect: undefined_name
+values = [3, 1, 2]
+show_summary(sorted(values))
+print("done")
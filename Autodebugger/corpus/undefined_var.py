@@ -0,0 +1,2 @@
+# expect: undefined_name
+print("Total:", total_count)
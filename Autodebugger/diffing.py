@@ -0,0 +1,174 @@
+"""
+Line diffs for fix previews.
+
+Lines are interned to ints (one dict lookup per line, so comparing lines is
+comparing hashes), the common prefix/suffix is trimmed, and the middle is
+diffed with Myers' O((N+M)D) algorithm. Rule fixes touch a handful of
+lines, so D is tiny and the diff is effectively linear. When D exceeds
+MAX_EDIT_DISTANCE (e.g. an LLM rewrote everything), the middle is reported
+as one replaced block instead of searching further; a multiset count of
+the shared lines bounds D from below, so hopeless cases bail out at once.
+
+The result is a list of Edit(start, end, lines): old lines [start, end)
+become `lines`. unified_diff() renders edits in the
+difflib.unified_diff(..., lineterm='') format.
+"""
+import collections
+
+MAX_EDIT_DISTANCE = 500
+CONTEXT = 3
+
+class Edit:
+    def __init__(self, start, end, lines, new_start=None):
+        self.start = start          # 0-based, in the old text
+        self.end = end              # exclusive
+        self.lines = lines          # replacement lines
+        self.new_start = start if new_start is None else new_start
+
+    def __repr__(self):
+        return f"Edit({self.start}, {self.end}, {len(self.lines)} lines)"
+
+    def __eq__(self, other):
+        return isinstance(other, Edit) and (self.start, self.end, self.lines) == (other.start, other.end, other.lines)
+
+def _intern(a, b):
+    ids = {}
+    return [ids.setdefault(l, len(ids)) for l in a], [ids.setdefault(l, len(ids)) for l in b]
+
+def _myers(a, b):
+    """
+    Matching runs [(i, j, length)] between int lists a and b, or None when
+    the edit distance exceeds MAX_EDIT_DISTANCE.
+    """
+    n, m = len(a), len(b)
+    maxd = min(n + m, MAX_EDIT_DISTANCE)
+    off = maxd + 1
+    v = [0] * (2 * maxd + 3)
+    trace = []
+    for d in range(maxd + 1):
+        # V as it was before step d, for k in [-d-1, d+1]
+        trace.append(v[off - d - 1:off + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[off + k - 1] < v[off + k + 1]):
+                x = v[off + k + 1]          # Down: insert b[y]
+            else:
+                x = v[off + k - 1] + 1      # Right: delete a[x]
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[off + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m, d)
+    return None
+
+def _backtrack(trace, x, y, dist):
+    runs = []
+    for d in range(dist, 0, -1):
+        snap, base = trace[d], d + 1
+        k = x - y
+        if k == -d or (k != d and snap[base + k - 1] < snap[base + k + 1]):
+            prev_k = k + 1
+            mid_x = snap[base + prev_k]
+        else:
+            prev_k = k - 1
+            mid_x = snap[base + prev_k] + 1
+        if x > mid_x:
+            runs.append((mid_x, mid_x - k, x - mid_x))
+        x = snap[base + prev_k]
+        y = x - prev_k
+    if x > 0:
+        runs.append((0, 0, x))
+    return runs[::-1]
+
+def diff_lines(a, b):
+    """
+    Edits turning line list `a` into `b`.
+    """
+    if a == b:
+        return []
+    ia, ib = _intern(a, b)
+    # Trim the common prefix/suffix: most fixes only touch a few lines
+    lo = 0
+    top = min(len(ia), len(ib))
+    while lo < top and ia[lo] == ib[lo]:
+        lo += 1
+    hi_a, hi_b = len(ia), len(ib)
+    while hi_a > lo and hi_b > lo and ia[hi_a - 1] == ib[hi_b - 1]:
+        hi_a -= 1
+        hi_b -= 1
+
+    mid_a, mid_b = ia[lo:hi_a], ib[lo:hi_b]
+    common = sum((collections.Counter(mid_a) & collections.Counter(mid_b)).values())
+    runs = None
+    if len(mid_a) + len(mid_b) - 2 * common <= MAX_EDIT_DISTANCE:
+        runs = _myers(mid_a, mid_b)
+    if runs is None:
+        return [Edit(lo, hi_a, b[lo:hi_b], lo)]
+
+    edits = []
+    i = j = 0
+    for ri, rj, size in runs + [(hi_a - lo, hi_b - lo, 0)]:
+        if ri > i or rj > j:
+            edits.append(Edit(lo + i, lo + ri, b[lo + j:lo + rj], lo + j))
+        i, j = ri + size, rj + size
+    return edits
+
+def diff(original, modified):
+    return diff_lines(original.splitlines(), modified.splitlines())
+
+def apply_edits(lines, edits):
+    """
+    Applies edits (sorted, non-overlapping, old-text coordinates) to a line list.
+    """
+    out, pos = [], 0
+    for e in edits:
+        out += lines[pos:e.start]
+        out += e.lines
+        pos = e.end
+    return out + lines[pos:]
+
+def _range(start, length):
+    # difflib's hunk header format
+    first = start + 1
+    if length == 1:
+        return f"{first}"
+    if not length:
+        first -= 1
+    return f"{first},{length}"
+
+def unified_diff(original, modified, context=CONTEXT, fromfile="", tofile=""):
+    """
+    The two texts' line diff in the format of
+    list(difflib.unified_diff(a, b, fromfile, tofile, lineterm='')).
+    """
+    a, b = original.splitlines(), modified.splitlines()
+    edits = diff_lines(a, b)
+    if not edits:
+        return []
+    # Group edits whose context windows touch into hunks
+    hunks, cur = [], [edits[0]]
+    for e in edits[1:]:
+        if e.start - cur[-1].end <= 2 * context:
+            cur.append(e)
+        else:
+            hunks.append(cur)
+            cur = [e]
+    hunks.append(cur)
+
+    out = [f"--- {fromfile}", f"+++ {tofile}"]
+    for hunk in hunks:
+        first, last = hunk[0], hunk[-1]
+        a0 = max(0, first.start - context)
+        a1 = min(len(a), last.end + context)
+        b0 = first.new_start - (first.start - a0)
+        b1 = last.new_start + len(last.lines) + (a1 - last.end)
+        out.append(f"@@ -{_range(a0, a1 - a0)} +{_range(b0, b1 - b0)} @@")
+        pos = a0
+        for e in hunk:
+            out += [" " + l for l in a[pos:e.start]]
+            out += ["-" + l for l in a[e.start:e.end]]
+            out += ["+" + l for l in e.lines]
+            pos = e.end
+        out += [" " + l for l in a[pos:a1]]
+    return out
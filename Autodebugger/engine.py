@@ -0,0 +1,381 @@
+"""
+UI-independent repair engine.
+The Tk app and the batch CLI are both thin clients of `repair()`.
+"""
+import contextlib
+import os
+import time
+import hashlib
+import heapq
+import itertools
+import uuid
+
+import cache
+import diffing
+import sandbox
+import workspace
+import patcher
+import preflight
+import project
+import llm
+import models
+import profiler
+
+DEFAULT_RETRIES = 10
+LLM_VARIANTS = 0  # Extra LLM candidates per cycle, evaluated alongside the rules
+
+def generate_diff(original, modified, fromfile="", tofile=""):
+    if isinstance(modified, project.Project):
+        # One file diff per file the fix touched
+        out = []
+        for rel in modified.changed(since=original):
+            out += generate_diff(original.files[rel], modified.files[rel], f"a/{rel}", f"b/{rel}")
+        return out
+    if original == modified:
+        return []
+    with profiler.span("diff") as sp:
+        out = diffing.unified_diff(original, modified, fromfile=fromfile, tofile=tofile)
+        sp["lines"] = len(out)
+        return out
+
+def _noop(kind, **data):
+    pass
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+def _text(code):
+    """
+    The text shown for a state: the script, or a project's last patched file.
+    """
+    return code.files[code.focus] if isinstance(code, project.Project) else code
+
+def _marked(code):
+    # Fixture marks only ever come from fixes, so a project's are in its changed files
+    if isinstance(code, project.Project):
+        return "\n".join(code.files[rel] for rel in code.changed())
+    return code
+
+def _run_args(code):
+    if isinstance(code, project.Project):
+        return {"source": code.files[code.entry], "modules": code.modules(), "path": [code.base]}
+    return {"source": code}
+
+def run_candidate(code, temp_filename, ws, profile=None):
+    """
+    One sandbox run of `code` (a script, or a project.Project whose entry
+    point is `temp_filename`) in a fresh directory of workspace `ws`, under
+    the session's sandbox.ExecutionProfile.
+    """
+    with profiler.span("sandbox.run") as sp, ws.run_dir(_marked(code)) as cwd:
+        res = sandbox.run_code(temp_filename, cwd=cwd, profile=profile, **_run_args(code))
+        sp.update(wall_ms=_ms(res.get("wall_time")), cpu_ms=_ms(res.get("cpu_time")),
+                  peak_rss=res.get("peak_rss"), ok=res["success"])
+    return res
+
+def evaluate_candidates(candidates, temp_filename, ws, on_event=_noop, profile=None):
+    """
+    Runs every candidate fix (in parallel when there are several), each in
+    its own directory of workspace `ws`, stopping as soon as one passes.
+    Returns [(index, sandbox_result)] for the runs that finished, with
+    tracebacks rewritten to name `temp_filename`.
+    """
+    if len(candidates) == 1:
+        return [(0, run_candidate(candidates[0][0], temp_filename, ws, profile))]
+
+    if isinstance(candidates[0][0], project.Project):
+        # Modules are imported by name from their real paths: no renaming
+        files = [temp_filename] * len(candidates)
+    else:
+        base, ext = os.path.splitext(temp_filename)
+        files = [f"{base}_cand{i}{ext}" for i in range(len(candidates))]
+
+    on_event("log", text=f">>> Testing {len(candidates)} candidate fixes in parallel...\n", tag="info")
+    out = []
+    with profiler.span("evaluate", candidates=len(candidates)), contextlib.ExitStack() as dirs:
+        args = [_run_args(code) for code, _ in candidates]
+        cwds = [dirs.enter_context(ws.run_dir(_marked(code))) for code, _ in candidates]
+        for i, res in sandbox.run_many(files, sources=[a["source"] for a in args], cwds=cwds,
+                                       modules=[a.get("modules") for a in args],
+                                       paths=[a.get("path") for a in args], profile=profile):
+            # Same script, different name: make the traceback read as if it ran as temp_filename
+            res["error"] = res["error"].replace(files[i], temp_filename)
+            out.append((i, res))
+    return out
+
+# ==========================================
+# SEARCH
+# ==========================================
+# A state is (code, error it produces). The search keeps every state it has
+# run in a frontier and always expands the one whose traceback got furthest,
+# so a fix that makes things worse no longer drags the whole run down a dead
+# end, and code it has already tried (A -> B -> A oscillations) is never run
+# or analyzed twice.
+
+# When every candidate of a state was already visited, ask the LLM once more
+# for this many extra rewrites before giving up on that state.
+BACKOFF_VARIANTS = 2
+# Stop early after this many expansions without a better score or a new error.
+PATIENCE = 4
+
+class _State:
+    def __init__(self, code, result, filename, parent=None, reason=None, seq=0):
+        self.code = code
+        self.result = result
+        self.parent = parent
+        self.reason = reason
+        self.seq = seq
+        self.depth = parent.depth + 1 if parent else 0
+        self.error = result["error"].strip()
+        self.signature = error_signature(self.error)
+        self.score = sandbox.progress_score(result, filename)
+        self.variants = None  # LLM variants to ask for on (re-)expansion
+
+    def priority(self):
+        # Furthest traceback first; then states whose error changed from their
+        # parent's; then the newest (depth-first among equals, like the old loop)
+        changed = self.parent is None or self.signature != self.parent.signature
+        return (-self.score, not changed, -self.seq)
+
+    def path(self):
+        node, out = self, []
+        while node.parent is not None:
+            out.append(node)
+            node = node.parent
+        return out[::-1]
+
+def code_hash(code):
+    if isinstance(code, project.Project):
+        # Same file set throughout a search: a state is its changes
+        return hashlib.sha256("\0".join(f"{rel}\0{code_hash(code.files[rel])}"
+                                         for rel in sorted(code.changed())).encode()).hexdigest()
+    return hashlib.sha256(cache.normalize_code(code).encode("utf-8", "replace")).hexdigest()
+
+def error_signature(error_msg):
+    """
+    The error with paths, line numbers and addresses stripped.
+    """
+    return cache.normalize_error(error_msg)
+
+def _preflight(code, workdir, seen_code, applied, on_event):
+    """
+    Applies the statically detectable fixes before the first run. Of a
+    project only the entry script is checked: it's the one file sure to run.
+    """
+    proj = code if isinstance(code, project.Project) else None
+    source, names = (proj.files[proj.entry], proj.local_modules()) if proj else (code, ())
+    with profiler.span("preflight") as sp, project.scope(proj):
+        _, steps = preflight.resolve(source, workdir, names)
+        sp["fixes"] = len(steps)
+    if not steps:
+        return code
+    seen_code.add(code_hash(code))
+    on_event("log", text=f">>> Pre-flight: {len(steps)} fix(es) found without running the script.\n", tag="info")
+    prev = code
+    for step_code, reason in steps:
+        step = proj.replace(proj.entry, step_code) if proj else step_code
+        on_event("fix", reason=reason, diff=generate_diff(prev, step))
+        applied.append(reason)
+        prev = step
+    _show(on_event, prev)
+    return prev
+
+def _show(on_event, code):
+    if isinstance(code, project.Project):
+        on_event("code", code=_text(code), file=code.focus)
+    else:
+        on_event("code", code=code)
+
+def _propose(code, error, variants, on_partial, on_event, filename):
+    """
+    Ranked candidate fixes for `code`, run as `filename`. A project gets them
+    for the one file the traceback points at; the rest of it is left alone.
+    """
+    if not isinstance(code, project.Project):
+        return patcher.propose_fixes(code, error, llm_variants=variants, on_partial=on_partial, filename=filename)
+    rel = code.attribute(error)
+    on_event("log", text=f">>> Patching {rel}\n", tag="info")
+    # Rules can tell the project's own modules from missing packages
+    with project.scope(code):
+        fixes = patcher.propose_fixes(code.files[rel], error, llm_variants=variants, on_partial=on_partial,
+                                      filename=code.path(rel))
+    return [(code.replace(rel, new_code), reason) for new_code, reason in fixes]
+
+def repair(code, max_retries=DEFAULT_RETRIES, on_event=_noop, llm_variants=LLM_VARIANTS, workdir=None, cancel=None):
+    """
+    The auto-debug loop: run, analyze, patch, repeat, as a best-first search
+    over (code, error) states. `max_retries` caps the number of cycles (state
+    expansions); the search also ends early when it runs out of new states or
+    stops making progress.
+
+    `code` is a script, or a project.Project: its entry point is run with the
+    project's (patched) modules, and each fix changes only the file the
+    traceback blames. The result's "code" is then the fixed Project.
+
+    `on_event(kind, **data)` is called as the loop progresses:
+        cycle(attempt, max_retries) / run(result) / log(text, tag) / error(short_err, error)
+        fix(reason, diff) / code(code[, file]) / partial(code) / status(text) / success(output)
+
+    `cancel` is an llm.CancelToken; once cancelled, the loop stops at the next
+    checkpoint and in-flight LLM calls are abandoned.
+
+    Returns a dict with the final code (the solution, or the furthest state
+    reached), cycles used, rules applied along its path, timing ("timings":
+    total ms per profiler span recorded during the run) and search stats:
+    "stopped" (solved / cancelled / exhausted / plateau / max_cycles),
+    "states" run and "pruned" candidates skipped as already visited.
+    """
+    start = time.perf_counter()
+    mark = profiler.now()
+    attempt = 0
+    stopped = "max_cycles"
+    pruned = 0
+
+    proj = code if isinstance(code, project.Project) else None
+    if proj:
+        # Modules know each other by path: the entry runs under its own name
+        temp_filename = proj.entry_path
+        workdir = os.path.dirname(temp_filename)
+    else:
+        # Only names the script in tracebacks: the source goes to the sandbox in
+        # memory, and the unique name keeps concurrent runs apart in the caches.
+        temp_filename = os.path.join(workdir or os.getcwd(), f"temp_debug_target_{uuid.uuid4().hex[:12]}.py")
+
+    frontier = []       # heap of (priority, state)
+    seen_code = set()
+    seen_errors = set()
+    seq = itertools.count()
+    root = current = best = solved = None
+    preflight_rules = []
+    stale = 0
+
+    def push(state):
+        heapq.heappush(frontier, (state.priority(), state))
+
+    # Every run gets its own disposable CWD; mock fixtures are staged there
+    ws = workspace.Workspace()
+    # Timeouts adapt to this script's own successful runs only
+    profile = sandbox.ExecutionProfile()
+    try:
+        for attempt in range(1, max_retries + 1):
+            with profiler.span("cycle", attempt=attempt):
+                if cancel is not None and cancel.cancelled:
+                    stopped = "cancelled"
+                    break
+                if root is not None and not frontier:
+                    on_event("log", text=">>> No unexplored fixes left; stopping early.\n", tag="info")
+                    stopped = "exhausted"
+                    attempt -= 1
+                    break
+                on_event("cycle", attempt=attempt, max_retries=max_retries)
+
+                if root is None:
+                    code = proj or code.strip()
+                    if preflight.ENABLED:
+                        # Imports resolve next to the script, wherever the caller's CWD is
+                        code = _preflight(code, os.path.dirname(temp_filename), seen_code, preflight_rules, on_event)
+                    result = run_candidate(code, temp_filename, ws, profile)
+                    on_event("run", result=result)
+                    root = node = best = _State(code, result, temp_filename, seq=next(seq))
+                    seen_code.add(code_hash(code))
+                else:
+                    _, node = heapq.heappop(frontier)
+                    if node.parent is not current and node is not current:
+                        on_event("log", text=f">>> Backtracking to an earlier state (depth {node.depth}).\n", tag="info")
+                    if node is not current and node.reason is not None:
+                        on_event("fix", reason=node.reason, diff=generate_diff(node.parent.code, node.code))
+                    _show(on_event, node.code)
+                current = node
+
+                if node.result["success"]:
+                    solved = node
+                    break
+
+                short_err = node.error.splitlines()[-1] if node.error else "Crash"
+                on_event("error", short_err=short_err, error=node.error)
+                seen_errors.add(node.signature)
+
+                on_event("status", text="Status: Analyzing...")
+                variants = llm_variants if node.variants is None else node.variants
+                with llm.cancel_scope(cancel), profiler.span("patcher.propose"):
+                    candidates = _propose(node.code, node.error, variants,
+                                          lambda partial: on_event("partial", code=partial), on_event, temp_filename)
+                if cancel is not None and cancel.cancelled:
+                    stopped = "cancelled"
+                    break
+
+                # Prune candidates whose code was already run (cycles, oscillations, no-ops)
+                fresh = []
+                for cand_code, reason in candidates:
+                    h = code_hash(cand_code)
+                    if h in seen_code:
+                        pruned += 1
+                        continue
+                    seen_code.add(h)
+                    fresh.append((cand_code, reason))
+
+                if not fresh:
+                    if variants < llm_variants + BACKOFF_VARIANTS:
+                        # Back off to a different strategy: more, hotter LLM rewrites
+                        on_event("log", text=f">>> Stuck on: {short_err}. Asking the LLM for alternatives...\n", tag="info")
+                        node.variants = llm_variants + BACKOFF_VARIANTS
+                        push(node)
+                    else:
+                        on_event("log", text=f">>> Dead end: no new fixes for {short_err}\n", tag="info")
+                    continue
+
+                improved = False
+                for i, res in evaluate_candidates(fresh, temp_filename, ws, on_event, profile):
+                    child = _State(fresh[i][0], res, temp_filename, parent=node, reason=fresh[i][1], seq=next(seq))
+                    model = models.model_of(child.reason)
+                    if model:
+                        # Per-model fix rates drive which model is asked first
+                        models.get_manager().report(model, node.error, "" if res["success"] else child.error)
+                    if res["success"] or child.score > node.score:
+                        # Verified: an LLM rewrite may now go into the fix cache
+                        patcher.confirm_fix(_text(child.code))
+                    if len(fresh) == 1:
+                        on_event("run", result=res)
+                    if res["success"]:
+                        solved = child
+                        break
+                    if child.score > best.score or child.signature not in seen_errors:
+                        improved = True
+                    if child.priority() < best.priority():
+                        best = child
+                    push(child)
+                if solved:
+                    on_event("fix", reason=solved.reason, diff=generate_diff(node.code, solved.code))
+                    _show(on_event, solved.code)
+                    break
+
+                stale = 0 if improved else stale + 1
+                if stale >= PATIENCE:
+                    on_event("log", text=f">>> No progress in {PATIENCE} cycles; stopping early.\n", tag="info")
+                    stopped = "plateau"
+                    break
+    finally:
+        ws.close()
+
+    final = solved or best or root
+    if solved:
+        stopped = "solved"
+        on_event("success", output=solved.result["output"])
+        _show(on_event, solved.code)
+
+    rules = preflight_rules + ([s.reason for s in final.path() if s.reason] if final else [])
+
+    return {
+        "success": solved is not None,
+        "cancelled": stopped == "cancelled",
+        "code": final.code if final else proj or code.strip(),
+        "cycles": attempt,
+        "rules": rules,
+        "output": solved.result["output"] if solved else "",
+        "error": "" if solved or not final else final.error,
+        "elapsed": time.perf_counter() - start,
+        "timings": profiler.totals(profiler.spans(mark)),
+        "stopped": stopped,
+        "states": len(seen_code),
+        "pruned": pruned,
+    }
@@ -0,0 +1,223 @@
+"""
+Incremental syntax highlighting for the editor pane.
+
+Lines are lexed one at a time with the `tokenize` module. The only state that
+crosses a line boundary is "inside a triple-quoted string", so each line's
+result is cached together with the state it started in. After an edit, only
+the touched lines are re-lexed, and lexing continues downwards only while the
+outgoing state differs from what the next line was lexed with.
+
+`Highlighter` is toolkit-free; `TkHighlighter` hooks it up to a Text widget.
+"""
+import io
+import keyword
+import tokenize
+
+KEYWORDS = frozenset(keyword.kwlist) | {"print"}
+TAGS = ("keyword", "string", "comment")
+DEBOUNCE_MS = 30
+
+def lex_line(text, state=None):
+    """
+    Highlights one line. `state` is the open triple-quote delimiter carried in
+    from the previous line (or None).
+    Returns (spans, state_out), spans being [(tag, start_col, end_col)].
+    """
+    spans = []
+    offset = 0
+    if state is not None:
+        end = text.find(state)
+        if end == -1:
+            return [("string", 0, len(text))] if text else [], state
+        offset = end + len(state)
+        spans.append(("string", 0, offset))
+
+    rest = text[offset:]
+    body = rest.lstrip()
+    indent = offset + len(rest) - len(body)
+    if not body:
+        return spans, None
+
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(body).readline):
+            if tok.start[0] != 1:
+                break
+            if tok.type == tokenize.NAME and tok.string in KEYWORDS:
+                spans.append(("keyword", indent + tok.start[1], indent + tok.end[1]))
+            elif tok.type == tokenize.STRING:
+                spans.append(("string", indent + tok.start[1], indent + tok.end[1]))
+            elif tok.type == tokenize.COMMENT:
+                spans.append(("comment", indent + tok.start[1], indent + tok.end[1]))
+            elif tok.type == tokenize.ERRORTOKEN and tok.string in "\"'":
+                # Unterminated single-line string: colour the rest of the line
+                spans.append(("string", indent + tok.start[1], len(text)))
+                break
+    except tokenize.TokenError as e:
+        msg, (row, col) = e.args
+        if "string" in msg and row == 1:
+            # A triple-quoted string opens here and continues on the next line
+            start = indent + col
+            quote_at = start
+            while quote_at < len(text) and text[quote_at] not in "\"'":
+                quote_at += 1  # Skip string prefixes (r, b, f, ...)
+            spans.append(("string", start, len(text)))
+            return spans, text[quote_at:quote_at + 3]
+    except (IndentationError, SyntaxError):
+        pass
+    return spans, None
+
+class Highlighter:
+    def __init__(self):
+        self.lines = []
+        self.state_in = []
+        self.spans = []
+        self._dirty = None  # (lo, hi) inclusive, 0-based
+
+    def reset(self, text):
+        """
+        Full (re)lex. Returns spans for every line.
+        """
+        self.lines = text.split("\n")
+        self.state_in = [None] * len(self.lines)
+        self.spans = [None] * len(self.lines)
+        self._dirty = None
+        state = None
+        for i, line in enumerate(self.lines):
+            self.state_in[i] = state
+            self.spans[i], state = lex_line(line, state)
+        return list(enumerate(self.spans))
+
+    def splice(self, start, old_count, new_count):
+        """
+        Records that lines [start, start+old_count) were replaced by
+        `new_count` lines whose text will be fetched on the next relex().
+        """
+        delta = new_count - old_count
+        self.lines[start:start + old_count] = [None] * new_count
+        self.state_in[start:start + old_count] = [None] * new_count
+        self.spans[start:start + old_count] = [[] for _ in range(new_count)]
+
+        def remap(p):
+            # Old line index -> new line index
+            if p < start:
+                return p
+            if p >= start + old_count:
+                return p + delta
+            return start + min(p - start, max(new_count - 1, 0))
+
+        lo, hi = start, start + max(new_count, 1) - 1
+        if self._dirty is not None:
+            lo, hi = min(lo, remap(self._dirty[0])), max(hi, remap(self._dirty[1]))
+        last = len(self.lines) - 1
+        self._dirty = (max(0, min(lo, last)), max(0, min(hi, last)))
+
+    def dirty_range(self):
+        return self._dirty
+
+    def relex(self, fetch):
+        """
+        Re-lexes the dirty lines. `fetch(lo, hi)` must return the current text
+        of lines lo..hi (0-based, inclusive) as a list.
+        Returns [(line_index, spans)] for every line whose spans may have changed.
+        """
+        if self._dirty is None or not self.lines:
+            return []
+        lo, hi = self._dirty
+        self._dirty = None
+        self.lines[lo:hi + 1] = fetch(lo, hi)
+
+        changed = []
+        state = None
+        if lo > 0:
+            # Outgoing state of the line above
+            _, state = lex_line(self.lines[lo - 1], self.state_in[lo - 1])
+        i = lo
+        n = len(self.lines)
+        while i < n:
+            line = self.lines[i]
+            if line is None:
+                line = self.lines[i] = fetch(i, i)[0]
+            if i > hi and self.state_in[i] == state and self.spans[i] is not None:
+                break  # Converged: everything below is still valid
+            self.state_in[i] = state
+            self.spans[i], state = lex_line(line, state)
+            changed.append((i, self.spans[i]))
+            i += 1
+        return changed
+
+class TkHighlighter:
+    """
+    Drives a Highlighter from a tk.Text widget. Insert/delete calls on the
+    widget are intercepted to learn exactly which lines changed; re-lexing is
+    debounced so a burst of keystrokes costs one pass.
+    """
+    def __init__(self, text_widget, delay=DEBOUNCE_MS):
+        self.text = text_widget
+        self.delay = delay
+        self.core = Highlighter()
+        self._pending = None
+        self._orig = text_widget._w + "_hl_orig"
+        tkapp = text_widget.tk
+        tkapp.call("rename", text_widget._w, self._orig)
+        tkapp.createcommand(text_widget._w, self._dispatch)
+        self.core.reset("")
+
+    def _line(self, index):
+        return int(self.text.tk.call(self._orig, "index", index).split(".")[0])
+
+    def _dispatch(self, *args):
+        tkapp = self.text.tk
+        op = args[0] if args else ""
+        if op in ("insert", "delete", "replace") and len(args) > 1:
+            before = self._line("end-1c")
+            first = min(self._line(args[1]), before)
+            if op == "insert":
+                last = first
+            else:
+                # A single-index delete may eat the newline and join two lines
+                end = args[2] if len(args) > 2 else f"{args[1]}+1c"
+                last = min(self._line(end), before)
+            result = tkapp.call((self._orig,) + args)
+            after = self._line("end-1c")
+            old_count = last - first + 1
+            self.core.splice(first - 1, old_count, old_count + (after - before))
+            self._schedule()
+            return result
+        return tkapp.call((self._orig,) + args)
+
+    def _schedule(self):
+        if self._pending is None:
+            self._pending = self.text.after(self.delay, self.flush)
+
+    def _fetch(self, lo, hi):
+        text = self.text.tk.call(self._orig, "get", f"{lo + 1}.0", f"{hi + 1}.end")
+        return text.split("\n")
+
+    def flush(self):
+        self._pending = None
+        self._apply(self.core.relex(self._fetch))
+
+    def refresh(self):
+        """
+        Full re-highlight (e.g. after loading a file).
+        """
+        text = self.text.tk.call(self._orig, "get", "1.0", "end-1c")
+        for tag in TAGS:
+            self.text.tk.call(self._orig, "tag", "remove", tag, "1.0", "end")
+        self._apply(self.core.reset(text), clear=False)
+
+    def _apply(self, changed, clear=True):
+        if not changed:
+            return
+        call = self.text.tk.call
+        if clear:
+            lo, hi = changed[0][0] + 1, changed[-1][0] + 1
+            for tag in TAGS:
+                call(self._orig, "tag", "remove", tag, f"{lo}.0", f"{hi}.end")
+        ranges = {tag: [] for tag in TAGS}
+        for i, spans in changed:
+            for tag, s, e in spans:
+                ranges[tag] += (f"{i + 1}.{s}", f"{i + 1}.{e}")
+        for tag, idx in ranges.items():
+            if idx:
+                call(self._orig, "tag", "add", tag, *idx)
@@ -0,0 +1,269 @@
+"""
+Pooled Ollama client.
+
+- One keep-alive requests.Session per endpoint (no TCP handshake per call)
+- A semaphore bounding concurrent generations across the whole app
+- Identical in-flight requests are coalesced into one HTTP call
+- Cooperative cancellation: work started under a CancelToken stops at the
+  next streamed chunk once the token is cancelled
+- Routing across several local endpoints, least-busy first, with failover
+
+Endpoints come from DEVFORGE_OLLAMA_URLS: ';'-separated entries, each
+"url" or "url|model1,model2". Without it, calls go to the caller's URL.
+"""
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import profiler
+
+MAX_CONCURRENCY = int(os.environ.get("DEVFORGE_LLM_CONCURRENCY", "2"))
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 120
+# How long an endpoint that refused a connection is skipped
+ENDPOINT_BACKOFF = 5.0
+
+class LLMCancelled(Exception):
+    pass
+
+class LLMError(Exception):
+    """
+    The server answered with an error (e.g. the model isn't installed).
+    """
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+_local = threading.local()
+
+@contextlib.contextmanager
+def cancel_scope(token):
+    """
+    LLM calls made by this thread inside the block obey `token`.
+    """
+    prev = getattr(_local, "token", None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = prev
+
+def current_token():
+    return getattr(_local, "token", None)
+
+def _check(token):
+    if token is not None and token.cancelled:
+        raise LLMCancelled("LLM request cancelled")
+
+class Endpoint:
+    def __init__(self, url, models=None, pool_size=MAX_CONCURRENCY):
+        self.url = url
+        self.models = set(models) if models else None   # None = serves anything
+        self.inflight = 0
+        self.down_until = 0.0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def serves(self, model):
+        return self.models is None or model in self.models
+
+    def __repr__(self):
+        return f"Endpoint({self.url!r}, models={sorted(self.models) if self.models else '*'})"
+
+def parse_endpoints(spec):
+    endpoints = []
+    for entry in filter(None, (e.strip() for e in spec.split(";"))):
+        url, _, models = entry.partition("|")
+        endpoints.append(Endpoint(url.strip(), [m.strip() for m in models.replace(" ", ",").split(",") if m.strip()]))
+    return endpoints
+
+class LLMClient:
+    def __init__(self, endpoints=None, max_concurrency=MAX_CONCURRENCY):
+        self.endpoints = list(endpoints or [])
+        self._fallback = {}                     # url -> Endpoint, for ad-hoc URLs
+        self._sem = threading.BoundedSemaphore(max(max_concurrency, 1))
+        self._lock = threading.Lock()
+        self._inflight = {}                     # request key -> Future
+        self._rr = itertools.count()
+        self.coalesced = 0
+
+    # --- routing -------------------------------------------------------
+    def _route(self, model, default_url, exclude=()):
+        with self._lock:
+            pool = [e for e in self.endpoints if e.serves(model)]
+            if not pool and default_url:
+                if default_url not in self._fallback:
+                    self._fallback[default_url] = Endpoint(default_url)
+                pool = [self._fallback[default_url]]
+            now = time.monotonic()
+            live = [e for e in pool if e not in exclude and e.down_until <= now] or \
+                   [e for e in pool if e not in exclude]
+            if not live:
+                return None
+            tick = next(self._rr)
+            best = min(live, key=lambda e: (e.inflight, (pool.index(e) - tick) % len(pool)))
+            best.inflight += 1
+            return best
+
+    def _release(self, endpoint, failed=False):
+        with self._lock:
+            endpoint.inflight -= 1
+            if failed:
+                endpoint.down_until = time.monotonic() + ENDPOINT_BACKOFF
+
+    # --- requests ------------------------------------------------------
+    def generate(self, payload, default_url=None, on_text=None):
+        """
+        POSTs an /api/generate payload and returns the generated text.
+        With payload["stream"], `on_text(text_so_far)` is called per chunk and
+        may return True to stop early (the connection is dropped).
+        Raises LLMCancelled if the caller's CancelToken fires.
+        """
+        token = current_token()
+        key = hashlib.sha256(json.dumps([payload, default_url], sort_keys=True).encode()).hexdigest()
+        while True:
+            _check(token)
+            with self._lock:
+                fut = self._inflight.get(key)
+                leader = fut is None
+                if leader:
+                    fut = self._inflight[key] = Future()
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                try:
+                    fut.set_result(self._generate(payload, default_url, on_text, token))
+                except BaseException as e:
+                    fut.set_exception(e)
+                finally:
+                    with self._lock:
+                        self._inflight.pop(key, None)
+                return fut.result()
+
+            # Follower: wait for the leader, but stay cancellable ourselves
+            while not fut.done():
+                _check(token)
+                try:
+                    fut.result(timeout=0.1)
+                except Exception:
+                    pass
+            try:
+                return fut.result()
+            except LLMCancelled:
+                continue  # The leader was cancelled, we weren't: try again ourselves
+
+    def _generate(self, payload, default_url, on_text, token):
+        while not self._sem.acquire(timeout=0.1):
+            _check(token)
+        try:
+            tried = []
+            while True:
+                _check(token)
+                endpoint = self._route(payload.get("model"), default_url, exclude=tried)
+                if endpoint is None:
+                    raise requests.ConnectionError(f"No reachable Ollama endpoint for {payload.get('model')}")
+                tried.append(endpoint)
+                try:
+                    text = self._post(endpoint, payload, on_text, token)
+                except requests.ConnectionError:
+                    self._release(endpoint, failed=True)
+                    continue  # Fail over to the next endpoint
+                except BaseException:
+                    self._release(endpoint)
+                    raise
+                self._release(endpoint)
+                return text
+        finally:
+            self._sem.release()
+
+    def _post(self, endpoint, payload, on_text, token):
+        stream = payload.get("stream", False)
+        with profiler.span("llm.generate", model=payload.get("model"), endpoint=endpoint.url) as sp:
+            started = time.perf_counter()
+            res = endpoint.session.post(endpoint.url, json=payload, stream=stream,
+                                        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if not stream:
+                body = res.json()
+                if "error" in body:
+                    raise LLMError(body["error"])
+                _timing_args(sp, body)
+                return body.get("response", "")
+            out = ""
+            chunks = 0
+            try:
+                for raw in res.iter_lines():
+                    _check(token)
+                    if not raw:
+                        continue
+                    chunk = json.loads(raw)
+                    if "error" in chunk:
+                        raise LLMError(chunk["error"])
+                    chunks += 1
+                    if chunks == 1:
+                        # Time to first token ~ prompt prefill (+ model load)
+                        sp["ttft_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                    out += chunk.get("response", "")
+                    if on_text and on_text(out):
+                        sp["stopped_early"] = True
+                        break
+                    if chunk.get("done"):
+                        _timing_args(sp, chunk)
+                        break
+            finally:
+                res.close()  # Dropping the connection aborts generation server-side
+                sp.setdefault("tokens", chunks)
+            return out
+
+    def close(self):
+        for e in self.endpoints + list(self._fallback.values()):
+            e.session.close()
+
+def _timing_args(sp, body):
+    # Ollama's final message carries server-side counters (durations in ns)
+    if "load_duration" in body: sp["load_ms"] = round(body["load_duration"] / 1e6, 3)
+    if "prompt_eval_count" in body: sp["prompt_tokens"] = body["prompt_eval_count"]
+    if "prompt_eval_duration" in body: sp["prefill_ms"] = round(body["prompt_eval_duration"] / 1e6, 3)
+    if "eval_count" in body: sp["tokens"] = body["eval_count"]
+    if "eval_duration" in body: sp["gen_ms"] = round(body["eval_duration"] / 1e6, 3)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(parse_endpoints(os.environ.get("DEVFORGE_OLLAMA_URLS", "")))
+        return _client
+
+def configure(endpoints=None, max_concurrency=MAX_CONCURRENCY):
+    """
+    Replaces the shared client, e.g. configure(["http://a:11434/api/generate",
+    ("http://b:11434/api/generate", ["qwen2.5-coder:1.5b"])]).
+    """
+    global _client
+    eps = [Endpoint(e) if isinstance(e, str) else Endpoint(*e) for e in (endpoints or [])]
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = LLMClient(eps, max_concurrency)
+        return _client
@@ -0,0 +1,232 @@
+"""
+Local model lifecycle: warm-up, keep-alive and tiering.
+
+Models are tried small to large (DEVFORGE_MODELS, ','-separated; default
+the 1.5b, then the 7b). A call starts at the smallest tier that
+  - fits the prompt (big prompts go straight to the largest model),
+  - is installed and answering (not "model not found", not erroring),
+  - hasn't kept giving unusable answers or failing on this error class
+    (per-model fix rates), and
+  - is actually faster than the tier above it (per-model latency),
+and moves up a tier when the answer is unusable. Once the search reports
+that a model's fix didn't get past an error, later calls for that same
+error start one tier higher.
+
+Every request carries keep_alive, and warm_up() loads the models in the
+background at startup so the first fix doesn't pay the model load time.
+"""
+import collections
+import os
+import re
+import threading
+import time
+
+import cache
+import llm
+import profiler
+import rules
+
+DEFAULT_TIERS = ["qwen2.5-coder:1.5b", "qwen2.5-coder:7b"]
+KEEP_ALIVE = os.environ.get("DEVFORGE_KEEP_ALIVE", "30m")
+SMALL_PROMPT_CHARS = 8000   # Bigger prompts skip the small tiers
+MIN_SAMPLES = 4             # Observations needed before stats change the order
+MIN_FIX_RATE = 0.25         # Below this (usable answers, or fixes for an error class) a small tier is skipped
+PROBE_EVERY = 10            # ...except every Nth time, so its stats can recover
+MAX_ERRORS = 3              # Consecutive failed calls before a model is benched...
+ERROR_BACKOFF = 60.0        # ...for this many seconds
+LATENCY_WINDOW = 50
+MAX_ESCALATED = 1024        # Remembered errors that start above the first tier
+
+_REASON_RE = re.compile(r"^LLM \((.+?)\):")
+
+def _signature(error_msg):
+    # The exception line only: the same error raised from another line of
+    # a rewritten script is still the same unsolved error
+    return cache.normalize_error(rules.parse_exception(error_msg)[1])
+
+def label(model):
+    """
+    Reason prefix naming the model, so outcomes can be attributed later.
+    """
+    return f"LLM ({model})"
+
+def model_of(reason):
+    m = _REASON_RE.match(reason or "")
+    return m.group(1) if m else None
+
+class ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.unusable = 0           # Answered, but nothing we could use
+        self.consecutive_errors = 0
+        self.benched_until = 0.0
+        self.missing = False        # Server says it isn't installed
+        self.load_ms = None         # Warm-up time
+        self.latency = collections.deque(maxlen=LATENCY_WINDOW)
+        self.outcomes = collections.defaultdict(lambda: [0, 0])   # error class -> [tried, fixed]
+
+    def mean_latency(self):
+        return sum(self.latency) / len(self.latency) if self.latency else None
+
+    def to_dict(self):
+        mean = self.mean_latency()
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "unusable": self.unusable,
+            "mean_ms": round(mean * 1000, 1) if mean is not None else None,
+            "load_ms": self.load_ms,
+            "missing": self.missing,
+            "fixed": {exc: f"{fixed}/{tried}" for exc, (tried, fixed) in sorted(self.outcomes.items())},
+        }
+
+class ModelManager:
+    def __init__(self, tiers=None, keep_alive=KEEP_ALIVE):
+        self.tiers = list(tiers or DEFAULT_TIERS)
+        self.keep_alive = keep_alive
+        self._stats = {m: ModelStats() for m in self.tiers}
+        self._escalated = collections.OrderedDict()   # error signature -> first tier to try
+        self._skips = collections.Counter()           # (model, error class) -> times skipped on stats
+        self._lock = threading.Lock()
+
+    def _stat(self, model):
+        s = self._stats.get(model)
+        if s is None:
+            s = self._stats[model] = ModelStats()
+        return s
+
+    # --- routing -------------------------------------------------------
+    def _worth_trying(self, i, exc, now):
+        s = self._stat(self.tiers[i])
+        if s.missing or s.benched_until > now:
+            return False
+        if i == len(self.tiers) - 1:
+            return True
+        answered = s.calls - s.errors
+        tried, fixed = s.outcomes[exc] if exc in s.outcomes else (0, 0)
+        above = self._stat(self.tiers[i + 1])
+        poor = (answered >= MIN_SAMPLES and (answered - s.unusable) / answered < MIN_FIX_RATE) or \
+               (tried >= MIN_SAMPLES and fixed / tried < MIN_FIX_RATE) or \
+               (len(s.latency) >= MIN_SAMPLES and len(above.latency) >= MIN_SAMPLES and
+                s.mean_latency() >= above.mean_latency())   # Not even faster
+        if not poor:
+            return True
+        key = (self.tiers[i], exc)
+        self._skips[key] += 1
+        return self._skips[key] % PROBE_EVERY == 0
+
+    def ladder(self, prompt, error_msg=None):
+        """
+        The models to try for this call, in order.
+        """
+        last = len(self.tiers) - 1
+        start = last if len(prompt) > SMALL_PROMPT_CHARS else 0
+        exc = rules.parse_exception(error_msg)[0] if error_msg else None
+        now = time.monotonic()
+        with self._lock:
+            if error_msg:
+                start = max(start, self._escalated.get(_signature(error_msg), 0))
+            order = [i for i in range(start, last + 1) if self._worth_trying(i, exc, now)]
+            if not order:
+                # Everything looks bad: anything installed, biggest first
+                order = [i for i in range(last, -1, -1) if not self._stat(self.tiers[i]).missing] or [last]
+        return [self.tiers[i] for i in order]
+
+    # --- feedback ------------------------------------------------------
+    def record_call(self, model, seconds, usable=True, error=None, error_msg=None):
+        """
+        Outcome of one request: its latency, or the server/connection
+        `error`. An unusable answer to `error_msg` counts as a failed fix
+        for that error class.
+        """
+        with self._lock:
+            s = self._stat(model)
+            s.calls += 1
+            if error is not None:
+                s.errors += 1
+                s.consecutive_errors += 1
+                if "not found" in error:
+                    s.missing = True
+                elif s.consecutive_errors >= MAX_ERRORS:
+                    s.benched_until = time.monotonic() + ERROR_BACKOFF
+                return
+            s.consecutive_errors = 0
+            s.missing = False
+            s.latency.append(seconds)
+            if not usable:
+                s.unusable += 1
+                if error_msg:
+                    s.outcomes[rules.parse_exception(error_msg)[0]][0] += 1
+
+    def report(self, model, error_msg, new_error):
+        """
+        Search feedback: `model`'s fix for `error_msg` ran and raised
+        `new_error` ("" if it passed). Still the same exception = not fixed.
+        """
+        exc, line = rules.parse_exception(error_msg)
+        fixed = not new_error or rules.parse_exception(new_error)[1] != line
+        with self._lock:
+            o = self._stat(model).outcomes[exc]
+            o[0] += 1
+            o[1] += fixed
+            if not fixed and model in self.tiers:
+                sig = _signature(error_msg)
+                nxt = min(self.tiers.index(model) + 1, len(self.tiers) - 1)
+                self._escalated[sig] = max(nxt, self._escalated.get(sig, 0))
+                self._escalated.move_to_end(sig)
+                while len(self._escalated) > MAX_ESCALATED:
+                    self._escalated.popitem(last=False)
+
+    # --- lifecycle -----------------------------------------------------
+    def warm_up(self, url, models=None, block=False):
+        """
+        Loads the models (an empty prompt makes Ollama load and keep one)
+        so the first real call doesn't wait for it. Runs in the background
+        unless `block`.
+        """
+        def run():
+            for model in models or self.tiers:
+                payload = {"model": model, "prompt": "", "stream": False, "keep_alive": self.keep_alive}
+                started = time.perf_counter()
+                try:
+                    with profiler.span("llm.warmup", model=model):
+                        llm.get_client().generate(payload, default_url=url)
+                except llm.LLMError as e:
+                    self.record_call(model, None, error=str(e))
+                except Exception:
+                    return  # Server not up: nothing to warm
+                else:
+                    with self._lock:
+                        self._stat(model).load_ms = round((time.perf_counter() - started) * 1000, 1)
+        if block:
+            run()
+            return None
+        t = threading.Thread(target=run, name="devforge-warmup", daemon=True)
+        t.start()
+        return t
+
+    def stats(self):
+        with self._lock:
+            return {m: s.to_dict() for m, s in self._stats.items()}
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            tiers = [m.strip() for m in os.environ.get("DEVFORGE_MODELS", "").split(",") if m.strip()]
+            _manager = ModelManager(tiers or None)
+        return _manager
+
+def configure(tiers=None, keep_alive=KEEP_ALIVE):
+    """
+    Replaces the shared manager, e.g. configure(["qwen2.5-coder:7b"]) to
+    use a single model.
+    """
+    global _manager
+    with _manager_lock:
+        _manager = ModelManager(tiers, keep_alive)
+        return _manager
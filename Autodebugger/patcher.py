@@ -1,80 +1,190 @@
 import re
-import requests
 import json
 import os
 import sys
+import time
+import threading
+import collections
+import cache
+import slicer
+import rules
+import llm
+import models
+import profiler
+import workspace
+import project
 
 # CONFIG
-# Use "qwen2.5-coder:7b" if you have the larger model, otherwise "1.5b"
-MODEL_NAME = "qwen2.5-coder:7b" 
+# Which models answer (small first, escalating to "qwen2.5-coder:7b") is up to
+# models.py; set DEVFORGE_MODELS to change the tiers.
 OLLAMA_URL = "http://localhost:11434/api/generate"
+MIN_CTX = 2048
+MAX_CTX = 32768
+# LLM answers waiting for the sandbox to vouch for them before being cached
+MAX_PENDING = 256
 
 def analyze_and_fix(code_content, error_msg):
     """
     Final Robust Patcher: Duplicate Guards, Environment Signals & Hybrid Logic
+    Returns the best-ranked candidate only.
     """
-    lines = code_content.splitlines()
-    
-    # ==========================================
-    # LEVEL 0: SYNTAX & HINTS
-    # ==========================================
+    return propose_fixes(code_content, error_msg)[0]
+
+def propose_fixes(code_content, error_msg, llm_variants=0, use_cache=True, on_partial=None, filename=None):
+    """
+    Runs EVERY rule and returns a ranked list of (new_code, reason) candidates.
+    Rules come first (in cascade order), then `llm_variants` LLM rewrites.
+    The LLM is always consulted when no rule matched. `filename` is the path
+    the code runs from; LLM prompts only narrow down to the failing block when
+    the traceback has a frame in it.
+    Known (code, error) pairs are answered from the fix cache. Answers from
+    the rules alone are cached at once; ones the LLM took part in only once
+    confirm_fix() reports that one of its rewrites worked.
+    """
+    fix_cache = cache.get_cache() if use_cache else None
+    if fix_cache:
+        scope = project.current()
+        # Answers from other rules don't apply; inside a project, which
+        # imports are local changes the answer too
+        variant = f"{llm_variants}:{rules.REGISTRY.fingerprint()}"
+        key = cache.make_key(code_content, error_msg,
+                             variant if scope is None else f"{variant}:{scope.layout()}")
+        with profiler.span("cache.get") as sp:
+            hit = fix_cache.get(key)
+            sp["hit"] = bool(hit)
+        if hit:
+            return hit
+
+    candidates, asked_llm = _compute_fixes(code_content, error_msg, llm_variants, on_partial, filename)
+    if fix_cache:
+        if asked_llm:
+            _hold(key, code_content, candidates)
+        else:
+            fix_cache.put(key, candidates, original=code_content)
+    return candidates
+
+_pending = collections.OrderedDict()    # normalized LLM rewrite -> (cache key, original, candidates)
+_pending_lock = threading.Lock()
+
+def _is_llm(reason):
+    return str(reason).startswith("LLM")
+
+def _hold(key, code_content, candidates):
+    with _pending_lock:
+        for new_code, reason in candidates:
+            if _is_llm(reason):
+                _pending[cache.normalize_code(new_code)] = (key, code_content, candidates)
+        while len(_pending) > MAX_PENDING:
+            _pending.popitem(last=False)
+
+def confirm_fix(new_code):
+    """
+    The sandbox showed that `new_code` works (or at least gets further).
+    If it is an LLM rewrite from propose_fixes, that answer is cached now:
+    the rule candidates plus this rewrite, without the untested ones.
+    """
+    with _pending_lock:
+        held = _pending.pop(cache.normalize_code(new_code), None)
+    fix_cache = cache.get_cache()
+    if held is None or not fix_cache:
+        return False
+    key, code_content, candidates = held
+    same = cache.normalize_code(new_code)
+    keep = [(c, r) for c, r in candidates if not _is_llm(r) or cache.normalize_code(c) == same]
+    return fix_cache.put(key, keep, original=code_content)
+
+def _compute_fixes(code_content, error_msg, llm_variants, on_partial=None, filename=None):
+    """
+    (ranked candidates, whether the LLM was asked).
+    """
+    candidates = []
+    seen = {code_content.strip()}
+
+    with profiler.span("patcher.rules") as sp:
+        for new_code, reason in rules.REGISTRY.candidates(code_content, error_msg):
+            key = new_code.strip()
+            if key not in seen:
+                seen.add(key)
+                candidates.append((new_code, reason))
+        sp["matched"] = [reason for _, reason in candidates]
+
+    n_llm = llm_variants if candidates else max(1, llm_variants)
+    fallback_reason = None
+    for i in range(n_llm):
+        # Only the first variant streams into the UI; the rest would interleave
+        new_code, reason = llm_fix(code_content, error_msg, temperature=LLM_TEMPERATURES[i % len(LLM_TEMPERATURES)],
+                                   on_partial=on_partial if i == 0 else None, attempt=i, filename=filename)
+        key = new_code.strip()
+        if key not in seen:
+            seen.add(key)
+            candidates.append((new_code, reason))
+        elif fallback_reason is None:
+            fallback_reason = reason
+
+    if not candidates:
+        # Nothing usable; keep the historical contract of returning the code as-is.
+        candidates.append((code_content, fallback_reason))
+    return candidates, n_llm > 0
+
+# ==========================================
+# LEVEL 0: SYNTAX & HINTS
+# ==========================================
+# Rules register themselves in cascade order (== ranking order) and are
+# dispatched by the exception type on the last traceback line.
+
+@rules.rule()
+def _fix_init_typo(code_content, error_msg, lines, match):
     if "def _init_" in code_content:
-        return code_content.replace("def _init_", "def __init__"), "Structure: Fixed constructor typo."
-
-    if "Did you mean:" in error_msg:
-        # Extract hint from Python error
-        match = re.search(r"Did you mean: '(\w+)'", error_msg)
-        if match:
-            # Try to find what caused the error (NameError or AttributeError)
-            bad_match = re.search(r"'(\w+)'", error_msg)
-            if bad_match:
-                bad = bad_match.group(1)
-                good = match.group(1)
-                # Only replace if it looks safe
-                if len(bad) > 1:
-                    return code_content.replace(bad, good), f"Hint: Fixed typo '{bad}' -> '{good}'"
-
-    # ==========================================
-    # LEVEL 1: RUNTIME SAFETY
-    # ==========================================
-    if "arguments are required" in error_msg:
-        if "required=True" in code_content:
-            return code_content.replace("required=True", "required=False, default='dummy'"), "Rule: Made CLI args optional."
-
-    if "KeyError" in error_msg:
-        match = re.search(r"KeyError: '(\w+)'", error_msg)
-        if match:
-            key = match.group(1)
-            if "CONFIG = {" in code_content:
-                repl = f'CONFIG = {{\n    "{key}": False, # [AUTO] Injected key'
-                return code_content.replace("CONFIG = {", repl), f"Rule: Injected key '{key}'."
-
-    if "RecursionError" in error_msg:
-        if "setrecursionlimit" not in code_content:
-            return "import sys\nsys.setrecursionlimit(3000)\n" + code_content, "Rule: Increased recursion limit."
-
-    # 5. RECURSION & TIMEOUT
-    if "RecursionError" in error_msg:
-        if "setrecursionlimit" not in code_content:
-            return "import sys\nsys.setrecursionlimit(3000)\n" + code_content, "Rule: Increased recursion limit."
-
-    # FIX: Check for 'TimeLimitExceeded' OR 'timed out'
-   # --- FIX: SMART INPUT MOCKER (Generic) ---
-    # Detects blocking inputs and mocks them based on type context.
-    if ("TimeLimitExceeded" in error_msg or "Timeout" in error_msg) and "input(" in code_content:
+        yield code_content.replace("def _init_", "def __init__"), "Structure: Fixed constructor typo."
+
+@rules.rule("NameError", "AttributeError", "ImportError", pattern=r"(?:name|attribute) '(\w+)'.*Did you mean: '(\w+)'")
+def _fix_did_you_mean(code_content, error_msg, lines, match):
+    bad, good = match.group(1), match.group(2)
+    # Only replace if it looks safe
+    if len(bad) > 1:
+        # Whole identifiers first, the broad substring replace as a fallback
+        yield re.sub(rf"\b{re.escape(bad)}\b", good, code_content), f"Hint: Fixed typo '{bad}' -> '{good}'"
+        yield code_content.replace(bad, good), f"Hint: Fixed typo '{bad}' -> '{good}' (substring)"
+
+# ==========================================
+# LEVEL 1: RUNTIME SAFETY
+# ==========================================
+@rules.rule("argparse", pattern=r"arguments are required")
+def _fix_required_args(code_content, error_msg, lines, match):
+    if "required=True" in code_content:
+        yield code_content.replace("required=True", "required=False, default='dummy'"), "Rule: Made CLI args optional."
+
+@rules.rule("KeyError", pattern=r"KeyError: '(\w+)'")
+def _fix_key_error(code_content, error_msg, lines, match):
+    key = match.group(1)
+    if "CONFIG = {" in code_content:
+        repl = f'CONFIG = {{\n    "{key}": False, # [AUTO] Injected key'
+        yield code_content.replace("CONFIG = {", repl), f"Rule: Injected key '{key}'."
+
+# 5. RECURSION & TIMEOUT
+@rules.rule("RecursionError")
+def _fix_recursion(code_content, error_msg, lines, match):
+    if "setrecursionlimit" not in code_content:
+        yield "import sys\nsys.setrecursionlimit(3000)\n" + code_content, "Rule: Increased recursion limit."
+
+# --- FIX: SMART INPUT MOCKER (Generic) ---
+# Detects blocking inputs and mocks them based on type context.
+@rules.rule("TimeLimitExceeded", "TimeoutError")
+def _fix_blocking_input(code_content, error_msg, lines, match):
+    if "input(" in code_content:
         new_lines = []
         for line in lines:
             if "input(" in line:
                 # 1. Determine the Type
                 mock_value = '"mock_input"' # Default to string (safest)
-                
+
                 if "int(input" in line:
                     mock_value = "1"
                 elif "float(input" in line:
                     mock_value = "1.0"
                 elif "eval(input" in line:
                     mock_value = "0"
-                
+
                 # 2. Replace the line
                 if "=" in line:
                     # Logic: variable = input(...)  ->  variable = "mock"
@@ -85,66 +195,139 @@ def analyze_and_fix(code_content, error_msg):
                     new_lines.append(f"# {line.strip()} # [AUTO] Removed blocking wait")
             else:
                 new_lines.append(line)
-        
-        return "\n".join(new_lines), "Environment: Mocked blocking user inputs."
-    
-    if "ModuleNotFoundError" in error_msg:
-        match = re.search(r"No module named '([\w\.-]+)'", error_msg)
-        if match:
-            bad = match.group(1)
-            return "\n".join([l for l in lines if bad not in l]), f"Rule: Removed module '{bad}'."
-
-    # --- FIX 1: ENVIRONMENT SIGNAL (Stops the "Stuck" error) ---
-    if "FileNotFoundError" in error_msg:
-        match = re.search(r"No such file or directory: '(.+?)'", error_msg)
-        if match:
-            path = match.group(1)
-            try:
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-            except: pass
-            
-            with open(path, "w") as f: 
-                f.write("Mock Data")
-            
-            # CRITICAL: Append a comment so 'app.py' sees the code changed
-            return code_content + f"\n# [ENV] Created mock file: {path}", f"Environment: Created mock file '{path}'."
-
-    # --- FIX 2: DUPLICATE GUARD (Stops the 18 function copies) ---
-    if "NameError" in error_msg and "is not defined" in error_msg:
-        match = re.search(r"name '(\w+)'", error_msg)
-        if match:
-            name = match.group(1)
-            
-            # CHECK: Does it already exist?
-            if f"def {name}" in code_content or f"{name} =" in code_content:
-                pass # It exists, so this is a logic error, not a missing structure. Let LLM handle it.
-            else:
-                if f"{name}(" in code_content:
-                    stub = f"\n\ndef {name}(*args, **kwargs):\n    print('LOG: Stub for {name}')\n    return None\n"
-                    return code_content + stub, f"Structure: Stubbed function '{name}'."
-                else:
-                    return f"{name} = None # Auto-Def\n" + code_content, f"Structure: Defined variable '{name}'."
 
-    # ==========================================
-    # LEVEL 3: LLM FALLBACK
-    # ==========================================
-    print(f">>> Calling LLM ({MODEL_NAME})...")
-    prompt = f"""You are a Python expert. Fix this error.
+        yield "\n".join(new_lines), "Environment: Mocked blocking user inputs."
+
+def _is_local_module(name, error_msg):
+    # A module next to any script in the traceback is the user's own code
+    top = name.split(".")[0]
+    for path in set(re.findall(r'File "([^"<]+)", line \d+', error_msg)):
+        folder = os.path.dirname(path)
+        if os.path.exists(os.path.join(folder, top + ".py")) or os.path.isdir(os.path.join(folder, top)):
+            return True
+    return False
+
+@rules.rule("ModuleNotFoundError", pattern=r"No module named '([\w\.-]+)'")
+def _fix_missing_module(code_content, error_msg, lines, match):
+    bad = match.group(1)
+    proj = project.current()
+    if proj is not None:
+        found = proj.find_module(bad)
+        if found and found != bad:
+            # A project module imported by the wrong path: import it by its real one
+            package = found[:-len(bad) - 1]
+            new_code = re.sub(rf"^(\s*)from {re.escape(bad)}(\.[\w.]+)?(\s+import\b)",
+                              lambda m: f"{m.group(1)}from {found}{m.group(2) or ''}{m.group(3)}", code_content, flags=re.M)
+            new_code = re.sub(rf"^(\s*)import {re.escape(bad)}(\s+as\s+\w+)",
+                              lambda m: f"{m.group(1)}import {found}{m.group(2)}", new_code, flags=re.M)
+            if "." not in bad:
+                new_code = re.sub(rf"^(\s*)import {re.escape(bad)}[ \t]*$",
+                                  lambda m: f"{m.group(1)}from {package} import {bad}", new_code, flags=re.M)
+            yield new_code, f"Rule: Imported local module '{bad}' as '{found}'."
+            return
+        if bad.split(".")[0] in proj.local_modules():
+            return  # Part of the project, just not there: not ours to delete
+    if _is_local_module(bad, error_msg):
+        return
+    yield "\n".join([l for l in lines if bad not in l]), f"Rule: Removed module '{bad}'."
+
+# --- FIX 1: ENVIRONMENT SIGNAL (Stops the "Stuck" error) ---
+@rules.rule("FileNotFoundError", pattern=r"No such file or directory: '(.+?)'")
+def _fix_missing_file(code_content, error_msg, lines, match):
+    path = match.group(1)
+    # Nothing is written here: the marker tells the sandbox workspace to
+    # stage the file in each run's own directory (and changes the code)
+    rel = workspace.fixture_path(path)
+    if rel is None:
+        # Outside the run directory: point the script at a local mock instead
+        rel = os.path.basename(path)
+        if not rel or f"'{path}'" not in code_content and f'"{path}"' not in code_content:
+            return
+        code_content = code_content.replace(f"'{path}'", f"'{rel}'").replace(f'"{path}"', f'"{rel}"')
+        yield code_content + f"\n{workspace.FIXTURE_MARK}{rel}", f"Environment: Redirected '{path}' to mock file '{rel}'."
+        return
+    yield code_content + f"\n{workspace.FIXTURE_MARK}{rel}", f"Environment: Created mock file '{rel}'."
+
+# --- FIX 2: DUPLICATE GUARD (Stops the 18 function copies) ---
+@rules.rule("NameError", pattern=r"name '(\w+)' is not defined")
+def _fix_undefined_name(code_content, error_msg, lines, match):
+    name = match.group(1)
+
+    # CHECK: Does it already exist?
+    if f"def {name}" in code_content or f"{name} =" in code_content:
+        return # It exists, so this is a logic error, not a missing structure. Let LLM handle it.
+    if f"{name}(" in code_content:
+        # Defined up front, like the variable below: module-level calls run
+        # before anything appended to the end of the file would exist
+        stub = f"def {name}(*args, **kwargs):\n    print('LOG: Stub for {name}')\n    return None\n\n"
+        yield stub + code_content, f"Structure: Stubbed function '{name}'."
+    else:
+        yield f"{name} = None # Auto-Def\n" + code_content, f"Structure: Defined variable '{name}'."
+
+# ==========================================
+# LEVEL 3: LLM FALLBACK
+# ==========================================
+# One temperature per variant so parallel LLM candidates actually differ.
+LLM_TEMPERATURES = [0.2, 0.5, 0.8]
+
+def llm_fix(code_content, error_msg, temperature=0.2, on_partial=None, attempt=0, filename=None):
+    """
+    `attempt` > 0 starts further up the model tiers (extra variants of a
+    cycle go to bigger models). Without `filename` the whole file is sent.
+    """
+    sl = slicer.slice_for_error(code_content, error_msg, filename)
+    if sl is None:
+        prompt = f"""You are a Python expert. Fix this error.
     Error: {error_msg}
     Code:
     ```python
     {code_content}
     ```
     Return FULL CODE only."""
-    
-    return call_ollama(prompt, code_content)
 
-def apply_user_instruction(code_content, instruction):
+        return call_ollama(prompt, code_content, temperature=temperature, on_partial=on_partial,
+                           error_msg=error_msg, attempt=attempt)
+
+    prompt = f"""You are a Python expert. Fix this error.
+    Error: {error_msg}
+    The error happens in `{sl.name}` (lines {sl.start}-{sl.end}).
+    Related definitions (read-only, do NOT return them):
+    ```text
+{sl.context or "(none)"}
+    ```
+    Code to fix:
+    ```python
+{sl.text}
+    ```
+    Return the FULL fixed version of the code to fix only."""
+
+    return _call_sliced(prompt, code_content, sl, temperature, on_partial, error_msg, attempt)
+
+def apply_user_instruction(code_content, instruction, on_partial=None):
     """
     Used by the 'AI Edit' bar in the GUI.
     """
     print(f">>> User Instruction: {instruction}")
-    
+
+    sl = slicer.slice_for_names(code_content, instruction)
+    if sl is not None:
+        prompt = f"""
+    You are an expert AI coding assistant.
+    TASK: Modify `{sl.name}` according to this instruction: "{instruction}"
+    RULES: Return the FULL updated `{sl.name}` only. No text.
+
+    CONTEXT (read-only):
+    ```text
+{sl.context or "(none)"}
+    ```
+
+    CODE:
+    ```python
+{sl.text}
+    ```
+    """
+        return _call_sliced(prompt, code_content, sl, 0.2, on_partial)
+
     prompt = f"""
     You are an expert AI coding assistant.
     TASK: Modify the code according to this instruction: "{instruction}"
@@ -155,25 +338,109 @@ def apply_user_instruction(code_content, instruction):
     {code_content}
     ```
     """
-    return call_ollama(prompt, code_content)
+    return call_ollama(prompt, code_content, on_partial=on_partial)
+
+def _call_sliced(prompt, code_content, sl, temperature, on_partial, error_msg=None, attempt=0):
+    """
+    Sends only the slice and splices the model's answer back into the file.
+    """
+    partial = (lambda text: on_partial(slicer.splice(code_content, sl, text))) if on_partial else None
+    new_text, reason = call_ollama(prompt, sl.text, temperature=temperature, on_partial=partial,
+                                   error_msg=error_msg, attempt=attempt)
+    if new_text == sl.text:
+        return code_content, reason
+    model = models.model_of(reason)
+    prefix = models.label(model) if model else "LLM"
+    return slicer.splice(code_content, sl, new_text), f"{prefix}: Rewrote {sl.name} (lines {sl.start}-{sl.end})."
+
+def context_size(prompt):
+    """
+    num_ctx big enough for the prompt plus an answer of similar size
+    (~3.5 chars per token), rounded up to a power of two.
+    """
+    needed = int(len(prompt) / 3.5) * 2 + 256
+    size = MIN_CTX
+    while size < needed and size < MAX_CTX:
+        size *= 2
+    return size
+
+# Stream tokens and hang up as soon as the code block closes.
+STREAM = True
+
+_OPEN_FENCE = re.compile(r"```(?:python|py)?[ \t]*\n")
+
+def _extract_code(out):
+    match = re.search(r"```(?:python|py)?[ \t]*\n(.*?)```", out, re.DOTALL)
+    return match.group(1).strip() if match else out.strip()
 
-def call_ollama(prompt, original_code):
+def _fence_watcher(on_partial=None):
+    """
+    on_text callback for llm.LLMClient.generate: feeds the code written so far
+    to `on_partial` and asks to stop at the closing code fence.
+    """
+    code_start = [None]
+    def watch(out):
+        if code_start[0] is None:
+            m = _OPEN_FENCE.search(out)
+            if m:
+                code_start[0] = m.end()
+        if code_start[0] is None:
+            return False
+        if out.find("```", code_start[0]) != -1:
+            # Closing fence: everything after it is chatter we don't need.
+            return True
+        if on_partial:
+            on_partial(out[code_start[0]:])
+        return False
+    return watch
+
+def call_ollama(prompt, original_code, temperature=0.2, on_partial=None, stream=None, error_msg=None, attempt=0):
+    """
+    Asks the model tiers in order (see models.py), starting `attempt` rungs
+    up, and moves to the next one while the answer is unusable.
+    """
+    stream = STREAM if stream is None else stream
+    manager = models.get_manager()
+    ladder = manager.ladder(prompt, error_msg)
+    result = None
+    for model in ladder[min(attempt, len(ladder) - 1):]:
+        new_code, reason, usable = _ask_model(manager, model, prompt, original_code, temperature, on_partial, stream,
+                                               error_msg)
+        if usable:
+            return new_code, reason
+        result = result or (new_code, reason)
+        token = llm.current_token()
+        if token is not None and token.cancelled:
+            break
+    return result
+
+def _ask_model(manager, model, prompt, original_code, temperature, on_partial, stream, error_msg=None):
+    """
+    One generation. Returns (code, reason, usable) and feeds the model's stats.
+    """
+    print(f">>> Calling LLM ({model})...")
+    started = time.perf_counter()
     try:
         payload = {
-            "model": MODEL_NAME,
+            "model": model,
             "prompt": prompt,
-            "stream": False,
-            "options": {"temperature": 0.2, "num_ctx": 4096}
+            "stream": stream,
+            "keep_alive": manager.keep_alive,
+            "options": {"temperature": temperature, "num_ctx": context_size(prompt)}
         }
-        res = requests.post(OLLAMA_URL, json=payload, timeout=120)
-        out = res.json().get("response", "")
-        
-        match = re.search(r"```(?:python)?\n(.*?)```", out, re.DOTALL)
-        new_code = match.group(1).strip() if match else out.strip()
-        
-        if len(new_code) < len(original_code) * 0.5:
-            return original_code, "Safety: LLM truncated code."
-            
-        return new_code, "LLM: Logic rewritten."
+        # Pooled keep-alive connections, bounded concurrency, cancellable
+        out = llm.get_client().generate(payload, default_url=OLLAMA_URL,
+                                        on_text=_fence_watcher(on_partial) if stream else None)
+    except llm.LLMCancelled as e:
+        return original_code, f"Error: {str(e)}", False
     except Exception as e:
-        return original_code, f"Error: {str(e)}"
+        manager.record_call(model, None, error=str(e))
+        return original_code, f"Error: {str(e)}", False
+
+    new_code = _extract_code(out)
+    truncated = len(new_code) < len(original_code) * 0.5
+    usable = not truncated and new_code.strip() != original_code.strip()
+    manager.record_call(model, time.perf_counter() - started, usable, error_msg=error_msg)
+    if truncated:
+        return original_code, "Safety: LLM truncated code.", False
+    return new_code, f"{models.label(model)}: Logic rewritten.", usable
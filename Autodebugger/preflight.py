@@ -0,0 +1,345 @@
+"""
+Static pre-flight pass.
+
+Several errors the rules fix can be found without running the script:
+missing modules, undefined names, the `_init_` constructor typo and blocking
+input() calls. The loop would otherwise spend one sandbox run per error to
+discover them one at a time. Here the code is parsed and symtable-walked,
+every finding is turned into the error message the sandbox *would* report,
+and that message goes through the same rule registry, so the code that
+reaches the first run already has the same fixes the loop would have
+applied.
+
+Only code that runs every time is analyzed: module-level statements, the
+`if __name__ == "__main__":` block and the module-level functions they call,
+but not branches, loop bodies, try blocks or functions nothing calls there.
+A finding elsewhere may never happen, and fixing it would change a script
+that works.
+
+Only deterministic rules are used (no LLM), and a fix is kept only if the
+code still compiles. Fixes that delete code (RUN_ONLY, e.g. dropping an
+import) wait for a real traceback: a module the pass can't find may still
+be importable where the script runs. Analysis is re-run after each fix, since one fix can
+move or remove other findings. DEVFORGE_PREFLIGHT=off skips the pass.
+"""
+import ast
+import builtins
+import importlib.util
+import os
+import symtable
+import sys
+
+import patcher  # registers the rules
+import rules
+import sandbox
+
+ENABLED = os.environ.get("DEVFORGE_PREFLIGHT", "on") != "off"
+MAX_FIXES = 20
+# Fixes only a real run may apply
+RUN_ONLY = ("Rule: Removed module",)
+
+# Names that exist at runtime but are not in builtins
+MODULE_NAMES = frozenset({"__file__", "__builtins__", "__cached__", "__annotations__", "__class__"})
+# Set in every class body's namespace before it runs
+CLASS_NAMES = frozenset({"__module__", "__qualname__"})
+# Code using these can create globals symtable can't see
+DYNAMIC_NAMES = frozenset({"globals", "exec", "vars", "setattr", "__builtins__"})
+
+# ==========================================
+# NAME SUGGESTIONS
+# ==========================================
+# A port of CPython's "Did you mean" search (Python/suggestions.c), so the
+# hint in a synthesized NameError matches the one a real run would print.
+_MAX_CANDIDATE_ITEMS = 750
+_MAX_STRING_SIZE = 40
+_MOVE_COST = 2
+_CASE_COST = 1
+
+def _substitution_cost(a, b):
+    if a == b:
+        return 0
+    if a.lower() == b.lower():
+        return _CASE_COST
+    return _MOVE_COST
+
+def _levenshtein(a, b, max_cost):
+    if a == b:
+        return 0
+    pre = 0
+    while pre < len(a) and pre < len(b) and a[pre] == b[pre]:
+        pre += 1
+    a, b = a[pre:], b[pre:]
+    while a and b and a[-1] == b[-1]:
+        a, b = a[:-1], b[:-1]
+    if not a or not b:
+        return (len(a) + len(b)) * _MOVE_COST
+    if len(a) > _MAX_STRING_SIZE or len(b) > _MAX_STRING_SIZE:
+        return max_cost + 1
+    if len(b) < len(a):
+        a, b = b, a
+    if (len(b) - len(a)) * _MOVE_COST > max_cost:
+        return max_cost + 1
+    row = list(range(_MOVE_COST, _MOVE_COST * (len(a) + 1), _MOVE_COST))
+    result = 0
+    for b_index, code in enumerate(b):
+        distance = result = b_index * _MOVE_COST
+        minimum = sys.maxsize
+        for index, ch in enumerate(a):
+            substitute = distance + _substitution_cost(code, ch)
+            distance = row[index]
+            result = min(min(result, distance) + _MOVE_COST, substitute)
+            row[index] = result
+            minimum = min(minimum, result)
+        if minimum > max_cost:
+            return max_cost + 1
+    return result
+
+def _best_match(name, candidates):
+    if len(candidates) >= _MAX_CANDIDATE_ITEMS:
+        return None
+    best, best_distance = None, sys.maxsize
+    for item in candidates:
+        if item == name:
+            continue
+        max_distance = min((len(name) + len(item) + 3) * _MOVE_COST // 6, best_distance - 1)
+        distance = _levenshtein(name, item, max_distance)
+        if distance <= max_distance and (best is None or distance < best_distance):
+            best, best_distance = item, distance
+    return best
+
+def suggest(name, local_names, global_names):
+    """
+    The name CPython would suggest for an undefined `name`: locals first,
+    then globals, then builtins.
+    """
+    for scope in (local_names, global_names, list(vars(builtins))):
+        match = _best_match(name, list(scope))
+        if match:
+            return match
+    return None
+
+# ==========================================
+# FINDINGS
+# ==========================================
+def _tables(table):
+    yield table
+    for child in table.get_children():
+        yield from _tables(child)
+
+def _catches(try_node, names, bare=True):
+    for h in try_node.handlers:
+        if h.type is None:
+            if bare:
+                return True
+            continue
+        caught = h.type.elts if isinstance(h.type, ast.Tuple) else [h.type]
+        if any(isinstance(t, ast.Name) and t.id in names for t in caught):
+            return True
+    return False
+
+def _is_main_guard(test):
+    if not (isinstance(test, ast.Compare) and len(test.ops) == 1 and isinstance(test.ops[0], ast.Eq)):
+        return False
+    sides = (test.left, test.comparators[0])
+    return any(isinstance(s, ast.Name) and s.id == "__name__" for s in sides) and \
+        any(isinstance(s, ast.Constant) and s.value == "__main__" for s in sides)
+
+_COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+_MATCH = getattr(ast, "Match", ())
+_TRY = (ast.Try,) + ((ast.TryStar,) if hasattr(ast, "TryStar") else ())
+
+def _always_run(tree):
+    """
+    (node, scope) for every node a run of the script evaluates whenever it
+    gets that far, in source order; `scope` is the FunctionDef or ClassDef
+    whose namespace it runs in (None at module level). Branches, loop bodies,
+    try blocks, short-circuited operands and lambda/comprehension bodies are
+    left out; a module-level function's body is included where it is
+    called from such code.
+    """
+    functions = {n.name: n for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    entered = set()
+    todo = [(n, None) for n in reversed(tree.body)]
+    while todo:
+        node, scope = todo.pop()
+        yield node, scope
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            children = getattr(node, "decorator_list", []) + node.args.defaults + \
+                [d for d in node.args.kw_defaults if d is not None]
+        elif isinstance(node, ast.ClassDef):
+            children = node.decorator_list + node.bases + [k.value for k in node.keywords]
+            todo += [(n, node) for n in reversed(node.body)]
+        elif isinstance(node, ast.If):
+            children = [node.test] + (node.body if scope is None and _is_main_guard(node.test) else [])
+        elif isinstance(node, (ast.While, ast.Assert)):
+            children = [node.test]
+        elif isinstance(node, (ast.For, ast.AsyncFor)):
+            children = [node.iter]
+        elif isinstance(node, _TRY):
+            children = []   # Its errors may be handled
+        elif isinstance(node, _MATCH):
+            children = [node.subject]
+        elif isinstance(node, ast.BoolOp):
+            children = node.values[:1]
+        elif isinstance(node, ast.IfExp):
+            children = [node.test]
+        elif isinstance(node, _COMPREHENSIONS):
+            children = [node.generators[0].iter]
+        else:
+            children = list(ast.iter_child_nodes(node))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in functions \
+                and node.func.id not in entered:
+            # The body runs after the arguments are evaluated
+            entered.add(node.func.id)
+            fn = functions[node.func.id]
+            todo += [(n, fn) for n in reversed(fn.body)]
+        todo += [(n, scope) for n in reversed(children)]
+
+def _module_exists(name, workdir, local=()):
+    if name in local or name in sys.modules or name in sys.builtin_module_names:
+        return True
+    if workdir and (os.path.exists(os.path.join(workdir, name + ".py")) or
+                    os.path.isdir(os.path.join(workdir, name))):
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def _missing_modules(tree, workdir, local=()):
+    # Module-level imports only: ones under if/try/def may never run
+    # (platform branches, optional dependencies)
+    seen = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            top = name.split(".")[0]
+            if top not in seen and not _module_exists(top, workdir, local):
+                seen.add(top)
+                yield f"ModuleNotFoundError: No module named '{top}'"
+
+def _undefined_names(tree, source, run):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom):
+            if any(a.name == "*" for a in node.names) or node.module == "__future__":
+                return  # Star imports / lazy annotations: names we can't see
+        elif isinstance(node, ast.Import):
+            if any(a.name == "builtins" for a in node.names):
+                return
+        elif isinstance(node, ast.Name) and node.id in DYNAMIC_NAMES:
+            return
+        elif isinstance(node, ast.Attribute) and node.attr == "modules" and isinstance(node.value, ast.Name) \
+                and node.value.id == "sys":
+            return
+        elif isinstance(node, ast.Call) and any(isinstance(a, ast.Name) and a.id == "__name__" for a in node.args):
+            return  # e.g. enum's _convert_(..., __name__) fills the module namespace
+        elif isinstance(node, ast.Try) and _catches(node, {"NameError"}, bare=False):
+            return
+
+    top = symtable.symtable(source, "<preflight>", "exec")
+    tables = list(_tables(top))
+    bound = [s.get_name() for s in top.get_symbols() if s.is_local()]
+    bound += [s.get_name() for t in tables for s in t.get_symbols() if s.is_declared_global() and s.is_assigned()]
+    known = set(bound) | set(vars(builtins)) | MODULE_NAMES
+    scopes = {(t.get_name(), t.get_lineno()): t for t in tables if t is not top}
+
+    reported = set()
+    for node, scope in run:
+        if not isinstance(node, ast.Name) or not isinstance(node.ctx, ast.Load):
+            continue
+        name = node.id
+        if name in known or name in reported:
+            continue
+        if isinstance(scope, ast.ClassDef) and name in CLASS_NAMES:
+            continue
+        local_names = bound
+        if scope is not None:
+            table = scopes.get((scope.name, scope.lineno))
+            if table is None:
+                continue
+            try:
+                s = table.lookup(name)
+            except KeyError:
+                continue
+            if s.is_local() or s.is_free():
+                continue
+            local_names = [s.get_name() for s in table.get_symbols() if s.is_local()]
+        reported.add(name)
+        msg = f"NameError: name '{name}' is not defined"
+        hint = suggest(name, local_names, bound)
+        yield msg + (f". Did you mean: '{hint}'?" if hint else "")
+
+def _init_typos(tree, run):
+    typos = set()
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            methods = {f.name for f in node.body if isinstance(f, (ast.FunctionDef, ast.AsyncFunctionDef))}
+            if "_init_" in methods and "__init__" not in methods:
+                typos.add(node.name)
+    # Only an instantiation with arguments fails
+    for node, _ in run:
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in typos \
+                and (node.args or node.keywords):
+            typos.discard(node.func.id)
+            yield f"TypeError: {node.func.id}() takes no arguments"
+
+def _blocking_input(run):
+    for node, _ in run:
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "input":
+            yield sandbox.TIMEOUT_ERROR
+            return
+
+def findings(code, workdir=None, local=()):
+    """
+    Error messages a run of `code` would produce, found statically, in the
+    order they are fixed. `workdir` is the script's directory (imports
+    resolve there first); `local` names the modules of the script's project.
+    Empty for code that doesn't compile (the sandbox reports syntax errors
+    better than we could).
+    """
+    try:
+        tree = ast.parse(code)
+        compile(tree, "<preflight>", "exec")
+    except (SyntaxError, ValueError):
+        return []
+    run = list(_always_run(tree))
+    out = list(_init_typos(tree, run))
+    out += _missing_modules(tree, workdir, local)
+    out += _undefined_names(tree, code, run)
+    out += _blocking_input(run)
+    return out
+
+def _compiles(code):
+    try:
+        compile(code, "<preflight>", "exec")
+        return True
+    except (SyntaxError, ValueError):
+        return False
+
+def resolve(code, workdir=None, local=()):
+    """
+    Applies the rule fixes for every static finding.
+    Returns (new_code, [(code_after_fix, reason), ...]).
+    """
+    steps = []
+    for _ in range(MAX_FIXES):
+        fix = None
+        for error in findings(code, workdir, local):
+            for new_code, reason in rules.REGISTRY.candidates(code, error):
+                if str(reason).startswith(RUN_ONLY):
+                    continue
+                if new_code.strip() != code.strip() and _compiles(new_code):
+                    fix = (new_code.strip(), reason)
+                    break
+            if fix:
+                break
+        if fix is None:
+            break
+        code = fix[0]
+        steps.append(fix)
+    return code, steps
@@ -0,0 +1,115 @@
+"""
+Span profiler for repair sessions.
+
+    with profiler.span("sandbox.run", file=name) as args:
+        result = sandbox.run_code(...)
+        args["cpu_ms"] = ...
+
+Spans go into a bounded in-memory ring (one tuple append each, a couple of
+microseconds), so it stays on by default; DEVFORGE_PROFILE=off disables it.
+Export with write_trace() (Chrome trace / Perfetto JSON) or print
+format_summary(summary(...)).
+
+Span names used across the pipeline:
+    preflight, cycle, sandbox.run, patcher.propose, patcher.rules, cache.get,
+    llm.generate, llm.warmup, evaluate, diff, ui.drain
+"""
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("DEVFORGE_PROFILE", "on") != "off"
+MAX_SPANS = 100000
+
+# (name, start_ns, dur_ns, pid, tid, args)
+_spans = collections.deque(maxlen=MAX_SPANS)
+
+def now():
+    return time.perf_counter_ns()
+
+@contextlib.contextmanager
+def span(name, **args):
+    """
+    Times the block. The yielded dict becomes the span's args, so results
+    known only at the end (tokens, rule matched, ...) can be added to it.
+    """
+    if not ENABLED:
+        yield args
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield args
+    finally:
+        _spans.append((name, start, time.perf_counter_ns() - start, os.getpid(), threading.get_ident(), args))
+
+def spans(since=None):
+    """
+    Recorded spans, oldest first; `since` is a now() mark.
+    """
+    out = list(_spans)
+    return out if since is None else [s for s in out if s[1] >= since]
+
+def drain():
+    """
+    Removes and returns everything recorded so far (for shipping spans
+    from worker processes to the parent).
+    """
+    out = []
+    while True:
+        try:
+            out.append(_spans.popleft())
+        except IndexError:
+            return out
+
+def clear():
+    _spans.clear()
+
+def to_chrome_trace(items):
+    """
+    Chrome trace event format (chrome://tracing, ui.perfetto.dev).
+    """
+    events = []
+    for name, start, dur, pid, tid, args in items:
+        events.append({"name": name, "cat": name.split(".")[0], "ph": "X",
+                       "ts": start / 1000, "dur": dur / 1000, "pid": pid, "tid": tid,
+                       "args": args})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def write_trace(path, items=None):
+    with open(path, "w") as f:
+        json.dump(to_chrome_trace(spans() if items is None else items), f, default=str)
+
+def summary(items=None):
+    """
+    {name: {"count", "total_ms", "mean_ms", "p95_ms", "max_ms"}}, by total time.
+    """
+    durs = collections.defaultdict(list)
+    for s in (spans() if items is None else items):
+        durs[s[0]].append(s[2] / 1e6)
+    out = {}
+    for name, ds in sorted(durs.items(), key=lambda kv: -sum(kv[1])):
+        ds.sort()
+        out[name] = {
+            "count": len(ds),
+            "total_ms": round(sum(ds), 3),
+            "mean_ms": round(sum(ds) / len(ds), 3),
+            "p95_ms": round(ds[min(len(ds) - 1, int(len(ds) * 0.95))], 3),
+            "max_ms": round(ds[-1], 3),
+        }
+    return out
+
+def totals(items):
+    """
+    Compact {name: total_ms} for attaching to a result row.
+    """
+    return {name: st["total_ms"] for name, st in summary(items).items()}
+
+def format_summary(stats):
+    lines = [f"{'span':<18}{'count':>7}{'total ms':>11}{'mean':>9}{'p95':>9}{'max':>9}"]
+    for name, st in stats.items():
+        lines.append(f"{name:<18}{st['count']:>7}{st['total_ms']:>11.1f}{st['mean_ms']:>9.2f}"
+                     f"{st['p95_ms']:>9.2f}{st['max_ms']:>9.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,307 @@
+"""
+Multi-file projects.
+
+A Project is a directory of modules plus the entry script that gets run.
+Its sources are held in memory as an immutable snapshot: a fix replaces one
+file and returns a new Project sharing everything else, so search states
+stay cheap and nothing touches the disk until save().
+
+The sandbox runs the entry point with the project on sys.path and serves
+its modules from memory ahead of the files on disk (see
+sandbox_worker.ProjectFinder), so the entry imports the patched versions.
+Only the modules the entry can reach through the import graph, plus any
+file changed in memory, are handed to the sandbox; the worker keeps their
+sources and bytecode by content hash, so a re-run after a one-file fix
+sends and compiles that one file.
+
+Tracebacks are attributed to the deepest frame inside the project, and the
+engine patches only that file.
+"""
+import ast
+import contextlib
+import hashlib
+import os
+import re
+import threading
+
+SKIP_DIRS = frozenset({"__pycache__", ".git", ".hg", ".svn", ".tox", ".venv", "venv", "env",
+                       "node_modules", "build", "dist", ".mypy_cache", ".pytest_cache"})
+MAX_FILES = 1000
+# Tried in this order when no entry point is given
+ENTRY_NAMES = ("__main__.py", "main.py", "app.py", "run.py", "cli.py", "manage.py")
+
+_FRAME_RE = re.compile(r'File "([^"]+)", line \d+')
+_MAIN_GUARD_RE = re.compile(r"""^if\s+__name__\s*==\s*['"]__main__['"]\s*:""", re.M)
+
+def _walk(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+        for name in sorted(filenames):
+            if name.endswith(".py"):
+                yield os.path.relpath(os.path.join(dirpath, name), root).replace(os.sep, "/")
+
+def _read(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+def _sys_path_root(directory):
+    # A directory that is itself a package is imported from its parent
+    while os.path.exists(os.path.join(directory, "__init__.py")):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return directory
+
+def _dotted(path):
+    parts = path[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+def find_entry(files):
+    """
+    The script a directory is most likely run as: a conventional name at the
+    top level, else the only file with a __main__ guard. None if unclear.
+    """
+    for name in ENTRY_NAMES:
+        if name in files:
+            return name
+    guarded = [rel for rel, src in files.items() if _MAIN_GUARD_RE.search(src)]
+    return guarded[0] if len(guarded) == 1 else None
+
+class Project:
+    """
+    Immutable snapshot of a project's sources. `files` maps '/'-separated
+    paths relative to `root` to their text.
+    """
+    def __init__(self, root, files, entry, original=None):
+        self.root = os.path.abspath(root)
+        self.files = files
+        self.entry = entry
+        self.original = original if original is not None else files   # As loaded from disk
+        self.focus = entry          # The file the last fix touched
+        self.base = _sys_path_root(self.root)
+        # Shared by every snapshot of the project: keyed by (file, source)
+        self._hashes = {}
+        self._imports = {}
+        self._names = None
+        self._table = None
+
+    @classmethod
+    def load(cls, path, entry=None):
+        """
+        Reads every module under the directory `path`. `entry` (a path, or
+        relative to `path`) defaults to find_entry(). `path` may also be
+        the entry script itself; its directory is then the project.
+        Raises ValueError when there is no entry point or too many files.
+        """
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            path, entry = os.path.dirname(path), entry or path
+        files = {}
+        for rel in _walk(path):
+            if len(files) >= MAX_FILES:
+                raise ValueError(f"more than {MAX_FILES} modules under {path}")
+            files[rel] = _read(os.path.join(path, rel))
+        if entry is not None:
+            entry = os.path.relpath(os.path.join(path, entry), path).replace(os.sep, "/")
+        else:
+            entry = find_entry(files)
+        if entry not in files:
+            raise ValueError(f"no entry point found in {path}; pass the script to run")
+        return cls(path, files, entry)
+
+    # --- snapshots -----------------------------------------------------
+    def replace(self, rel, source):
+        """
+        A new snapshot with `rel` set to `source`; everything else is shared.
+        """
+        files = dict(self.files)
+        files[rel] = source
+        new = Project(self.root, files, self.entry, self.original)
+        new.focus = rel
+        new.base = self.base
+        new._hashes, new._imports = self._hashes, self._imports
+        new._names = self._names    # Same file set, same module names
+        return new
+
+    def changed(self, since=None):
+        """
+        Files that differ from `since` (default: the sources on disk).
+        """
+        before = self.original if since is None else since.files
+        return [rel for rel, src in self.files.items() if before.get(rel) != src]
+
+    def path(self, rel):
+        return os.path.join(self.root, *rel.split("/"))
+
+    @property
+    def entry_path(self):
+        return self.path(self.entry)
+
+    def source_hash(self, rel):
+        key = (rel, self.files[rel])
+        h = self._hashes.get(key)
+        if h is None:
+            h = self._hashes[key] = hashlib.sha256(key[1].encode("utf-8", "replace")).hexdigest()
+        return h
+
+    def save(self):
+        """
+        Writes the changed files back to disk. Returns their paths.
+        """
+        written = []
+        for rel in self.changed():
+            with open(self.path(rel), "w", encoding="utf-8") as f:
+                f.write(self.files[rel].rstrip("\n") + "\n")
+            written.append(self.path(rel))
+        return written
+
+    # --- modules and the import graph ----------------------------------
+    def module_names(self):
+        """
+        {dotted name: file} for every name a module is importable under:
+        relative to the sys.path root, and, for files next to or below the
+        entry script, relative to its directory (sys.path[0] of the run).
+        """
+        if self._names is None:
+            names = {}
+            entry_dir = os.path.dirname(self.entry_path)
+            for rel in self.files:
+                full = self.path(rel)
+                for top in (entry_dir, self.base):
+                    sub = os.path.relpath(full, top).replace(os.sep, "/")
+                    if not sub.startswith("../"):
+                        names.setdefault(_dotted(sub), rel)
+            names.pop("", None)
+            self._names = names
+        return self._names
+
+    def local_modules(self):
+        """
+        Top-level names the project provides.
+        """
+        return {name.split(".")[0] for name in self.module_names()}
+
+    def find_module(self, name):
+        """
+        Full dotted name of the one project module `name` can only mean
+        (e.g. 'pkg.utils' for 'utils'), or None.
+        """
+        names = self.module_names()
+        if name in names:
+            return name
+        matches = {names[n] for n in names if n.endswith("." + name)}
+        if len(matches) != 1:
+            return None
+        return min((n for n in names if names[n] in matches and n.endswith("." + name)), key=len)
+
+    def _package_of(self, rel):
+        name = _dotted(os.path.relpath(self.path(rel), self.base).replace(os.sep, "/"))
+        return name if rel.endswith("__init__.py") else name.rpartition(".")[0]
+
+    def imports(self, rel):
+        """
+        Project files `rel` imports, at any nesting level.
+        """
+        key = (rel, self.files[rel])
+        deps = self._imports.get(key)
+        if deps is not None:
+            return deps
+        try:
+            tree = ast.parse(self.files[rel])
+        except (SyntaxError, ValueError):
+            tree = None
+        wanted = []
+        for node in ast.walk(tree) if tree else ():
+            if isinstance(node, ast.Import):
+                wanted += [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                module = node.module or ""
+                if node.level:
+                    package = [p for p in self._package_of(rel).split(".") if p]
+                    package = package[:len(package) - node.level + 1]
+                    module = ".".join(package + ([module] if module else []))
+                wanted += [module] + [f"{module}.{a.name}" if module else a.name for a in node.names]
+        names = self.module_names()
+        deps = set()
+        for name in wanted:
+            # Importing a.b.c runs a and a.b too
+            parts = name.split(".")
+            for i in range(1, len(parts) + 1):
+                dep = names.get(".".join(parts[:i]))
+                if dep and dep != rel:
+                    deps.add(dep)
+        self._imports[key] = deps
+        return deps
+
+    def graph(self):
+        """
+        The import graph: {file: sorted files it imports}.
+        """
+        return {rel: sorted(self.imports(rel)) for rel in self.files}
+
+    def reachable(self, start=None):
+        """
+        Files a run of `start` (default: the entry) can import.
+        """
+        todo, seen = [start or self.entry], set()
+        while todo:
+            rel = todo.pop()
+            if rel not in seen:
+                seen.add(rel)
+                todo += self.imports(rel) - seen
+        return seen
+
+    def modules(self):
+        """
+        The module table the sandbox imports from: {name: {"file", "source",
+        "hash", "package"}} for the files the entry reaches and every file
+        changed in memory. The rest is left to the files on disk.
+        """
+        if self._table is None:
+            wanted = self.reachable() | set(self.changed())
+            self._table = {
+                name: {"file": self.path(rel), "source": self.files[rel],
+                       "hash": self.source_hash(rel), "package": rel.endswith("__init__.py")}
+                for name, rel in self.module_names().items() if rel in wanted
+            }
+        return self._table
+
+    def layout(self):
+        """
+        Hash of the module names: fixes that depend on which imports are
+        local are only valid for the same layout.
+        """
+        return hashlib.sha256("\0".join(sorted(self.module_names())).encode()).hexdigest()[:16]
+
+    # --- tracebacks ----------------------------------------------------
+    def attribute(self, error_msg):
+        """
+        The file to patch for `error_msg`: the one holding the deepest
+        traceback frame inside the project (the entry if there is none).
+        """
+        for path in reversed(_FRAME_RE.findall(error_msg or "")):
+            rel = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+            if rel in self.files:
+                return rel
+        return self.entry
+
+_local = threading.local()
+
+@contextlib.contextmanager
+def scope(project):
+    """
+    Rules applied by this thread inside the block see `project` (e.g. to
+    tell local imports from missing packages).
+    """
+    prev = getattr(_local, "project", None)
+    _local.project = project
+    try:
+        yield project
+    finally:
+        _local.project = prev
+
+def current():
+    return getattr(_local, "project", None)
@@ -0,0 +1,172 @@
+"""
+Rule registry for the patcher.
+
+Each rule declares which exception types it handles and, optionally, a regex
+over the exception message. Patterns are compiled once at registration, and
+rules are indexed by exception type, so dispatching an error costs one dict
+lookup instead of walking the whole cascade. Per-rule call/hit counts and
+time spent are recorded for tuning.
+
+Adding a rule:
+
+    @rules.rule("ZeroDivisionError", pattern=r"division by zero")
+    def _fix_div(code_content, error_msg, lines, match):
+        yield new_code, "Rule: Guarded division."
+"""
+import hashlib
+import re
+import threading
+import time
+import types
+
+ANY = "*"
+
+_ARGPARSE_RE = re.compile(r"\S+: error: ")
+_EXC_RE = re.compile(r"([A-Za-z_][\w.]*)(?::|$)")
+
+def _code_digest(code, h):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _code_digest(const, h)   # Nested functions/lambdas (their repr holds an address)
+        else:
+            h.update(repr(const).encode())
+
+def parse_exception(error_msg):
+    """
+    (exception type, message line) from the last line of a traceback.
+    Argparse usage errors are reported as the pseudo type "argparse".
+    """
+    last = ""
+    for line in reversed(error_msg.splitlines()):
+        if line.strip():
+            last = line.strip()
+            break
+    if _ARGPARSE_RE.match(last):
+        return "argparse", last
+    m = _EXC_RE.match(last)
+    if m:
+        return m.group(1).rsplit(".", 1)[-1], last
+    return None, last
+
+class Rule:
+    def __init__(self, name, func, exceptions=(ANY,), pattern=None, order=0):
+        self.name = name
+        self.func = func
+        self.exceptions = tuple(exceptions)
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.order = order
+        self.calls = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def apply(self, code_content, error_msg, lines, message):
+        """
+        Yields (new_code, reason) candidates. Skips the rule body entirely
+        when its pattern does not match the exception message.
+        """
+        match = None
+        if self.pattern is not None:
+            match = self.pattern.search(message)
+            if match is None:
+                return []
+        self.calls += 1
+        start = time.perf_counter()
+        try:
+            out = list(self.func(code_content, error_msg, lines, match) or ())
+        finally:
+            self.seconds += time.perf_counter() - start
+        if out:
+            self.hits += 1
+        return out
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, {self.exceptions})"
+
+class RuleRegistry:
+    def __init__(self):
+        self._rules = []
+        self._index = {}
+        self._lock = threading.Lock()
+        self._fingerprint = None
+
+    def register(self, rule):
+        with self._lock:
+            self._rules = [r for r in self._rules if r.name != rule.name] + [rule]
+            self._rebuild()
+        return rule
+
+    def unregister(self, name):
+        with self._lock:
+            self._rules = [r for r in self._rules if r.name != name]
+            self._rebuild()
+
+    def _rebuild(self):
+        index = {}
+        wildcard = [r for r in self._rules if ANY in r.exceptions]
+        for r in self._rules:
+            for exc in r.exceptions:
+                if exc != ANY:
+                    index.setdefault(exc, [])
+        for exc in index:
+            index[exc] = sorted([r for r in self._rules if exc in r.exceptions] + wildcard, key=lambda r: r.order)
+        index[ANY] = sorted(wildcard, key=lambda r: r.order)
+        self._index = index
+        self._fingerprint = None
+
+    def fingerprint(self):
+        """
+        Hash of the registered rules (names, dispatch, order and bytecode):
+        changes whenever a rule is added, removed or edited, so answers
+        cached from older rules stop matching.
+        """
+        if self._fingerprint is None:
+            h = hashlib.sha256()
+            for r in self.rules():
+                h.update(f"{r.name}\0{r.exceptions}\0{r.pattern and r.pattern.pattern}\0{r.order}\0".encode())
+                _code_digest(r.func.__code__, h)
+            self._fingerprint = h.hexdigest()[:16]
+        return self._fingerprint
+
+    def rules_for(self, exc_type):
+        index = self._index
+        return index.get(exc_type, index.get(ANY, []))
+
+    def candidates(self, code_content, error_msg):
+        """
+        All (new_code, reason) candidates for this error, in rule order.
+        """
+        exc_type, message = parse_exception(error_msg)
+        lines = code_content.splitlines()
+        out = []
+        for r in self.rules_for(exc_type):
+            out += r.apply(code_content, error_msg, lines, message)
+        return out
+
+    def rules(self):
+        return sorted(self._rules, key=lambda r: r.order)
+
+    def stats(self):
+        return {r.name: {"calls": r.calls, "hits": r.hits, "ms": round(r.seconds * 1000, 3)} for r in self.rules()}
+
+    def reset_stats(self):
+        for r in self._rules:
+            r.calls = r.hits = 0
+            r.seconds = 0.0
+
+REGISTRY = RuleRegistry()
+_order = [0]
+
+def rule(*exceptions, pattern=None, name=None, order=None, registry=None):
+    """
+    Decorator registering `func(code_content, error_msg, lines, match)`.
+    Without `order`, rules rank in registration order.
+    """
+    def wrap(func):
+        _order[0] += 10
+        (registry or REGISTRY).register(Rule(name or func.__name__.lstrip("_"), func,
+                                             exceptions or (ANY,), pattern,
+                                             _order[0] if order is None else order))
+        return func
+    return wrap
@@ -1,45 +1,538 @@
 import subprocess
 import sys
+import os
+import json
+import selectors
+import threading
+import atexit
+import re
+import signal
+import time
+import collections
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def run_code(filename):
+import sandbox_worker
+
+TIMEOUT = 2
+TIMEOUT_ERROR = "TimeLimitExceeded: Process timed out. Infinite loop detected."
+ABANDONED_ERROR = "Abandoned: another candidate already succeeded."
+CPU_LIMIT_ERROR = "TimeLimitExceeded: CPU time limit exceeded. Infinite loop detected."
+
+# Warm pool settings
+POOL_SIZE = max(2, min(8, os.cpu_count() or 1))  # One warm worker per core
+MAX_JOBS_PER_WORKER = 500   # Recycle the fork-server now and then anyway
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+class ExecutionProfile:
+    """
+    Resource limits for one kind of sandbox run.
+
+    With `adaptive`, the wall-clock timeout follows the script: it starts at
+    `timeout` and, once successful runs have been observed, becomes
+    `headroom` x the slowest recent one, clamped to [min_timeout,
+    max_timeout]. min_timeout defaults to `timeout`, so a script that is
+    known to be slow gets more time, never less. Crashes and timeouts say
+    nothing about how long a working version needs and are not counted.
+    The observations belong to one script: use one profile per repair
+    session (engine.repair does), not the shared DEFAULT_PROFILE, which
+    keeps the fixed limit.
+    """
+    def __init__(self, timeout=TIMEOUT, min_timeout=None, max_timeout=10.0, headroom=4.0,
+                 cpu_seconds=None, memory_mb=2048, open_files=256, max_output=1024 * 1024, adaptive=True):
+        self.timeout = timeout
+        self.min_timeout = timeout if min_timeout is None else min_timeout
+        self.max_timeout = max_timeout
+        self.headroom = headroom
+        self.cpu_seconds = cpu_seconds      # None = derived from the timeout
+        self.memory_mb = memory_mb          # Address space cap
+        self.open_files = open_files
+        self.max_output = max_output        # Bytes kept per stream
+        self.adaptive = adaptive
+        self._recent = collections.deque(maxlen=20)
+
+    def current_timeout(self):
+        if not self.adaptive or not self._recent:
+            return self.timeout
+        return min(self.max_timeout, max(self.min_timeout, self.headroom * max(self._recent) + 0.25))
+
+    def limits(self, timeout):
+        return {
+            "cpu": self.cpu_seconds or int(timeout) + 1,
+            "as": self.memory_mb * 1024 * 1024 if self.memory_mb else None,
+            "nofile": self.open_files,
+            "max_output": self.max_output,
+        }
+
+    def observe(self, result):
+        # Only runs that worked say anything about the runtime a fix needs
+        if result.get("success") and result.get("wall_time") is not None:
+            self._recent.append(result["wall_time"])
+
+DEFAULT_PROFILE = ExecutionProfile(adaptive=False)
+
+def pool_supported():
+    return hasattr(os, "fork") and os.name == "posix"
+
+def run_code(filename, timeout=None, profile=None, source=None, cwd=None, modules=None, path=None,
+             inflight=None):
     """
     Runs the python script with a strict TIMEOUT.
+    Uses the warm worker pool when the platform has fork(), else a cold interpreter.
+
+    With `source`, the script text is sent to the sandbox directly and
+    `filename` only names it (tracebacks, __file__, sys.path[0]); nothing is
+    written to disk, so concurrent runs can't clobber each other.
+    `cwd` is the script's working directory (default: ours).
+
+    `modules` ({name: {"file", "source", "hash", "package"}}, see
+    project.Project.modules) are imported from memory ahead of the files on
+    disk, with `path` added to sys.path: a multi-file project runs with its
+    patched modules. Warm workers keep them by hash, so unchanged modules
+    are neither resent nor recompiled.
+
+    With `inflight` (an InFlight), the run can be killed from another thread
+    by inflight.abandon().
+
+    Besides {"success", "output", "error"} the result reports wall_time,
+    cpu_time, peak_rss (bytes), timed_out and truncated.
     """
+    profile = profile or DEFAULT_PROFILE
+    timeout = timeout or profile.current_timeout()
+    if pool_supported():
+        result = get_pool().run(filename, timeout=timeout, cwd=cwd, profile=profile, source=source,
+                                modules=modules, path=path, inflight=inflight)
+    else:
+        result = run_code_cold(filename, timeout=timeout, profile=profile, source=source, cwd=cwd,
+                               modules=modules, path=path, inflight=inflight)
+    profile.observe(result)
+    return result
+
+def _make_result(returncode, stdout, stderr, timed_out=False, truncated=False,
+                 wall_time=None, cpu_time=None, peak_rss=None, cpu_limit=None):
+    note = "\n[OUTPUT TRUNCATED]\n" if truncated else ""
+    if timed_out:
+        success, error, stdout = False, TIMEOUT_ERROR, ""
+    elif returncode == -getattr(signal, "SIGXCPU", 0) or (
+            returncode == -getattr(signal, "SIGKILL", 9) and cpu_time and cpu_limit and cpu_time >= cpu_limit):
+        # RLIMIT_CPU: SIGXCPU at the soft limit, SIGKILL at the hard one
+        success, error = False, CPU_LIMIT_ERROR
+    elif returncode != 0:
+        success, error = False, stderr + note
+        if not stderr.strip() and returncode < 0:
+            error = f"Crash: killed by signal {signal.Signals(-returncode).name}"
+    else:
+        success, error = True, ""
+    return {
+        "success": success,
+        "output": stdout + (note if success else ""),
+        "error": error,
+        "timed_out": timed_out,
+        "truncated": truncated,
+        "wall_time": wall_time,
+        "cpu_time": cpu_time,
+        "peak_rss": peak_rss,
+    }
+
+def _abandoned_result():
+    return {"success": False, "output": "", "error": ABANDONED_ERROR, "timed_out": False,
+            "truncated": False, "wall_time": None, "cpu_time": None, "peak_rss": None}
+
+class InFlight:
+    """
+    Runs of one batch that are still going. Each run registers a kill
+    callback while it executes; abandon() fires them all, and runs that
+    start afterwards return at once.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kills = set()
+        self.abandoned = False
+
+    def attach(self, kill):
+        with self._lock:
+            if self.abandoned:
+                return False
+            self._kills.add(kill)
+            return True
+
+    def detach(self, kill):
+        with self._lock:
+            self._kills.discard(kill)
+
+    def abandon(self):
+        with self._lock:
+            self.abandoned = True
+            kills, self._kills = list(self._kills), set()
+        for kill in kills:
+            kill()
+
+def _bounded_reader(stream, sink, limit, flags):
+    """
+    Reads a pipe to EOF, keeping at most `limit` bytes.
+    """
+    size = 0
+    for chunk in iter(lambda: stream.read(65536), b""):
+        if limit and size + len(chunk) > limit:
+            chunk = chunk[:max(limit - size, 0)]
+            flags["truncated"] = True
+        if chunk:
+            sink.append(chunk)
+            size += len(chunk)
+    stream.close()
+
+def _feed(fd, data):
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+def run_code_cold(filename, timeout=TIMEOUT, profile=None, source=None, cwd=None, modules=None, path=None,
+                  inflight=None):
+    """
+    Original path: one fresh interpreter per run.
+    """
+    profile = profile or DEFAULT_PROFILE
+    if inflight is not None and inflight.abandoned:
+        return _abandoned_result()
+    limits = profile.limits(timeout)
+    staged = None
+    if cwd:
+        filename = os.path.abspath(filename)  # Relative to our CWD, not the script's
     try:
-        # We enforce a 2-second timeout. 
-        # If code runs longer, it raises subprocess.TimeoutExpired
-        result = subprocess.run(
-            [sys.executable, filename],
-            capture_output=True,
-            text=True,
-            timeout=2  # <--- THIS IS THE KEY FIX
+        started = time.monotonic()
+        argv, pass_fds, src_w = [sys.executable, filename], (), None
+        mode, payload = "--exec", source
+        if modules:
+            if source is None:
+                with open(filename, "r") as f: source = f.read()
+            mode, payload = "--exec-project", json.dumps({"source": source, "modules": modules, "path": path})
+        if payload is not None:
+            # Source goes in through an inherited pipe (stdin stays the script's)
+            if os.name == "posix":
+                src_r, src_w = os.pipe()
+                argv, pass_fds = [sys.executable, WORKER_SCRIPT, mode, filename, f"fd:{src_r}"], (src_r,)
+            else:
+                fd, staged = tempfile.mkstemp(suffix=".py")
+                _feed(fd, payload.encode("utf-8"))
+                argv = [sys.executable, WORKER_SCRIPT, mode, filename, staged]
+        proc = subprocess.Popen(
+            argv,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            pass_fds=pass_fds,
+            cwd=cwd,
+            preexec_fn=(lambda: sandbox_worker.apply_limits(limits)) if os.name == "posix" else None,
         )
-        
-        # Check if the script crashed (non-zero exit code)
-        if result.returncode != 0:
-            return {
-                "success": False, 
-                "error": result.stderr, 
-                "output": result.stdout
-            }
-        
-        return {
-            "success": True, 
-            "output": result.stdout, 
-            "error": ""
-        }
+        if inflight is not None and not inflight.attach(proc.kill):
+            proc.kill()
+        if src_w is not None:
+            os.close(src_r)
+            threading.Thread(target=_feed, args=(src_w, payload.encode("utf-8")), daemon=True).start()
+        out, err, flags = [], [], {"truncated": False}
+        readers = [threading.Thread(target=_bounded_reader, args=(proc.stdout, out, limits["max_output"], flags), daemon=True),
+                   threading.Thread(target=_bounded_reader, args=(proc.stderr, err, limits["max_output"], flags), daemon=True)]
+        for t in readers: t.start()
 
-    except subprocess.TimeoutExpired:
-        # This catches the Infinite Loop!
-        return {
-            "success": False,
-            "error": "TimeLimitExceeded: Process timed out. Infinite loop detected.",
-            "output": ""
-        }
+        # We enforce the timeout ourselves so we can collect rusage on exit
+        timed_out, rusage = False, None
+        deadline = started + timeout
+        while True:
+            if hasattr(os, "wait4"):
+                pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                    break
+            elif proc.poll() is not None:
+                break
+            if time.monotonic() >= deadline:
+                # This catches the Infinite Loop!
+                timed_out = True
+                proc.kill()
+                if hasattr(os, "wait4"):
+                    _, status, rusage = os.wait4(proc.pid, 0)
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                else:
+                    proc.wait()
+                break
+            time.sleep(0.002)
+        for t in readers: t.join(timeout=1)
+        if inflight is not None:
+            inflight.detach(proc.kill)
+            if inflight.abandoned:
+                return _abandoned_result()
+
+        return _make_result(
+            proc.returncode,
+            b"".join(out).decode("utf-8", "replace"),
+            b"".join(err).decode("utf-8", "replace"),
+            timed_out=timed_out,
+            truncated=flags["truncated"],
+            wall_time=time.monotonic() - started,
+            cpu_time=rusage.ru_utime + rusage.ru_stime if rusage else None,
+            peak_rss=sandbox_worker.rusage_peak_bytes(rusage) if rusage else None,
+            cpu_limit=limits["cpu"],
+        )
 
     except Exception as e:
         return {
-            "success": False, 
-            "error": str(e), 
+            "success": False,
+            "error": str(e),
             "output": ""
         }
+    finally:
+        if staged and os.path.exists(staged): os.remove(staged)
+
+def run_many(filenames, timeout=None, stop_on_success=True, profile=None, sources=None, cwds=None,
+             modules=None, paths=None):
+    """
+    Runs several scripts concurrently (one warm worker each).
+    `sources`, `cwds`, `modules` and `paths`, if given, hold each script's
+    text, working directory, project modules and sys.path (see run_code).
+    Yields (index, result) in completion order; with stop_on_success the
+    remaining runs are abandoned as soon as one succeeds: queued ones are
+    dropped and running ones killed, so the caller doesn't wait for a
+    sibling stuck in an infinite loop to time out.
+    """
+    if not filenames:
+        return
+    sources = sources or [None] * len(filenames)
+    cwds = cwds or [None] * len(filenames)
+    modules = modules or [None] * len(filenames)
+    paths = paths or [None] * len(filenames)
+    workers = POOL_SIZE if pool_supported() else (os.cpu_count() or 1)
+    inflight = InFlight()
+    ex = ThreadPoolExecutor(max_workers=min(workers, len(filenames)))
+    try:
+        futures = {ex.submit(run_code, f, timeout, profile, src, cwd, mods, path, inflight): i
+                   for i, (f, src, cwd, mods, path) in enumerate(zip(filenames, sources, cwds, modules, paths))}
+        for fut in as_completed(futures):
+            result = fut.result()
+            yield futures[fut], result
+            if stop_on_success and result["success"]:
+                return
+    finally:
+        # Also reached when the caller stops iterating early
+        ex.shutdown(wait=False, cancel_futures=True)
+        inflight.abandon()
+
+def progress_score(result, filename):
+    """
+    How far did execution get? Success beats everything; otherwise the line
+    of the deepest traceback frame inside `filename` (higher = further).
+    """
+    if result["success"]:
+        return float("inf")
+    if result["error"].startswith("TimeLimitExceeded"):
+        return -1
+    pattern = r'File "' + re.escape(os.path.abspath(filename)) + r'", line (\d+)|File "' + re.escape(filename) + r'", line (\d+)'
+    lines = [int(a or b) for a, b in re.findall(pattern, result["error"])]
+    return lines[-1] if lines else 0
+
+# ==========================================
+# WARM WORKER POOL (fork-server)
+# ==========================================
+class WorkerError(Exception):
+    pass
+
+class Worker:
+    """
+    One pre-warmed sandbox_worker.py process. Handles one job at a time.
+    """
+    def __init__(self, preload=()):
+        env = dict(os.environ)
+        if preload:
+            env["DEVFORGE_PRELOAD"] = ",".join(preload)
+        self.proc = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+            env=env,
+        )
+        self.jobs = 0
+        self.sent = set()   # Hashes of the project module sources this worker holds
+        self._sel = selectors.DefaultSelector()
+        self._sel.register(self.proc.stdout, selectors.EVENT_READ)
+        self._read_line(timeout=30)  # {"ready": true}
+
+    def _read_line(self, timeout):
+        if not self._sel.select(timeout):
+            raise WorkerError("worker did not answer in time")
+        line = self.proc.stdout.readline()
+        if not line:
+            raise WorkerError("worker exited")
+        return json.loads(line)
+
+    def request(self, job, timeout):
+        self.jobs += 1
+        self.proc.stdin.write(json.dumps(job) + "\n")
+        self.proc.stdin.flush()
+        # The worker enforces the job timeout itself; the extra slack only
+        # covers a wedged or dead worker.
+        return self._read_line(timeout + 5)
+
+    def module_table(self, modules):
+        """
+        The job's "modules": sources only for the ones not sent before.
+        """
+        table = {}
+        for name, m in modules.items():
+            entry = {"file": m["file"], "hash": m["hash"], "package": m["package"]}
+            if m["hash"] not in self.sent:
+                entry["source"] = m["source"]
+                self.sent.add(m["hash"])
+            table[name] = entry
+        return table
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def interrupt(self):
+        """
+        Kills the job in flight; the worker exits with it (see
+        sandbox_worker.serve) and has to be replaced.
+        """
+        try:
+            self.proc.terminate()
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            self._sel.close()
+            self.proc.kill()
+            self.proc.wait(timeout=1)
+        except Exception:
+            pass
+
+class WorkerPool:
+    """
+    Persistent pool of pre-warmed, isolated workers.
+    Every job runs in a fresh fork of a warm worker, so scripts cannot leak
+    state into each other. Workers that die, hang or time out are replaced.
+    Project runs go to the idle worker already holding most of their
+    modules, whose bytecode it has cached.
+    """
+    def __init__(self, size=None, preload=()):
+        self.size = size or POOL_SIZE   # Read at creation: callers may lower POOL_SIZE first
+        self.preload = tuple(preload)
+        self._idle = collections.deque()
+        self._ready = threading.Condition()
+        self._closed = False
+        for _ in range(self.size):
+            self._put(self._spawn())
+
+    def _put(self, w):
+        with self._ready:
+            self._idle.append(w)
+            self._ready.notify()
+
+    def _spawn(self):
+        try:
+            return Worker(self.preload)
+        except Exception:
+            return None  # Spawned lazily on next checkout
+
+    def _checkout(self, hashes=None):
+        with self._ready:
+            while not self._idle:
+                self._ready.wait()
+            w = self._idle[0]
+            if hashes:
+                w = max(self._idle, key=lambda c: len(hashes & c.sent) if c is not None else -1)
+            self._idle.remove(w)
+        if w is None or not w.alive():
+            if w is not None:
+                w.close()
+            w = Worker(self.preload)
+        return w
+
+    def _checkin(self, w, recycle=False):
+        if self._closed:
+            w.close()
+            return
+        if recycle or w.jobs >= MAX_JOBS_PER_WORKER or not w.alive():
+            w.close()
+            w = self._spawn()
+        self._put(w)
+
+    def run(self, filename, timeout=TIMEOUT, cwd=None, profile=None, source=None, modules=None, path=None,
+            inflight=None):
+        """
+        Same contract as run_code_cold.
+        """
+        profile = profile or DEFAULT_PROFILE
+        if inflight is not None and inflight.abandoned:
+            return _abandoned_result()
+        cold = lambda: run_code_cold(filename, timeout=timeout, profile=profile, source=source, cwd=cwd,
+                                     modules=modules, path=path, inflight=inflight)
+        try:
+            w = self._checkout({m["hash"] for m in modules.values()} if modules else None)
+        except Exception:
+            self._put(None)  # Keep the slot; retry the spawn next time
+            return cold()
+
+        limits = profile.limits(timeout)
+        job = {"filename": os.path.abspath(filename), "timeout": timeout, "cwd": cwd or os.getcwd(),
+               "limits": limits}
+        if source is not None:
+            job["source"] = source
+        if modules:
+            job["path"] = path
+            job["modules"] = w.module_table(modules)
+        if inflight is not None and not inflight.attach(w.interrupt):
+            self._checkin(w)
+            return _abandoned_result()
+        try:
+            reply = w.request(job, timeout)
+            if "missing" in reply:
+                # The worker dropped some sources from its cache: send them again
+                w.sent.difference_update(reply["missing"])
+                job["modules"] = w.module_table(modules)
+                reply = w.request(job, timeout)
+        except Exception as e:
+            self._checkin(w, recycle=True)
+            if inflight is not None and inflight.abandoned:
+                return _abandoned_result()
+            if isinstance(e, WorkerError) and "in time" in str(e):
+                return _make_result(None, "", "", timed_out=True)
+            return cold()
+        finally:
+            if inflight is not None:
+                inflight.detach(w.interrupt)
+
+        # A timed-out job means the child was SIGKILLed mid-flight; start clean.
+        self._checkin(w, recycle=reply["timed_out"])
+
+        return _make_result(reply["returncode"], reply["stdout"], reply["stderr"],
+                            timed_out=reply["timed_out"], truncated=reply.get("truncated", False),
+                            wall_time=reply.get("wall_time"), cpu_time=reply.get("cpu_time"),
+                            peak_rss=reply.get("peak_rss"), cpu_limit=limits["cpu"])
+
+    def close(self):
+        self._closed = True
+        with self._ready:
+            idle, self._idle = list(self._idle), collections.deque()
+        for w in idle:
+            if w is not None:
+                w.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+atexit.register(shutdown_pool)
@@ -0,0 +1,446 @@
+"""
+Warm sandbox worker (fork-server).
+
+Started once by sandbox.WorkerPool and kept alive between repair cycles.
+The interpreter startup, site import and preloaded stdlib modules are paid
+for only once; every job is then executed in a fresh fork of this process,
+so user code can never pollute the server itself.
+
+Protocol: one JSON object per line on stdin, one JSON reply per line on stdout.
+SIGTERM abandons the running job: its process group is killed and the
+server exits.
+Jobs carry the script either as a path ("filename") or as text ("source",
+with "filename" only naming it in tracebacks). Compiled code is cached here
+by content hash, so each fork starts from ready bytecode.
+
+Project runs add "modules" ({name: {"file", "hash", "package", "source"}})
+and "path" (extra sys.path entries): the modules are imported from memory
+ahead of the files on disk. Sources are kept here by hash, so the parent
+sends each one once ("source" omitted afterwards); a hash this worker no
+longer has is answered with {"missing": [hashes]} and the job is resent.
+
+    python sandbox_worker.py --exec NAME SRC
+    python sandbox_worker.py --exec-project NAME SRC
+
+runs a single script without the server (the cold path). SRC is "fd:N" for
+an inherited pipe carrying the source (for --exec-project, a JSON bundle of
+"source", "modules" and "path"), or a path to read it from.
+"""
+import collections
+import hashlib
+import importlib.machinery
+import importlib.util
+import io
+import json
+import linecache
+import os
+import selectors
+import signal
+import sys
+import time
+import traceback
+import types
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Modules most user scripts pull in anyway. Importing them here means every
+# forked job gets them for free.
+PRELOAD = ["re", "json", "math", "random", "collections", "itertools",
+           "functools", "datetime", "traceback", "argparse", "typing"]
+
+READ_CHUNK = 65536
+CODE_CACHE_SIZE = 1024
+MODULE_CACHE_SIZE = 4096
+MAX_FD = os.sysconf("SC_OPEN_MAX") if hasattr(os, "sysconf") else 256
+
+_code_cache = collections.OrderedDict()     # sha256(filename, source) -> code object
+_module_sources = collections.OrderedDict() # source hash -> project module source
+_child = None                               # pid (and process group) of the running job
+
+
+def preload(names):
+    for name in names:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+
+def apply_limits(limits):
+    """
+    rlimits for the current process (call in the child, before user code runs).
+    limits: {"cpu": seconds, "as": bytes, "nofile": count}; missing/None = unlimited.
+    """
+    if not limits or resource is None:
+        return
+    for key, which, slack in (("cpu", "RLIMIT_CPU", 1), ("as", "RLIMIT_AS", 0), ("nofile", "RLIMIT_NOFILE", 0)):
+        value = limits.get(key)
+        if value is None or not hasattr(resource, which):
+            continue
+        which = getattr(resource, which)
+        try:
+            _, hard = resource.getrlimit(which)
+            soft = int(value)
+            new_hard = soft + slack
+            if hard != resource.RLIM_INFINITY:
+                soft, new_hard = min(soft, hard), min(new_hard, hard)
+            resource.setrlimit(which, (soft, new_hard))
+        except (ValueError, OSError):
+            pass
+
+def compile_cached(source, filename, digest=None):
+    """
+    Code object for `source`, compiled once per distinct content (`digest`,
+    if the caller already hashed it). Returns None when it does not compile
+    (the child reports the SyntaxError).
+    """
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    key = hashlib.sha256(filename.encode() + b"\0" + (digest.encode() if digest else source)).digest()
+    if key in _code_cache:
+        _code_cache.move_to_end(key)
+        return _code_cache[key]
+    try:
+        code = compile(source, filename, "exec")
+    except (SyntaxError, ValueError):
+        return None
+    _code_cache[key] = code
+    if len(_code_cache) > CODE_CACHE_SIZE:
+        _code_cache.popitem(last=False)
+    return code
+
+# ==========================================
+# PROJECT MODULES
+# ==========================================
+class MemorySourceLoader(importlib.machinery.SourceFileLoader):
+    """
+    Loads a module whose text is in memory: nothing is read from or written
+    to disk (no __pycache__), and code the server compiled is used as is.
+    Compiling and running still go through importlib's own frames, so
+    tracebacks are trimmed exactly like a plain run's.
+    """
+    def __init__(self, fullname, path, source, code=None):
+        super().__init__(fullname, path)
+        self.source = source
+        if code is not None:
+            self.get_code = lambda name: code
+
+    def get_data(self, path):
+        if path == self.path:
+            return self.source.encode("utf-8")
+        raise OSError(f"no cached bytecode for {path}")
+
+    def path_stats(self, path):
+        return {"mtime": 0, "size": len(self.source)}
+
+    def set_data(self, path, data, *, _mode=0o666):
+        pass
+
+class ProjectFinder:
+    """
+    Meta path finder serving project modules from memory, so a module
+    patched in the parent is what the entry script imports. Names it
+    doesn't know fall through to the normal finders.
+    """
+    def __init__(self, modules, codes):
+        self.modules = modules  # name -> (filename, source, is_package)
+        self.codes = codes      # name -> precompiled code object (or missing)
+
+    def find_spec(self, fullname, path=None, target=None):
+        entry = self.modules.get(fullname)
+        if entry is None:
+            return None
+        filename, source, is_package = entry
+        # The file on disk may be older: tracebacks must show this text
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+        return importlib.util.spec_from_file_location(
+            fullname, filename, loader=MemorySourceLoader(fullname, filename, source, self.codes.get(fullname)),
+            submodule_search_locations=[os.path.dirname(filename)] if is_package else None)
+
+def resolve_modules(table):
+    """
+    Fills in the sources a job's module table left out (sent by earlier
+    jobs). Returns ({name: (filename, source, is_package)}, missing hashes).
+    """
+    modules, missing = {}, []
+    for name, m in (table or {}).items():
+        source = m.get("source")
+        if source is None:
+            source = _module_sources.get(m["hash"])
+            if source is None:
+                missing.append(m["hash"])
+                continue
+            _module_sources.move_to_end(m["hash"])
+        elif m.get("hash"):
+            _module_sources[m["hash"]] = source
+            if len(_module_sources) > MODULE_CACHE_SIZE:
+                _module_sources.popitem(last=False)
+        modules[name] = (m["file"], source, bool(m.get("package")))
+    return modules, missing
+
+def install_modules(modules, codes=None):
+    if modules:
+        sys.meta_path.insert(0, ProjectFinder(modules, codes or {}))
+
+def execute(source, filename, code=None, path=()):
+    """
+    Runs `source` as __main__ under the name `filename` in this process,
+    with `path` on sys.path after the script's own directory.
+    Like runpy, the script gets a real module in sys.modules["__main__"],
+    so pickle and `sys.modules['__main__']` lookups see its globals.
+    Returns the exit status.
+    """
+    if isinstance(source, bytes):
+        source = source.decode("utf-8", "replace")
+    # No file on disk: let tracebacks show source lines from memory
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    sys.argv = [filename]
+    sys.path[0] = os.path.dirname(os.path.abspath(filename))
+    sys.path[1:1] = [p for p in path or () if p != sys.path[0]]
+    main = types.ModuleType("__main__")
+    main.__file__ = filename
+    main.__builtins__ = __builtins__
+    sys.modules["__main__"] = main
+    try:
+        exec(code or compile(source, filename, "exec"), main.__dict__)
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        # Drop our own frame so the traceback (incl. "Did you mean" hints)
+        # reads exactly like a plain `python file.py` run.
+        etype, value, tb = sys.exc_info()
+        value = value.with_traceback(tb.tb_next)
+        if sys.excepthook is sys.__excepthook__:
+            print_exception(etype, value, tb.tb_next)
+        else:
+            sys.excepthook(etype, value, tb.tb_next)
+        return 1
+
+def print_exception(etype, value, tb):
+    """
+    Like the builtin excepthook, but source lines come from linecache (the
+    builtin hook reads them from disk, and in-memory scripts have no file).
+    """
+    lines = traceback.format_exception(etype, value, tb)
+    if not hasattr(traceback, "_compute_suggestion_error"):
+        # Before 3.12 only the builtin hook adds "Did you mean" hints
+        real, sys.stderr = sys.stderr, io.StringIO()
+        try:
+            sys.__excepthook__(etype, value, tb)
+            hinted = sys.stderr.getvalue().rstrip("\n").rsplit("\n", 1)[-1]
+        finally:
+            sys.stderr = real
+        if hinted.startswith(lines[-1].rstrip("\n")):
+            lines[-1] = hinted + "\n"
+    sys.stderr.write("".join(lines))
+
+def run_child(job, stdin_r, out_w, err_w, source, code, modules=None, codes=None):
+    """
+    Runs inside the forked child. Never returns.
+    """
+    status = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+        os.setpgid(0, 0)
+        apply_limits(job.get("limits"))
+        os.dup2(stdin_r, 0)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        # The script must not see the server's protocol pipes
+        os.closerange(3, MAX_FD)
+        sys.stdin = open(0, "r", closefd=False)
+
+        if job.get("cwd"):
+            os.chdir(job["cwd"])
+        install_modules(modules, codes)
+        status = execute(source, job["filename"], code, job.get("path"))
+    except BaseException:
+        try:
+            sys.excepthook(*sys.exc_info())
+        except BaseException:
+            pass
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except BaseException:
+            pass
+        os._exit(status & 0xFF)
+
+
+def run_job(job):
+    global _child
+    timeout = job.get("timeout", 2)
+    max_output = (job.get("limits") or {}).get("max_output")
+    source = job.get("source")
+    if source is None:
+        with open(job["filename"], "rb") as f:
+            source = f.read()
+    modules, missing = resolve_modules(job.get("modules"))
+    if missing:
+        return {"missing": missing}
+    # Compiled before the fork, so the cache survives in the server
+    code = compile_cached(source, job["filename"])
+    codes = {}
+    for name, (filename, module_source, _) in modules.items():
+        codes[name] = compile_cached(module_source, filename, job["modules"][name].get("hash"))
+    stdin_r, stdin_w = os.pipe()
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    started = time.monotonic()
+    # An abandon signal must not land between the fork and recording the pid
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+    pid = os.fork()
+    if pid == 0:
+        os.close(stdin_w)
+        os.close(out_r)
+        os.close(err_r)
+        run_child(job, stdin_r, out_w, err_w, source, code, modules, codes)
+    _child = pid
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+
+    # Keep stdin_w open: a script blocking on input() must hang until the
+    # timeout, exactly like the cold path does.
+    os.close(stdin_r)
+    os.close(out_w)
+    os.close(err_w)
+
+    chunks = {out_r: [], err_r: []}
+    sizes = {out_r: 0, err_r: 0}
+    truncated = False
+    sel = selectors.DefaultSelector()
+    sel.register(out_r, selectors.EVENT_READ)
+    sel.register(err_r, selectors.EVENT_READ)
+
+    deadline = started + timeout
+    timed_out = False
+    while sel.get_map():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in sel.select(remaining):
+            data = os.read(key.fd, READ_CHUNK)
+            if not data:
+                sel.unregister(key.fd)
+                continue
+            # Bounded: keep the first max_output bytes, drain and drop the rest
+            room = max_output - sizes[key.fd] if max_output else len(data)
+            if room < len(data):
+                truncated = True
+                data = data[:max(room, 0)]
+            if data:
+                chunks[key.fd].append(data)
+                sizes[key.fd] += len(data)
+
+    status = rusage = None
+    if not timed_out:
+        # Output closed; give the child whatever is left of the budget to exit.
+        while True:
+            done, status, rusage = os.wait4(pid, os.WNOHANG)
+            if done:
+                break
+            if time.monotonic() >= deadline:
+                timed_out = True
+                break
+            time.sleep(0.001)
+
+    if timed_out:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+        _, status, rusage = os.wait4(pid, 0)
+    else:
+        # Reap stray grandchildren still holding the group.
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    _child = None
+    wall = time.monotonic() - started
+
+    sel.close()
+    for fd in (stdin_w, out_r, err_r):
+        os.close(fd)
+
+    return {
+        "returncode": os.waitstatus_to_exitcode(status),
+        "stdout": b"".join(chunks[out_r]).decode("utf-8", "replace"),
+        "stderr": b"".join(chunks[err_r]).decode("utf-8", "replace"),
+        "timed_out": timed_out,
+        "truncated": truncated,
+        "wall_time": wall,
+        "cpu_time": rusage.ru_utime + rusage.ru_stime,
+        "peak_rss": rusage_peak_bytes(rusage),
+    }
+
+def rusage_peak_bytes(rusage):
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+
+
+def _abandon(signum, frame):
+    # The parent no longer wants the running job (sandbox.Worker.interrupt)
+    if _child:
+        try:
+            os.killpg(_child, signal.SIGKILL)
+        except OSError:
+            pass
+    os._exit(1)
+
+def serve():
+    signal.signal(signal.SIGTERM, _abandon)
+    preload(PRELOAD + [m for m in os.environ.get("DEVFORGE_PRELOAD", "").split(",") if m])
+    # The protocol owns the real stdout; keep a private handle to it.
+    proto_out = os.fdopen(os.dup(1), "w")
+    proto_out.write(json.dumps({"ready": True}) + "\n")
+    proto_out.flush()
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            reply = run_job(json.loads(line))
+        except Exception as e:
+            reply = {"returncode": 1, "stdout": "", "stderr": str(e), "timed_out": False}
+        proto_out.write(json.dumps(reply) + "\n")
+        proto_out.flush()
+
+
+def exec_main(name, src, project=False):
+    if src.startswith("fd:"):
+        with os.fdopen(int(src[3:]), "rb") as f:
+            source = f.read()
+    else:
+        with open(src, "rb") as f:
+            source = f.read()
+    path = ()
+    if project:
+        bundle = json.loads(source)
+        source, path = bundle["source"], bundle.get("path")
+        install_modules(resolve_modules(bundle.get("modules"))[0])
+    status = execute(source, name, path=path)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(status & 0xFF)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] in ("--exec", "--exec-project"):
+        exec_main(sys.argv[2], sys.argv[3], project=sys.argv[1] == "--exec-project")
+    serve()
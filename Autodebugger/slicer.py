@@ -0,0 +1,158 @@
+"""
+AST-based context windowing for LLM prompts.
+
+Instead of the whole file, the model gets the top-level block that failed
+(function, class, or run of module-level statements) plus the definitions it
+references as read-only context. The patched block is spliced back in.
+"""
+import ast
+import os
+import re
+
+# Below this size the whole file is cheap enough to send as-is.
+MIN_SLICE_LINES = 40
+# Don't bother slicing if the block is most of the file anyway.
+MAX_SLICE_RATIO = 0.6
+# Characters of referenced definitions sent as context.
+CONTEXT_BUDGET = 4000
+
+_FRAME_RE = re.compile(r'File "([^"]+)", line (\d+)(?:, in (\S+))?')
+
+class Slice:
+    def __init__(self, start, end, text, name, context=""):
+        self.start = start      # 1-based, inclusive
+        self.end = end          # 1-based, inclusive
+        self.text = text
+        self.name = name
+        self.context = context
+
+    def __repr__(self):
+        return f"Slice({self.name!r}, lines {self.start}-{self.end})"
+
+def _same_file(a, b):
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+def failing_line(error_msg, filename):
+    """
+    Line number of the deepest traceback frame in `filename` (the script
+    being fixed). None if there is none: a line number from any other file
+    would point into the wrong code.
+    """
+    if not filename:
+        return None
+    lines = [int(line) for path, line, _ in _FRAME_RE.findall(error_msg) if _same_file(path, filename)]
+    return lines[-1] if lines else None
+
+def _block_range(node):
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    return start, node.end_lineno
+
+def _is_def(node):
+    return isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+
+def _defined_names(node):
+    """
+    Top-level names a statement binds.
+    """
+    if _is_def(node):
+        return {node.name}
+    names = set()
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        for a in node.names:
+            names.add((a.asname or a.name).split(".")[0])
+    elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        for t in targets:
+            for n in ast.walk(t):
+                if isinstance(n, ast.Name):
+                    names.add(n.id)
+    return names
+
+def _used_names(nodes):
+    used = set()
+    for node in nodes:
+        for n in ast.walk(node):
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load):
+                used.add(n.id)
+    return used
+
+def _region(body, lineno):
+    """
+    Top-level block holding `lineno`: a def/class, or the run of consecutive
+    module-level statements between two defs.
+    """
+    for i, node in enumerate(body):
+        start, end = _block_range(node)
+        if not (start <= lineno <= end):
+            continue
+        if _is_def(node):
+            return [node], node.name
+        lo = hi = i
+        while lo > 0 and not _is_def(body[lo - 1]):
+            lo -= 1
+        while hi < len(body) - 1 and not _is_def(body[hi + 1]):
+            hi += 1
+        return body[lo:hi + 1], "<module>"
+    return None, None
+
+def _make_slice(code, tree, region, name):
+    lines = code.splitlines()
+    start, end = _block_range(region[0])[0], _block_range(region[-1])[1]
+    if len(lines) < MIN_SLICE_LINES or (end - start + 1) > len(lines) * MAX_SLICE_RATIO:
+        return None
+
+    # Read-only context: the top-level definitions the region refers to
+    used = _used_names(region)
+    context, budget = [], CONTEXT_BUDGET
+    for node in tree.body:
+        if node in region or not (_defined_names(node) & used):
+            continue
+        s, e = _block_range(node)
+        src = "\n".join(lines[s - 1:e])
+        if len(src) > budget and _is_def(node):
+            src = lines[node.lineno - 1] + "  # ... body omitted"
+        if len(src) > budget:
+            continue
+        budget -= len(src)
+        context.append(src)
+
+    return Slice(start, end, "\n".join(lines[start - 1:end]), name, "\n\n".join(context))
+
+def slice_for_error(code, error_msg, filename=None):
+    """
+    Slice around the failing line of `error_msg` in `filename` (where `code`
+    runs from), or None when the whole file should be sent (small file,
+    unparsable code, no traceback frame in `filename`).
+    """
+    lineno = failing_line(error_msg, filename)
+    if lineno is None:
+        return None
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    region, name = _region(tree.body, lineno)
+    if not region:
+        return None
+    return _make_slice(code, tree, region, name)
+
+def slice_for_names(code, text):
+    """
+    Slice for a free-text instruction that names exactly one top-level def/class.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    words = set(re.findall(r"\w+", text))
+    hits = [n for n in tree.body if _is_def(n) and n.name in words]
+    if len(hits) != 1:
+        return None
+    return _make_slice(code, tree, hits, hits[0].name)
+
+def splice(code, sl, new_text):
+    """
+    Puts the (patched) slice text back in place of lines sl.start..sl.end.
+    """
+    lines = code.splitlines()
+    return "\n".join(lines[:sl.start - 1] + new_text.strip("\n").splitlines() + lines[sl.end:])
@@ -0,0 +1,222 @@
+"""
+Tiny stand-in for the Ollama HTTP API, for exercising the LLM paths offline.
+
+    python stub_ollama.py --port 11434 --reply fixed.py
+
+or in-process:
+
+    with StubOllama(reply=lambda payload: "```python\\nprint(1)\\n```") as stub:
+        patcher.OLLAMA_URL = stub.url
+        ...
+
+Implements POST /api/generate in both streaming (NDJSON) and non-streaming
+mode. Each request is recorded in `stub.requests`, together with how many
+chunks were actually sent before the client hung up.
+
+Model lifecycle is simulated too: `models` lists what is installed (others
+get Ollama's 404 "not found"), the first request for a model pays
+`load_delay` seconds and keeps it loaded for its keep_alive, and an empty
+prompt just loads the model. `delay` and `load_delay` may be dicts keyed
+by model name.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def default_reply(payload):
+    """
+    Echoes the first code block of the prompt back, fenced, plus some chatter
+    after the fence (which a streaming client should never need to read).
+    """
+    match = re.search(r"```(?:python)?\n(.*?)```", payload.get("prompt", ""), re.DOTALL)
+    code = match.group(1).strip() if match else "pass"
+    return f"Here is the fixed code:\n```python\n{code}\n```\nExplanation: " + "blah " * 200
+
+def _per_model(value, model):
+    return value.get(model, 0.0) if isinstance(value, dict) else value
+
+def parse_keep_alive(value, default=300.0):
+    """
+    Ollama's keep_alive ("30m", "10s", "1h", seconds, negative = forever)
+    in seconds.
+    """
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    m = re.fullmatch(r"\s*(-?[\d.]+)\s*(ms|s|m|h)?\s*", str(value))
+    if not m:
+        return default
+    n = float(m.group(1))
+    if n < 0:
+        return float("inf")
+    return n * {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}[m.group(2)]
+
+def _tokens(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client hung up (a streaming one does on purpose); nothing to report
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        record = {"path": self.path, "payload": payload, "chunks_sent": 0, "chunks_total": 0}
+        with stub.lock:
+            stub.requests.append(record)
+
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+
+        model = payload.get("model", "stub")
+        if stub.models is not None and model not in stub.models:
+            self._json(404, {"error": f"model '{model}' not found, try pulling it first"})
+            return
+        load = stub.load(model, payload.get("keep_alive"))
+        if not payload.get("prompt"):
+            # Empty prompt: Ollama just loads the model
+            self._json(200, {"model": model, "response": "", "done": True, "load_duration": int(load * 1e9)})
+            return
+
+        text = stub.reply(payload)
+        delay = _per_model(stub.delay, model)
+
+        # Mimic Ollama's server-side counters (durations in ns)
+        stats = {"prompt_eval_count": len(payload.get("prompt", "")) // 4, "prompt_eval_duration": 1000000,
+                 "eval_count": len(_tokens(text, stub.chunk_size)),
+                 "eval_duration": int(delay * len(_tokens(text, stub.chunk_size)) * 1e9),
+                 "load_duration": int(load * 1e9)}
+
+        if not payload.get("stream", True):
+            self._json(200, dict({"model": model, "response": text, "done": True}, **stats))
+            record["chunks_sent"] = record["chunks_total"] = 1
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        tokens = _tokens(text, stub.chunk_size)
+        record["chunks_total"] = len(tokens)
+        try:
+            for i, tok in enumerate(tokens):
+                done = i == len(tokens) - 1
+                msg = {"model": model, "response": tok, "done": done}
+                if done:
+                    msg.update(stats)
+                self._chunk(json.dumps(msg) + "\n")
+                record["chunks_sent"] += 1
+                if delay:
+                    time.sleep(delay)
+            self._chunk("")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client stopped reading early; that's the point of streaming
+
+    def _json(self, status, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data):
+        raw = data.encode()
+        self.wfile.write(f"{len(raw):X}\r\n".encode() + raw + b"\r\n")
+        self.wfile.flush()
+
+class StubOllama:
+    def __init__(self, reply=default_reply, host="127.0.0.1", port=0, chunk_size=8, delay=0.0,
+                 models=None, load_delay=0.0):
+        self.reply = reply if callable(reply) else (lambda payload, _r=reply: _r)
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.models = set(models) if models is not None else None
+        self.load_delay = load_delay
+        self.loaded = {}            # model -> unload time (monotonic)
+        self.loads = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    def load(self, model, keep_alive=None):
+        """
+        Loads `model` if it isn't resident (sleeping load_delay) and
+        refreshes its keep_alive. Returns the seconds spent loading.
+        """
+        with self.lock:
+            now = time.monotonic()
+            cold = self.loaded.get(model, 0.0) <= now
+            if cold:
+                self.loads += 1
+            keep = parse_keep_alive(keep_alive)
+            self.loaded[model] = now + keep
+            if not keep:
+                del self.loaded[model]
+        load = _per_model(self.load_delay, model) if cold else 0.0
+        if load:
+            time.sleep(load)
+        return load
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/generate"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--reply", help="file whose contents are returned as a fenced code block")
+    parser.add_argument("--delay", type=float, default=0.01, help="seconds between streamed chunks")
+    parser.add_argument("--models", help="installed models, comma-separated (default: any)")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="seconds to load a model that isn't resident")
+    args = parser.parse_args(argv)
+
+    reply = default_reply
+    if args.reply:
+        with open(args.reply) as f:
+            reply = f"```python\n{f.read().strip()}\n```\n"
+    stub = StubOllama(reply, host=args.host, port=args.port, delay=args.delay, load_delay=args.load_delay,
+                      models=args.models.split(",") if args.models else None)
+    print(f"Stub Ollama listening on {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import difflib
+import random
+import re
+import unittest
+
+import diffing
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@$")
+
+def _patch(a, diff):
+    """
+    Applies unified diff lines (as produced by unified_diff) to line list `a`.
+    """
+    out, pos = [], 0
+    for line in diff[2:]:
+        m = _HUNK_RE.match(line)
+        if m:
+            start = int(m.group(1)) - (0 if m.group(2) == "0" else 1)
+            out += a[pos:start]
+            pos = start
+        elif line.startswith(" "):
+            assert a[pos] == line[1:]
+            out.append(line[1:])
+            pos += 1
+        elif line.startswith("-"):
+            assert a[pos] == line[1:]
+            pos += 1
+        elif line.startswith("+"):
+            out.append(line[1:])
+    return out + a[pos:]
+
+def _mutate(rng, lines, n):
+    lines = list(lines)
+    for _ in range(n):
+        op = rng.choice("ird")
+        i = rng.randrange(len(lines) + 1)
+        if op == "i" or not lines:
+            lines.insert(i, f"new {rng.randrange(5)}")
+        elif op == "r":
+            lines[min(i, len(lines) - 1)] = f"changed {rng.randrange(5)}"
+        else:
+            del lines[min(i, len(lines) - 1)]
+    return lines
+
+class DiffRoundTrip(unittest.TestCase):
+    def test_apply_edits_restores_target(self):
+        rng = random.Random(1)
+        for _ in range(300):
+            a = [f"line {rng.randrange(8)}" for _ in range(rng.randrange(30))]
+            b = _mutate(rng, a, rng.randrange(1, 8))
+            self.assertEqual(diffing.apply_edits(a, diffing.diff_lines(a, b)), b)
+
+    def test_unified_diff_patches_back(self):
+        rng = random.Random(2)
+        for _ in range(300):
+            a = [f"line {rng.randrange(8)}" for _ in range(rng.randrange(40))]
+            b = _mutate(rng, a, rng.randrange(1, 8))
+            diff = diffing.unified_diff("\n".join(a), "\n".join(b))
+            self.assertEqual(_patch(a, diff), b)
+
+    def test_matches_difflib_for_a_single_change(self):
+        a = [f"x{i} = {i}" for i in range(20)]
+        b = list(a)
+        b[9] = "x9 = None"
+        self.assertEqual(diffing.unified_diff("\n".join(a), "\n".join(b), fromfile="a/s.py", tofile="b/s.py"),
+                         list(difflib.unified_diff(a, b, "a/s.py", "b/s.py", lineterm="")))
+
+    def test_rewrite_past_the_edit_limit_is_one_block(self):
+        a = [f"a{i}" for i in range(diffing.MAX_EDIT_DISTANCE)]
+        b = [f"b{i}" for i in range(diffing.MAX_EDIT_DISTANCE)]
+        edits = diffing.diff_lines(a, b)
+        self.assertEqual(len(edits), 1)
+        self.assertEqual(diffing.apply_edits(a, edits), b)
+
+    def test_identical_texts(self):
+        self.assertEqual(diffing.unified_diff("x = 1\n", "x = 1\n"), [])
+
+if __name__ == "__main__":
+    unittest.main()
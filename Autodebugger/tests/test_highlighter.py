@@ -0,0 +1,53 @@
+import random
+import unittest
+
+import highlighter
+
+SNIPPETS = [
+    "x = 1",
+    "def f(a, b):",
+    "    return a + b  # sum",
+    's = """start of a doc',
+    'end of doc"""',
+    "'''",
+    "print('hi')",
+    "",
+    "class A:",
+    "    pass",
+]
+
+class RelexMatchesFullLex(unittest.TestCase):
+    def test_random_edits(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            lines = [rng.choice(SNIPPETS) for _ in range(rng.randrange(1, 25))]
+            h = highlighter.Highlighter()
+            h.reset("\n".join(lines))
+            for _ in range(rng.randrange(1, 4)):
+                start = rng.randrange(len(lines))
+                old = rng.randrange(0, len(lines) - start + 1)
+                new = [rng.choice(SNIPPETS) for _ in range(rng.randrange(0, 4))]
+                if old == len(lines) and not new:
+                    new = [""]  # A text widget always keeps one line
+                lines[start:start + old] = new
+                h.splice(start, old, len(new))
+            h.relex(lambda lo, hi: lines[lo:hi + 1])
+
+            fresh = highlighter.Highlighter()
+            fresh.reset("\n".join(lines))
+            self.assertEqual(h.lines, lines)
+            self.assertEqual(h.spans, fresh.spans)
+            self.assertEqual(h.state_in, fresh.state_in)
+
+    def test_opening_a_docstring_relexes_below(self):
+        lines = ["x = 1", "y = 2", "z = 3"]
+        h = highlighter.Highlighter()
+        h.reset("\n".join(lines))
+        lines[0] = 'x = """'
+        h.splice(0, 1, 1)
+        changed = dict(h.relex(lambda lo, hi: lines[lo:hi + 1]))
+        self.assertEqual(sorted(changed), [0, 1, 2])
+        self.assertEqual(changed[2], [("string", 0, len(lines[2]))])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+import os
+import tempfile
+import unittest
+
+import preflight
+
+class MissingModules(unittest.TestCase):
+    def test_module_next_to_the_script_exists(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, "mymod.py"), "w") as f:
+                f.write("def hello():\n    return 'hi'\n")
+            self.assertEqual(preflight.findings("import mymod\nprint(mymod.hello())\n", d), [])
+
+    def test_imports_are_never_deleted_statically(self):
+        code = "import json\nimport fancy_colors_lib\nprint(json.dumps(1))"
+        self.assertIn("ModuleNotFoundError: No module named 'fancy_colors_lib'", preflight.findings(code))
+        self.assertEqual(preflight.resolve(code), (code, []))
+
+class UndefinedNames(unittest.TestCase):
+    def test_class_body_names(self):
+        code = "class A:\n    tag = __module__ + '.' + __qualname__\nprint(__qualname__)\n"
+        self.assertEqual(preflight.findings(code), ["NameError: name '__qualname__' is not defined"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+import slicer
+
+CODE = "\n".join(["import helper", ""] + [f"def f{i}():\n    return {i}\n" for i in range(30)] + ["f3()"])
+
+def _traceback(*frames):
+    body = "".join(f'  File "{path}", line {line}, in f\n    x\n' for path, line in frames)
+    return f"Traceback (most recent call last):\n{body}ValueError: boom"
+
+class FailingLine(unittest.TestCase):
+    def test_only_frames_in_the_fixed_script_count(self):
+        err = _traceback(("/work/main.py", 92), ("/work/helper.py", 9))
+        self.assertEqual(slicer.failing_line(err, "/work/main.py"), 92)
+
+    def test_no_frame_in_the_script_sends_the_whole_file(self):
+        err = _traceback(("/work/helper.py", 12))
+        self.assertIsNone(slicer.failing_line(err, "/work/main.py"))
+        self.assertIsNone(slicer.slice_for_error(CODE, err, "/work/main.py"))
+
+    def test_slices_around_the_script_frame(self):
+        err = _traceback(("/work/main.py", 12), ("/work/helper.py", 3))
+        sl = slicer.slice_for_error(CODE, err, "/work/main.py")
+        self.assertEqual(sl.name, "f3")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import time
+import unittest
+
+import llm
+import patcher
+import stub_ollama
+
+FIXED = "def f():\n    return 1"
+
+def _reply(payload):
+    return f"Sure:\n```python\n{FIXED}\n```\nExplanation: " + "blah " * 200
+
+class StreamStopsAtFence(unittest.TestCase):
+    def test_client_hangs_up_after_the_closing_fence(self):
+        with stub_ollama.StubOllama(reply=_reply, delay=0.002) as stub:
+            client = llm.LLMClient()
+            try:
+                payload = {"model": "stub", "prompt": "fix it", "stream": True}
+                out = client.generate(payload, default_url=stub.url, on_text=patcher._fence_watcher())
+            finally:
+                client.close()
+            # Let the server notice the hang-up before reading its counters
+            deadline = time.monotonic() + 2
+            record = stub.requests[-1]
+            while time.monotonic() < deadline:
+                sent = record["chunks_sent"]
+                time.sleep(0.05)
+                if record["chunks_sent"] == sent:
+                    break
+        self.assertEqual(patcher._extract_code(out), FIXED)
+        self.assertGreater(record["chunks_total"], 100)
+        self.assertLess(record["chunks_sent"], record["chunks_total"] // 2)
+
+    def test_partial_code_is_reported_while_streaming(self):
+        seen = []
+        with stub_ollama.StubOllama(reply=_reply) as stub:
+            client = llm.LLMClient()
+            try:
+                client.generate({"model": "stub", "prompt": "fix it", "stream": True}, default_url=stub.url,
+                                on_text=patcher._fence_watcher(seen.append))
+            finally:
+                client.close()
+        self.assertTrue(seen)
+        # Everything reported lies inside the fence (a closing fence may be half-streamed)
+        self.assertTrue(all((FIXED + "\n").startswith(s.rstrip("`")) for s in seen))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+import workspace
+
+class Overlay(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.base = os.path.join(self.tmp.name, "base")
+        outside = os.path.join(self.tmp.name, "outside")
+        os.makedirs(outside)
+        os.makedirs(self.base)
+        with open(os.path.join(outside, "existing.txt"), "w") as f:
+            f.write("keep")
+        os.symlink(outside, os.path.join(self.base, "data"))
+        with open(os.path.join(self.base, "big.bin"), "wb") as f:
+            f.write(b"x" * 200000)
+        self.ws = workspace.Workspace(root=self.tmp.name, base=self.base)
+        self.addCleanup(self.ws.close)
+
+    def test_writes_stay_in_the_run_directory(self):
+        with self.ws.run_dir() as run:
+            with open(os.path.join(run, "data", "existing.txt")) as f:
+                self.assertEqual(f.read(), "keep")
+            with open(os.path.join(run, "data", "out.txt"), "w") as f:
+                f.write("new")
+            open(os.path.join(run, "big.bin"), "w").close()
+            os.remove(os.path.join(run, "data", "existing.txt"))
+        self.assertEqual(os.path.getsize(os.path.join(self.base, "big.bin")), 200000)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.base, "data"))), ["existing.txt"])
+
+    def test_runs_do_not_share_files(self):
+        with self.ws.run_dir() as a, self.ws.run_dir() as b:
+            with open(os.path.join(a, "big.bin"), "w") as f:
+                f.write("a")
+            self.assertEqual(os.path.getsize(os.path.join(b, "big.bin")), 200000)
+
+    def test_fixtures_go_into_a_real_directory(self):
+        with self.ws.run_dir(f"{workspace.FIXTURE_MARK}data/settings.txt") as run:
+            self.assertTrue(os.path.exists(os.path.join(run, "data", "settings.txt")))
+        self.assertFalse(os.path.exists(os.path.join(self.base, "data", "settings.txt")))
+
+    def test_copy_is_bounded(self):
+        old = workspace.OVERLAY_MAX_BYTES
+        workspace.OVERLAY_MAX_BYTES = 1000
+        try:
+            ws = workspace.Workspace(root=self.tmp.name, base=self.base)
+            with ws.run_dir() as run:
+                self.assertTrue(os.path.exists(os.path.join(run, "data", "existing.txt")))
+                self.assertFalse(os.path.exists(os.path.join(run, "big.bin")))
+            ws.close()
+        finally:
+            workspace.OVERLAY_MAX_BYTES = old
+
+if __name__ == "__main__":
+    unittest.main()
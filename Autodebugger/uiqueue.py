@@ -0,0 +1,82 @@
+"""
+Thread-safe UI event queue.
+
+Worker threads never touch widgets. They post structured events here and the
+Tk main loop drains the queue on a timer. Within one drain, consecutive log
+writes are merged into a single insert, and "latest value wins" updates
+(editor contents, progress, status, buttons) collapse to their last value,
+so a 5000-line diff costs a handful of Tk calls instead of 10000.
+"""
+import queue
+import time
+
+DRAIN_MS = 30
+MAX_BATCH = 5000        # Events handled per tick
+TIME_BUDGET = 0.012     # Seconds spent draining per tick, so input stays responsive
+
+# Event kinds where only the most recent one matters
+LATEST_WINS = frozenset({"code", "progress", "status", "button"})
+
+class UIEventQueue:
+    def __init__(self):
+        self._q = queue.SimpleQueue()
+        self.posted = 0
+
+    def post(self, kind, **data):
+        self.posted += 1
+        self._q.put((kind, data))
+
+    def drain(self, max_events=MAX_BATCH, budget=TIME_BUDGET):
+        """
+        Pops pending events and returns them as coalesced ops, in order:
+            ("log", [(text, tag), ...])   one insert for a run of log writes
+            (kind, data)                  anything else
+        """
+        ops = []
+        latest = {}   # key -> position in ops
+        deadline = time.perf_counter() + budget
+        for n in range(max_events):
+            if n and n % 64 == 0 and time.perf_counter() > deadline:
+                break
+            try:
+                kind, data = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                if ops and ops[-1] is not None and ops[-1][0] == "log":
+                    ops[-1][1].append((data["text"], data.get("tag", "info")))
+                else:
+                    ops.append(("log", [(data["text"], data.get("tag", "info"))]))
+                continue
+            if kind in LATEST_WINS:
+                key = (kind, data.get("name"))
+                if key in latest:
+                    ops[latest[key]] = None
+                latest[key] = len(ops)
+            ops.append((kind, data))
+        # Log runs that were only split by a superseded update can now merge
+        out = []
+        for op in ops:
+            if op is None:
+                continue
+            if op[0] == "log" and out and out[-1][0] == "log":
+                out[-1][1].extend(op[1])
+            else:
+                out.append(op)
+        return out
+
+    def empty(self):
+        return self._q.empty()
+
+def merge_runs(pairs):
+    """
+    [(text, tag), ...] -> Text.insert() arguments with adjacent same-tag
+    chunks joined: [text1, tag1, text2, tag2, ...]
+    """
+    args = []
+    for text, tag in pairs:
+        if args and args[-1] == tag:
+            args[-2] += text
+        else:
+            args += [text, tag]
+    return args
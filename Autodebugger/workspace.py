@@ -0,0 +1,193 @@
+"""
+Disposable working directories for sandbox runs.
+
+Every run gets a fresh CWD holding a copy of the real working directory:
+real directories and copied files, never links, so scripts read their real
+relative files while whatever they create, overwrite or delete there stays
+in the copy, and parallel runs never see each other's. The copy is bounded
+(OVERLAY_MAX_FILES, OVERLAY_MAX_BYTES; smallest files first) and skips
+version-control and cache directories (OVERLAY_SKIP): what doesn't fit is
+simply absent. Absolute paths still reach the host. Mock
+fixtures are not written to disk by the rules: a fix marks them in the code
+
+    # [ENV] Created mock file: data/input.csv
+
+and the workspace stages them into the run directory, on top of the
+overlay (a real file of the same name wins). The environment is then a
+pure function of the code, so search branches can't leak fixtures into
+each other. Fixtures are written once to a template directory and
+copied per run; everything lives under SCRATCH_ROOT, which is tmpfs
+(/dev/shm) when available, so a run directory costs a mkdir and an rmtree.
+
+DEVFORGE_ISOLATE=off runs scripts in the host CWD again (fixtures included).
+"""
+import contextlib
+import itertools
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+ISOLATE = os.environ.get("DEVFORGE_ISOLATE", "on") != "off"
+
+def _default_root():
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+SCRATCH_ROOT = os.environ.get("DEVFORGE_SCRATCH") or _default_root()
+
+# Overlay: how much of the working directory is copied into each run
+OVERLAY_MAX_FILES = 2000
+OVERLAY_MAX_BYTES = 64 * 1024 * 1024
+OVERLAY_SKIP = frozenset({".git", ".hg", ".svn", "__pycache__", ".venv", "venv", ".tox", "node_modules"})
+
+FIXTURE_MARK = "# [ENV] Created mock file: "
+MOCK_CONTENT = "Mock Data"
+_FIXTURE_RE = re.compile(r"^" + re.escape(FIXTURE_MARK) + r"(.+?)\s*$", re.M)
+
+def fixture_path(path):
+    """
+    `path` as a relative path that stays inside a run directory, or None
+    (absolute paths, or ones that climb out with '..').
+    """
+    if not path or os.path.isabs(path):
+        return None
+    path = os.path.normpath(path)
+    if path == "." or path == ".." or path.startswith(".." + os.sep):
+        return None
+    return path
+
+def fixtures_in(code):
+    """
+    Fixture paths marked in the code.
+    """
+    return [p for p in map(fixture_path, _FIXTURE_RE.findall(code)) if p]
+
+class Workspace:
+    """
+    Scratch space for one repair session. Use as a context manager, or
+    call close(). `base` is the directory the runs overlay (default: the
+    current working directory, where the script would run without us).
+    """
+    def __init__(self, root=None, isolate=None, base=None):
+        self.isolate = ISOLATE if isolate is None else isolate
+        self.base = os.path.abspath(base or os.getcwd())
+        self._entries = None
+        self.path = tempfile.mkdtemp(prefix="devforge_ws_", dir=root or SCRATCH_ROOT)
+        self.template = os.path.join(self.path, "template")
+        os.mkdir(self.template)
+        self._staged = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def stage(self, path, content=MOCK_CONTENT):
+        """
+        Adds a fixture to the template (once). Returns its template path.
+        """
+        rel = fixture_path(path)
+        if rel is None:
+            raise ValueError(f"fixture path must stay inside the run directory: {path!r}")
+        dst = os.path.join(self.template, rel)
+        with self._lock:
+            if rel not in self._staged:
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                with open(dst, "w") as f:
+                    f.write(content)
+                self._staged.add(rel)
+        return dst
+
+    def _listing(self):
+        """
+        ([directory], [(file, source path)]) to recreate in each run, as
+        paths relative to `base`. Taken once per session; symlinks are
+        followed (their targets get copied), each real directory once.
+        """
+        if self._entries is not None:
+            return self._entries
+        dirs, files, seen = [], [], set()
+        scratch = os.path.realpath(self.path)
+        for top, subdirs, names in os.walk(self.base, followlinks=True):
+            real = os.path.realpath(top)
+            if real in seen or real == scratch or real.startswith(scratch + os.sep):
+                subdirs[:] = []  # A link cycle, or our own scratch space
+                continue
+            seen.add(real)
+            subdirs[:] = sorted(d for d in subdirs if d not in OVERLAY_SKIP)
+            rel = os.path.relpath(top, self.base)
+            if rel != ".":
+                dirs.append(rel)
+            for name in names:
+                src = os.path.join(top, name)
+                try:
+                    files.append((os.stat(src).st_size, os.path.normpath(os.path.join(rel, name)), src))
+                except OSError:
+                    pass  # Broken link
+            if len(files) > OVERLAY_MAX_FILES * 4:
+                break  # Far too big to copy anyway; don't walk all of it
+        kept, budget = [], OVERLAY_MAX_BYTES
+        for size, rel, src in sorted(files)[:OVERLAY_MAX_FILES]:
+            if size > budget:
+                break
+            budget -= size
+            kept.append((rel, src))
+        self._entries = (dirs, kept)
+        return self._entries
+
+    def _overlay(self, run):
+        """
+        Copies `base` into `run`.
+        """
+        dirs, files = self._listing()
+        for rel in dirs:
+            os.makedirs(os.path.join(run, rel), exist_ok=True)
+        for rel, src in files:
+            try:
+                shutil.copyfile(src, os.path.join(run, rel))
+            except OSError:
+                pass  # Gone or unreadable: the script sees what it would see
+
+    @contextlib.contextmanager
+    def run_dir(self, code=""):
+        """
+        Yields the CWD for one run of `code`: a fresh overlay of `base`
+        plus the fixtures the code marks, removed afterwards. Without
+        isolation it is None (the host CWD) and missing fixtures are
+        created there instead.
+        """
+        fixtures = fixtures_in(code)
+        if not self.isolate:
+            for rel in fixtures:
+                if not os.path.exists(rel):
+                    if os.path.dirname(rel):
+                        os.makedirs(os.path.dirname(rel), exist_ok=True)
+                    with open(rel, "w") as f:
+                        f.write(MOCK_CONTENT)
+            yield None
+            return
+
+        run = os.path.join(self.path, f"run{next(self._ids)}")
+        os.mkdir(run)
+        try:
+            self._overlay(run)
+            for rel in fixtures:
+                dst = os.path.join(run, rel)
+                if os.path.exists(dst):
+                    continue  # The real file is there after all
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                # Fixtures are a few bytes: copying is as cheap as a hardlink
+                # and keeps a run's writes to them private
+                shutil.copyfile(self.stage(rel), dst)
+            yield run
+        finally:
+            shutil.rmtree(run, ignore_errors=True)